@@ -0,0 +1,96 @@
+'''
+Microbenchmark of the normalisation and tokenisation of preprocess_texts.py (without lemmatisation): the previous
+clean(), which made several passes over every text and filtered against a list of stopwords, against the current
+one, with compiled patterns, a single translation table and a frozenset of stopwords. Both are run on the same
+interventions and the documents per second are reported.
+
+The tokens are checked to be the same, except for the words of spanish.txt: they were read with their line breaks,
+so the previous clean() never removed them.
+
+Usage: $python -m benchmarks.bench_clean [input file] [number of documents]
+
+- input file: .csv or .parquet file with a column «text», as used by preprocess_texts.py.
+- number of documents: how many documents to take.
+'''
+
+import re
+import string
+import sys
+from timeit import default_timer as timer
+
+from src.data.dataset import read_dataset
+from src.features import preprocess_texts
+from src.features.preprocess_texts import clean, tok
+
+with open('spanish.txt') as f:
+    old_words = f.readlines()
+
+old_stopwords = [w for w in preprocess_texts.stopwords if w not in {w.strip() for w in old_words}] + old_words
+
+
+def old_clean(text):
+    # clean() before the compiled normaliser.
+    text = text.lower()
+
+    regex = r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\-\n)"
+    text = re.sub(regex, r'\1', text)
+
+    regex = r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\- )"
+    text = re.sub(regex, r'\1', text)
+
+    text = text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+    text = text.translate(str.maketrans(
+        string.punctuation, ' '*len(string.punctuation)))
+
+    text = text.replace('  ', ' ')
+
+    chars = ['-', '–', '-', '—', '«', '»', '―']
+    for c in chars:
+        text = text.replace(c, '')
+
+    tokens = tok.tokenize(text)
+
+    for i in range(len(tokens)):
+        if '\xad' in tokens[i]:
+            tokens[i] = tokens[i].replace('\xad', '')
+            if len(tokens) > i + 1:
+                tokens[i] = tokens[i] + tokens[i+1]
+                tokens[i+1] = ''
+
+    tokens = [t for t in tokens if t != '']
+
+    return [w for w in tokens if w not in old_stopwords and len(
+        w) > 2 and w != ' ' and not w.isdigit()]
+
+
+def main():
+    assert len(sys.argv) == 3, 'Usage: python -m benchmarks.bench_clean [input file] [number of documents]'
+
+    input_file = sys.argv[1]
+    n = int(sys.argv[2])
+
+    texts = read_dataset(input_file, columns=['text'])['text'].dropna().head(n).tolist()
+    words = {w.strip() for w in old_words}
+
+    start = timer()
+    old = [old_clean(text) for text in texts]
+    old_time = timer() - start
+
+    start = timer()
+    new = [clean(text) for text in texts]
+    new_time = timer() - start
+
+    mismatches = sum([w for w in a if w not in words] != b for a, b in zip(old, new))
+    removed = sum(len(a) for a in old) - sum(len(b) for b in new)
+
+    print(f'{len(texts)} documents.')
+    print(f'Previous clean(): {len(texts) / old_time:.1f} docs/s.')
+    print(f'Current clean():  {len(texts) / new_time:.1f} docs/s.')
+    print(f'Speed-up:         {old_time / new_time:.1f}x.')
+    print(f'Tokens of spanish.txt now removed: {removed}.')
+    print(f'Documents with different tokens (besides those): {mismatches}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''
+Benchmark of the training of Doc2Vec in train-doc2vec.py: the iterable path, where gensim is fed the TaggedDocuments of
+the memory-mapped corpus from Python, against the corpus_file path (src/models/doc2vec.py), where every worker thread
+reads its part of the corpus as a text file with no Python iteration. Both are trained with the parameters of
+doc2vec.DEFAULTS on the same training documents with every number of workers, and the words per second of the
+training (without building the vocabulary) are reported, so the scaling with the number of cores can be compared.
+
+The two paths do not train the same model: the iterable one learns one vector per label, and the corpus_file one a
+vector per document, averaged by label. So the placement accuracy of both (see doc2vec.placement_accuracy) on the same
+held-out documents is reported too: the speed-up is only worth having if the accuracy holds.
+
+Usage: $python -m benchmarks.bench_doc2vec [corpus dir] [workers] [epochs (optional)] [test size (optional)]
+
+- corpus dir: directory with a memory-mapped corpus (see src/data/corpus.py).
+- workers: comma-separated numbers of worker threads, e.g. 1,2,4,8.
+- epochs: number of epochs of every training (default 1).
+- test size: share of the documents held out to measure the accuracy (default 0.1).
+'''
+
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+import gensim
+
+from src.data.corpus import Corpus, gather, save_corpus
+from src.models.doc2vec import DEFAULTS, label_vectors, placement_accuracy, split
+
+
+def training(corpus: Corpus, workers: int, epochs: int, corpus_file: bool):
+    '''Returns the model trained on the corpus and its words per second.'''
+    params = {**DEFAULTS, 'epochs': epochs}
+    model = gensim.models.doc2vec.Doc2Vec(workers=workers, **params)
+
+    if corpus_file:
+        path = corpus.lines()
+        model.build_vocab(corpus_file=path)
+        start = timer()
+        model.train(corpus_file=path, total_examples=model.corpus_count, total_words=model.corpus_total_words,
+                    epochs=epochs)
+        seconds = timer() - start
+        labels = corpus.labels
+        model.dv = label_vectors(model.dv.vectors, [labels[i] for i in corpus.nonempty().tolist()])
+    else:
+        tagged = corpus.tagged()
+        model.build_vocab(corpus_iterable=tagged)
+        start = timer()
+        model.train(corpus_iterable=tagged, total_examples=model.corpus_count, epochs=epochs)
+        seconds = timer() - start
+
+    return model, model.corpus_total_words * epochs / seconds
+
+
+def main():
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m benchmarks.bench_doc2vec [corpus dir] [workers] ' \
+                                    '[epochs (optional)] [test size (optional)]'
+
+    corpus = Corpus(sys.argv[1])
+    workers = [int(w) for w in sys.argv[2].split(',')]
+    epochs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    test_size = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+
+    with tempfile.TemporaryDirectory() as path:
+        # Both paths train on the same training documents, saved as a corpus of their own.
+        train, test = split(len(corpus), test_size)
+        tokens, offsets = gather(corpus.tokens, corpus.offsets, train)
+        save_corpus(path, corpus.vocab, tokens, offsets, corpus.tags.iloc[train])
+        training_corpus = Corpus(path)
+
+        # The text file is written once, and then reused by every training in the file mode.
+        start = timer()
+        training_corpus.lines()
+        print(f'{len(training_corpus)} training documents, {training_corpus.meta["tokens"]} words, {len(test)} held '
+              f'out. Text file ready in {timer() - start:.1f} s.')
+
+        print('workers  iterable (words/s)  corpus_file (words/s)  speed-up  iterable acc@1  corpus_file acc@1')
+        for w in workers:
+            iterable, iterable_speed = training(training_corpus, w, epochs, corpus_file=False)
+            corpus_file, corpus_file_speed = training(training_corpus, w, epochs, corpus_file=True)
+            iterable_accuracy = placement_accuracy(iterable, corpus, test)['accuracy@1']
+            corpus_file_accuracy = placement_accuracy(corpus_file, corpus, test)['accuracy@1']
+            speed_up = corpus_file_speed / iterable_speed
+            print(f'{w:7d}  {iterable_speed:18,.0f}  {corpus_file_speed:21,.0f}  {speed_up:7.1f}x  '
+                  f'{iterable_accuracy:14.3f}  {corpus_file_accuracy:17.3f}')
+
+
+if __name__ == '__main__':
+    main()
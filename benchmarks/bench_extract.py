@@ -0,0 +1,77 @@
+'''
+Benchmark of the two backends of extract_pages in obtain_texts.py: 'crop', which crops every area of a page and
+extracts its text separately, and 'chars', which splits the characters of the page into the areas in a single pass,
+between the headers and footers found on the pages. For a sample of sessions of each format (L7, L10 before and after
+the change of format in 2012, and L14), the PDFs are fetched (from the cache when possible) and the pages per second
+of both backends are reported, together with the number of sessions whose text differs: those where the body region
+found is not the one of the fixed ratios of the areas, which are worth checking by hand.
+
+Usage: $python -m benchmarks.bench_extract [input file] [sessions per format] [pages per session]
+
+- input file: csv file with the metadata, as used by obtain_texts.py.
+- sessions per format: how many different PDFs to take for each format.
+- pages per session: how many pages to extract from each PDF.
+'''
+
+import sys
+from timeit import default_timer as timer
+
+import pandas as pd
+
+from src.data.fetch import Fetcher
+from src.data.obtain_texts import count_pages, extract_pages, layout
+
+FORMATS = {
+    'L7': lambda data: data['legislatura'] == 7,
+    'L10 (two columns)': lambda data: (data['legislatura'] == 10) & (data['fecha'] <= '2012-08-01'),
+    'L10 (one column)': lambda data: (data['legislatura'] == 10) & (data['fecha'] > '2012-08-01'),
+    'L14': lambda data: data['legislatura'] == 14,
+}
+
+
+def main():
+    assert len(sys.argv) == 4, 'Usage: python -m benchmarks.bench_extract [input file] [sessions per format] ' \
+                               '[pages per session]'
+
+    input_file = sys.argv[1]
+    n = int(sys.argv[2])
+    pages = int(sys.argv[3])
+
+    data = pd.read_csv(input_file, usecols=['legislatura', 'fecha', 'enlace_pdf'])
+    fetcher = Fetcher()
+
+    for name, selector in FORMATS.items():
+        sessions = data.loc[selector(data)].drop_duplicates('enlace_pdf').head(n)
+        paths = fetcher.fetch_all(sessions['enlace_pdf'])
+
+        times = {'crop': 0, 'chars': 0}
+        total = 0
+        different = 0
+
+        for _, session in sessions.iterrows():
+            path = paths[session['enlace_pdf']]
+            if path is None:
+                continue
+
+            areas, skip = layout(session['legislatura'], session['fecha'])
+            last = min(pages, count_pages(path) - skip)
+
+            texts = {}
+            for backend in times:
+                start = timer()
+                texts[backend] = extract_pages(path, areas, 0, last, backend)
+                times[backend] += timer() - start
+
+            different += texts['crop'] != texts['chars']
+            total += last
+
+        if total == 0:
+            print(f'{name}: no PDFs available.')
+            continue
+
+        print(f'{name}: {total} pages, crop {total / times["crop"]:.2f} pages/s, '
+              f'chars {total / times["chars"]:.2f} pages/s, {different} sessions with a different text.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''
+Benchmark of the lemmatisation in preprocess_texts.py: the previous path, which loaded the spaCy model and ran the
+whole pipeline for every document, against the batched lemmatiser (src/features/lemmatise.py), which loads the model
+once and streams the documents through nlp.pipe. Both are run on the same sample of interventions, the documents per
+second of each one are reported, and the script checks that both produce the same tokens.
+
+Usage: $python -m benchmarks.bench_lemmatise [input file] [number of documents] [processes]
+
+- input file: .csv or .parquet file with a column «text», as used by preprocess_texts.py.
+- number of documents: how many documents to take. The previous path is slow, so a few hundred are enough.
+- processes: number of processes used by nlp.pipe.
+'''
+
+import sys
+from timeit import default_timer as timer
+
+import spacy
+
+from src.data.dataset import read_dataset
+from src.features.lemmatise import MODEL
+from src.features.preprocess_texts import clean_all, get_lemmatiser, remove_stopwords, tokenise
+
+
+def old_clean(text):
+    # The lemmatisation in preprocess_texts before the batched lemmatiser.
+    ltz = spacy.load(MODEL)
+    doc = ltz(' '.join(tokenise(text)))
+    return remove_stopwords([ltz.lemma_ for ltz in doc])
+
+
+def main():
+    assert len(sys.argv) == 4, 'Usage: python -m benchmarks.bench_lemmatise [input file] [number of documents] ' \
+                               '[processes]'
+
+    input_file = sys.argv[1]
+    n = int(sys.argv[2])
+    n_process = int(sys.argv[3])
+
+    texts = read_dataset(input_file, columns=['text'])['text'].dropna().head(n).tolist()
+
+    start = timer()
+    old = [old_clean(text) for text in texts]
+    old_time = timer() - start
+
+    start = timer()
+    new = list(clean_all(texts, lemmatise=True, n_process=n_process))
+    new_time = timer() - start
+
+    mismatches = sum(a != b for a, b in zip(old, new))
+
+    print(f'{len(texts)} documents.')
+    print(f'Per document: {len(texts) / old_time:.2f} docs/s.')
+    print(f'Batched:      {len(texts) / new_time:.2f} docs/s ({n_process} processes).')
+    print(f'Speed-up:     {old_time / new_time:.1f}x.')
+    lemmatiser = get_lemmatiser()
+    print(f'Memo of lemmas: {lemmatiser.hits / max(lemmatiser.hits + lemmatiser.misses, 1):.1%} hits, '
+          f'{len(lemmatiser.cache)} entries.')
+    print(f'Documents with different tokens: {mismatches}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+Benchmark of the reduction methods of src/reduce/reduce-dimension.py against the number of labels, from the ~50
+party-legislature tags to the tens or hundreds of thousands of MP or intervention tags. For every number of labels, a
+store (see src/models/vectors.py) of synthetic vectors, grouped around one centre per party, is written to a temporary
+directory, and every method reduces it in a new process, which reports its runtime, its peak resident memory over the
+memory after opening the store, and the peak memory allocated by numpy (tracemalloc).
+
+Usage: $python -m benchmarks.bench_reduce [labels] [methods] [dimensions (optional)] [threads (optional)]
+
+- labels: comma-separated numbers of labels, e.g. 1000,10000,100000.
+- methods: comma-separated methods of reduce-dimension.py, e.g. pca,rpca,ipca,tsne-pca.
+- dimensions: size of the vectors (default 200, as the models of the thesis).
+- threads: number of threads of the T-SNE methods (default 1).
+'''
+
+import importlib
+import multiprocessing
+import resource
+import sys
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+from src.models.vectors import load_vectors, open_vectors, write_store
+
+# The module name has a hyphen, so it cannot be imported with an import statement.
+reduce_dimension = importlib.import_module('src.reduce.reduce-dimension')
+
+PARTIES = 20
+
+
+def synthetic_store(path: str, labels: int, dimensions: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(PARTIES, dimensions))
+    parties = rng.integers(PARTIES, size=labels)
+    vectors = centres[parties] + rng.normal(scale=0.5, size=(labels, dimensions))
+    tags = pd.DataFrame({'label': [f'P{p} {i}' for i, p in enumerate(parties)]})
+    write_store(path, vectors.astype(np.float32), tags)
+
+
+def run(path: str, method: str, threads: int) -> tuple:
+    '''Reduces the store as reduce-dimension.py does, and returns the seconds and the peak memory in MB.'''
+    if method == 'ipca':
+        _, z = open_vectors(path)
+    else:
+        _, z = load_vectors(path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    start = timer()
+    reduce_dimension.fit_space(z, method, threads)
+    seconds = timer() - start
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is in KB on Linux.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return seconds, rss / 1024, allocated / 2 ** 20
+
+
+def main():
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m benchmarks.bench_reduce [labels] [methods] ' \
+                                    '[dimensions (optional)] [threads (optional)]'
+
+    labels = [int(n) for n in sys.argv[1].split(',')]
+    methods = sys.argv[2].split(',')
+    dimensions = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    for method in methods:
+        assert method in reduce_dimension.METHODS, f'Methods allowed: {", ".join(reduce_dimension.METHODS)}'
+
+    # Every run is a new process, so the peak memory of a run is not that of the previous ones.
+    context = multiprocessing.get_context('spawn')
+
+    print('labels  method    seconds  peak RSS (MB)  peak allocated (MB)')
+    for n in labels:
+        with tempfile.TemporaryDirectory() as path:
+            synthetic_store(path, n, dimensions)
+            for method in methods:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    seconds, rss, allocated = pool.submit(run, path, method, threads).result()
+                print(f'{n:6d}  {method:8s}  {seconds:7.2f}  {rss:13.1f}  {allocated:19.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Benchmark of the segmentation engine (src/data/segment.py) against text2dict on real session texts. For a sample of
+sessions from the metadata, the PDFs are fetched (from the cache when possible) and parsed once, and then both
+implementations are timed on the same texts, including the lookup of the intervention of every row of the session.
+The script also checks that both produce the same dictionary.
+
+Usage: $python -m benchmarks.bench_segment [input file] [number of sessions]
+
+- input file: csv file with the metadata, as used by obtain_texts.py.
+- number of sessions: how many different PDFs to take from the metadata.
+'''
+
+import contextlib
+import io
+import sys
+from timeit import default_timer as timer
+
+import pandas as pd
+
+from src.data.fetch import Fetcher
+from src.data.obtain_texts import cleantext, pdf2text, text2dict
+from src.data.segment import SpeakerIndex, segment
+
+
+def old_lookup(processed, rows):
+    # The lookup in obtain_texts before the speaker index.
+    for surname, topic in rows:
+        surname = surname.lower()
+        if topic in processed.keys():
+            for item in processed[topic].keys():
+                if surname in item.lower():
+                    text = processed[topic][item]
+
+
+def new_lookup(processed, rows):
+    index = SpeakerIndex(processed)
+    for surname, topic in rows:
+        text = index.lookup(topic, surname)
+
+
+def main():
+    assert len(sys.argv) == 3, 'Usage: python -m benchmarks.bench_segment [input file] [number of sessions]'
+
+    input_file = sys.argv[1]
+    n = int(sys.argv[2])
+
+    data = pd.read_csv(input_file)
+    rows_by_url = data.groupby('enlace_pdf', sort=False).indices
+    urls = list(rows_by_url)[:n]
+    paths = Fetcher().fetch_all(urls)
+
+    sessions = []
+    for url in urls:
+        if paths[url] is None:
+            continue
+        first = rows_by_url[url][0]
+        cleaned = cleantext(pdf2text(data.loc[first]['legislatura'], data.loc[first]['fecha'], paths[url]))
+        rows = [(data.loc[row]['orador'].split(',')[0], data.loc[row]['numero_expediente'][0:10])
+                for row in rows_by_url[url]]
+        sessions.append((cleaned, rows))
+
+    chars = sum(len(cleaned) for cleaned, _ in sessions)
+    print(f'{len(sessions)} sessions, {chars / 1e6:.1f}M characters.')
+
+    # text2dict prints some errors, which are not part of the benchmark.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = timer()
+        old = [text2dict(cleaned) for cleaned, _ in sessions]
+        old_split = timer() - start
+
+        start = timer()
+        for processed, (_, rows) in zip(old, sessions):
+            old_lookup(processed, rows)
+        old_search = timer() - start
+
+    start = timer()
+    new = [segment(cleaned).to_dict() for cleaned, _ in sessions]
+    new_split = timer() - start
+
+    start = timer()
+    for processed, (_, rows) in zip(new, sessions):
+        new_lookup(processed, rows)
+    new_search = timer() - start
+
+    mismatches = sum(a != b or list(a) != list(b) for a, b in zip(old, new))
+
+    print(f'text2dict:      {old_split:.3f} s segmenting, {old_search:.3f} s looking up.')
+    print(f'segment:        {new_split:.3f} s segmenting, {new_search:.3f} s looking up (index included).')
+    print(f'Speed-up:       {(old_split + old_search) / (new_split + new_search):.1f}x.')
+    print(f'Sessions with a different output: {mismatches}.')
+
+
+if __name__ == '__main__':
+    main()
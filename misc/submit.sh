@@ -3,7 +3,7 @@
 # Job to run the code in an HPC Cluster @DTU.
 
 #BSUB -J obt-txt
-#BSUB -n 4
+#BSUB -n 16
 #BSUB -R "span[hosts=1]"
 #BSUB -R "rusage[mem=6GB]"
 #BSUB -W 4:00
@@ -29,9 +29,6 @@ pip install -r requirements.txt
 # Unzip data in the parent directory.
 unzip data/vi-xiv-clean.csv.zip
 
-# Create temporary directory.
-mkdir tmp/
-touch tmp/temp.pdf
-
-# Obtain the texts taking the unzipped data and produce the outcome in out.csv.
-python3 obtain-texts.py vi-xiv-clean.csv out.csv
\ No newline at end of file
+# Obtain the texts taking the unzipped data and produce the outcome in out.csv, parsing
+# the PDFs with one worker per core of the slot. PDFs are cached in tmp/pdfs/.
+python3 -m src.data.obtain_texts vi-xiv-clean.csv out.csv 8 $LSB_DJOB_NUMPROC
\ No newline at end of file
@@ -0,0 +1,337 @@
+'''
+Ideological polarisation of the parties in every period (e.g. legislature), from their placements in the embedding
+space, with bootstrap confidence intervals. It computes the index of the discussion chapter
+(notebooks/discussion.ipynb, figures/ideological-polarisation-index.png) and the distances between every pair of
+parties (figures/euclidean-distance-psoe-pp.png), for all the periods at once as array operations.
+
+The index is the one of Dalton (2008) on the left-right dimension: the positions of the parties in a period are
+normalised to [0, 1] over all the placements (oriented so that LEFT is to the left of RIGHT), the party system average
+(PSA) is their mean weighted by the share of seats of the parties, and
+
+    index = 10 * sqrt(sum(share * ((position - PSA) / 5) ** 2))
+
+As in the notebook, the PSA is divided by the total share of the parties with seats in the period (total_perc), also
+when some of them have no placement, which then count as 0.
+
+The placements are either the .csv file of reduce-dimension.py, whose dimension DIMENSION is the left-right one, or
+the vectors of the labels (a model or a store, see src/models/vectors.py), where the distances are measured between
+the vectors and the left-right dimension is the first principal component of the placements of the parties.
+
+The confidence intervals resample the interventions instead of training the model again: given the vectors of the
+interventions (inferred with src/models/infer.py from a corpus with one document per intervention and the labels of
+the placements), every resample draws the interventions of every label with replacement, places the mean of their
+vectors in the space of the placements (with the fitted space of reduce-dimension.py, {placements}.space.pkl) and
+computes the index and the distances again. The deviation of every resample from the statistic of all the
+interventions gives the interval around the estimate of the placements. Every period is resampled in its own process
+of a pool, with its own random generator spawned from the seed, so the result does not depend on the workers.
+
+Usage: $python -m src.analysis.polarisation [placements] [output dir] [interventions (optional)]
+                                            [resamples (optional)] [workers (optional)] [seats file (optional)]
+
+- placements: .csv file of reduce-dimension.py, or a gensim doc2vec model or a store with the vectors of the labels.
+- output dir: directory where index.csv (one row per period) and distances.csv (one row per pair of parties and
+  period) are saved.
+- interventions: store with the vectors of the interventions (see src/models/infer.py), to compute the confidence
+  intervals; or 'none' (default).
+- resamples: number of bootstrap resamples (default 1000).
+- workers: number of processes (default 1).
+- seats file: .csv file with the columns [period, party, share] (e.g. 'L7', 'PP', 0.523). By default, the shares of
+  seats of the main parties from L7 to L14 (SEATS).
+'''
+
+import importlib
+import os
+import pickle
+import re
+import sys
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+from src.data.utils import Progress
+from src.features.parties import party_of
+from src.models.vectors import VectorStore, load_vectors
+
+# The module name has a hyphen, so it cannot be imported with an import statement.
+reduce_dimension = importlib.import_module('src.reduce.reduce-dimension')
+
+# Share of seats of the parties in every legislature (notebooks/discussion.ipynb).
+SEATS = {
+    'L7': {'PP': .523, 'PSOE': .357, 'UP': .023},
+    'L8': {'PP': .42, 'PSOE': .469, 'UP': .014},
+    'L9': {'PP': .434, 'PSOE': .483, 'UP': .014},
+    'L10': {'PP': .529, 'PSOE': .314, 'UP': .031},
+    'L11': {'PP': .34, 'PSOE': .254, 'UP': .191, 'CS': .114},
+    'L12': {'PP': .383, 'PSOE': .24, 'UP': .191, 'CS': .091},
+    'L13': {'PP': .188, 'PSOE': .351, 'UP': .12, 'CS': .163, 'VOX': .069},
+    'L14': {'PP': .251, 'PSOE': .343, 'UP': .10, 'CS': .026, 'VOX': .149},
+}
+
+# Left-right dimension of the reduced placements, and parties that orient it.
+DIMENSION = 'dim1'
+LEFT = 'PSOE'
+RIGHT = 'PP'
+
+RESAMPLES = 1000
+CONFIDENCE = 0.95
+
+# Maximum number of counts of the resamples drawn at once (resamples x interventions of a label).
+BATCH_SIZE = 2 ** 24
+
+
+def split_label(labels: pd.Series):
+    '''Returns the party (see src/features/parties.py) and the period (e.g. 'L7', '2019') of every label.'''
+    parties = party_of(labels).astype(object)
+    periods = labels.astype(str).str.extract(r'[ -](L?\d[^ ]*)$', expand=False)
+    return parties, periods
+
+
+def period_key(period: str):
+    number = re.search(r'\d+', period)
+    return (int(number.group()) if number else 0, period)
+
+
+class Placements:
+    '''Coordinates of the labels, and how to place new vectors and read their left-right position.'''
+
+    def __init__(self, path: str, dimension: str = DIMENSION):
+        self.space = None
+
+        if path.endswith('.csv'):
+            reduced = pd.read_csv(path)
+            self.labels = reduced['label'].astype(str)
+            columns = [c for c in reduced.columns if re.fullmatch(r'dim\d+', c)]
+            self.coordinates = reduced[columns].to_numpy(dtype=np.float64)
+            self.axis = columns.index(dimension)
+            self.space_file = path + reduce_dimension.SPACE
+        else:
+            labels, vectors = load_vectors(path)
+            self.labels = pd.Series(labels, dtype=str)
+            self.coordinates = vectors.astype(np.float64)
+
+            # The left-right dimension of the vectors: the first principal component of the parties.
+            known = party_of(self.labels).notna().to_numpy()
+            self.pca = PCA(n_components=1).fit(self.coordinates[known] if known.sum() > 1 else self.coordinates)
+            self.axis = None
+
+        self.dimensions = self.coordinates.shape[1]
+
+    def place(self, vectors: np.ndarray) -> np.ndarray:
+        '''Coordinates of new vectors in the space of the placements.'''
+        if self.axis is None:
+            return vectors.astype(np.float64)
+
+        if self.space is None:
+            with open(self.space_file, 'rb') as f:
+                self.space = pickle.load(f)
+        return reduce_dimension.project(self.space, vectors).astype(np.float64)
+
+    def position(self, coordinates: np.ndarray) -> np.ndarray:
+        '''Left-right position of coordinates with shape (..., dimensions).'''
+        if self.axis is not None:
+            return coordinates[..., self.axis]
+
+        return (coordinates - self.pca.mean_) @ self.pca.components_[0]
+
+
+def grid(parties: pd.Series, periods: pd.Series, values: np.ndarray, party_list: list, period_list: list):
+    '''Arranges the rows of values as an array (periods, parties, ...), with NaN for the missing ones.'''
+    result = np.full((len(period_list), len(party_list)) + values.shape[1:], np.nan)
+    p = pd.Index(party_list).get_indexer(parties)
+    t = pd.Index(period_list).get_indexer(periods)
+    found = (p >= 0) & (t >= 0)
+    result[t[found], p[found]] = values[found]
+    return result
+
+
+def shares_of(seats: dict, party_list: list, period_list: list) -> np.ndarray:
+    '''Array (periods, parties) of the shares of seats, NaN for the parties without seats.'''
+    return np.array([[seats.get(period, {}).get(party, np.nan) for party in party_list] for period in period_list])
+
+
+def totals_of(seats: dict, period_list: list) -> np.ndarray:
+    '''Total share of seats of the parties in every period (total_perc of the notebook).'''
+    return np.array([sum(seats.get(period, {}).values()) for period in period_list], dtype=np.float64)
+
+
+def polarisation_index(positions: np.ndarray, shares: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    '''
+    Index of positions (..., periods, parties) in [0, 1] weighted by shares (periods, parties), with the total shares
+    of the periods (see totals_of).
+    '''
+    present = ~np.isnan(positions) & ~np.isnan(shares)
+    s = np.where(present, shares, 0)
+    x = np.where(present, positions, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Party system average, over the total share of the period as in the notebook.
+        psa = (s * x).sum(axis=-1) / totals
+        index = np.sqrt((s * ((x - psa[..., None]) / 5) ** 2).sum(axis=-1)) * 10
+
+    return np.where(present.any(axis=-1), index, np.nan)
+
+
+def distances(coordinates: np.ndarray) -> np.ndarray:
+    '''Euclidean distances (..., parties, parties) between the coordinates (..., parties, dimensions).'''
+    return np.linalg.norm(coordinates[..., :, None, :] - coordinates[..., None, :, :], axis=-1)
+
+
+# Vectors of the interventions and placements of the processes of the pool, opened once per process.
+_vectors = None
+_placements = None
+
+
+def _init_worker(interventions: str, placements: Placements):
+    global _vectors, _placements
+    _vectors = VectorStore(interventions).vectors
+    _placements = placements
+
+
+def _resample(task: tuple) -> np.ndarray:
+    '''
+    Returns the coordinates (resamples + 1, parties, dimensions) of the mean of the interventions of every party of a
+    period: first with all its interventions, then with every resample.
+    '''
+    rows, resamples, seed = task
+    rng = np.random.default_rng(seed)
+    means = np.full((resamples + 1, len(rows), _vectors.shape[1]), np.nan)
+
+    for p, party_rows in enumerate(rows):
+        n = len(party_rows)
+        if n == 0:
+            continue
+        x = np.asarray(_vectors[party_rows], dtype=np.float64)
+        means[0, p] = x.mean(axis=0)
+
+        # Every resample is the number of times every intervention is drawn, in batches of resamples.
+        batch = max(1, BATCH_SIZE // n)
+        for start in range(0, resamples, batch):
+            counts = rng.multinomial(n, np.full(n, 1 / n), size=min(batch, resamples - start))
+            means[1 + start:1 + start + len(counts), p] = counts @ x / n
+
+    placed = np.full(means.shape[:2] + (_placements.dimensions,), np.nan)
+    found = ~np.isnan(means[0, :, 0])
+    if found.any():
+        coordinates = _placements.place(means[:, found].reshape(-1, means.shape[2]))
+        placed[:, found] = coordinates.reshape(resamples + 1, found.sum(), -1)
+    return placed
+
+
+def bootstrap(placements: Placements, interventions: str, party_list: list, period_list: list,
+              resamples: int = RESAMPLES, workers: int = 1, seed: int = 1) -> np.ndarray:
+    '''
+    Returns the coordinates (resamples + 1, periods, parties, dimensions) of the parties with all the interventions
+    (first) and with every resample of them.
+    '''
+    store = VectorStore(interventions)
+    parties, periods = split_label(store.tags['label'].astype(str))
+    rows = pd.Series(np.arange(len(store))).groupby([periods.to_numpy(), parties.to_numpy()]).apply(np.asarray)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(period_list))
+    tasks = [([rows.get((period, party), np.zeros(0, dtype=np.int64)) for party in party_list], resamples, seeds[t])
+             for t, period in enumerate(period_list)]
+    print(f'Bootstrap: {len(store)} interventions, {resamples} resamples of {len(period_list)} periods in {workers} '
+          f'processes.')
+
+    progress = Progress(len(tasks), 'Bootstrap', 'periods')
+    results = []
+    with Pool(workers, initializer=_init_worker, initargs=(interventions, placements)) as pool:
+        for result in pool.imap(_resample, tasks):
+            results.append(result)
+            progress.update()
+
+    return np.stack(results, axis=1)
+
+
+def interval(estimate: np.ndarray, replicates: np.ndarray, confidence: float = CONFIDENCE):
+    '''
+    Confidence interval of an estimate from the statistic with all the interventions (replicates[0]) and with every
+    resample (replicates[1:]): the percentiles of the deviations of the resamples, around the estimate.
+    '''
+    deviations = replicates[1:] - replicates[0]
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    # Periods or parties without interventions have no interval.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = estimate + np.nanpercentile(deviations, tails, axis=0)
+        se = np.nanstd(replicates[1:], axis=0)
+    return low, high, se
+
+
+def polarisation(placements: Placements, seats: dict = SEATS, interventions: str = None,
+                 resamples: int = RESAMPLES, workers: int = 1, seed: int = 1):
+    '''Returns the tables of the index by period and of the distances by pair of parties and period.'''
+    parties, periods = split_label(placements.labels)
+    known = (parties.notna() & periods.notna()).to_numpy()
+    party_list = sorted(parties[known].unique())
+    period_list = sorted(periods[known].unique(), key=period_key)
+
+    coordinates = grid(parties[known], periods[known], placements.coordinates[known], party_list, period_list)
+    shares = shares_of(seats, party_list, period_list)
+    totals = totals_of(seats, period_list)
+
+    # Normalisation of the positions to [0, 1], kept for the resamples so they are on the same scale.
+    positions = placements.position(coordinates)
+    low, high = np.nanmin(positions), np.nanmax(positions)
+    flip = LEFT in party_list and RIGHT in party_list and \
+        np.nanmean(positions[:, party_list.index(LEFT)]) > np.nanmean(positions[:, party_list.index(RIGHT)])
+
+    def normalise(values):
+        values = (values - low) / (high - low)
+        return 1 - values if flip else values
+
+    index = polarisation_index(normalise(positions), shares, totals)
+    pairs = distances(coordinates)
+
+    index_table = pd.DataFrame({'period': period_list, 'index': index,
+                                'parties': (~np.isnan(positions) & ~np.isnan(shares)).sum(axis=1)})
+    first, second = np.triu_indices(len(party_list), k=1)
+    distance_table = pd.DataFrame({'period': np.repeat(period_list, len(first)),
+                                   'party1': np.tile(np.asarray(party_list)[first], len(period_list)),
+                                   'party2': np.tile(np.asarray(party_list)[second], len(period_list)),
+                                   'distance': pairs[:, first, second].ravel()})
+
+    if interventions is not None:
+        replicates = bootstrap(placements, interventions, party_list, period_list, resamples, workers, seed)
+        replicate_index = polarisation_index(normalise(placements.position(replicates)), shares, totals)
+        replicate_pairs = distances(replicates)[:, :, first, second]
+
+        for table, estimate, values in ((index_table, index, replicate_index),
+                                        (distance_table, pairs[:, first, second], replicate_pairs)):
+            low_ci, high_ci, se = interval(estimate, values)
+            table['low'], table['high'], table['se'] = low_ci.ravel(), high_ci.ravel(), se.ravel()
+
+    return index_table, distance_table.dropna(subset=['distance']).reset_index(drop=True)
+
+
+def read_seats(path: str) -> dict:
+    seats = {}
+    for row in pd.read_csv(path, dtype={'period': str}).itertuples():
+        seats.setdefault(row.period, {})[row.party] = row.share
+    return seats
+
+
+if __name__ == '__main__':
+
+    assert 3 <= len(sys.argv) <= 7, 'Usage: python -m src.analysis.polarisation [placements] [output dir] ' \
+                                    '[interventions (optional)] [resamples (optional)] [workers (optional)] ' \
+                                    '[seats file (optional)]'
+
+    placements = Placements(sys.argv[1])
+    output_dir = sys.argv[2]
+    interventions = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != 'none' else None
+    resamples = int(sys.argv[4]) if len(sys.argv) > 4 else RESAMPLES
+    workers = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    seats = read_seats(sys.argv[6]) if len(sys.argv) > 6 else SEATS
+
+    index, pairs = polarisation(placements, seats, interventions, resamples, workers)
+
+    os.makedirs(output_dir, exist_ok=True)
+    index.to_csv(os.path.join(output_dir, 'index.csv'), index=False)
+    pairs.to_csv(os.path.join(output_dir, 'distances.csv'), index=False)
+
+    print(index.to_string(index=False))
+    print(f'Index and distances saved in {output_dir}.')
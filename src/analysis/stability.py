@@ -0,0 +1,193 @@
+'''
+Stability of the placements of the parties across repeated trainings of Doc2Vec (e.g. the seeds of a sweep, or the
+weekly retrains). The embedding of every training is arbitrary up to rotation, reflection and scale, so the runs are
+not comparable as they are (notebooks/model_evaluation.ipynb only scaled them by hand): every run is reduced with the
+same method of reduce-dimension.py (or kept as vectors) and aligned with an orthogonal Procrustes against a reference
+run (the first), all the runs at once as a batch of SVDs. Only the labels with a party of the registry present in
+every run are aligned, and there must be at least MIN_LABELS of them.
+
+Reports:
+
+- labels.csv: for every label, its mean aligned placement, its dispersion (mean distance of its placements in the
+  runs to their mean, in the scale of the reference) and its rank stability (share of the runs in which the party has
+  the same rank on the first dimension within its period as in the reference).
+- runs.csv: for every run, its Procrustes disparity from the reference (0: identical up to rotation, reflection and
+  scale; 1: unrelated), the Spearman correlation of its first dimension with that of the reference and its rank
+  agreement.
+- aligned.csv: the aligned placements of every run, to overlay them (unless the vectors are aligned).
+
+A retrain whose disparity is within those of repeated runs of the same configuration only added noise; a larger one
+changed the picture. When a sweep saves its models, the stability of the seeds of every combination of parameters is
+reported after the sweep in {sweep output dir}/stability.csv (see sweep_stability).
+
+Usage: $python -m src.analysis.stability [output dir] [method] [workers] [model or store] [model or store] ...
+
+- output dir: directory where the reports are saved.
+- method: method of reduce-dimension.py used to reduce every run (e.g. 'pca'), or 'none' to align the vectors.
+- workers: number of processes that load and reduce the runs.
+- model or store: the runs, the first being the reference (see src/models/vectors.py).
+'''
+
+import importlib
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.polarisation import split_label
+from src.models.vectors import load_vectors
+
+# The module name has a hyphen, so it cannot be imported with an import statement.
+reduce_dimension = importlib.import_module('src.reduce.reduce-dimension')
+
+STABILITY = 'stability.csv'
+
+# Labels below which the Procrustes alignment is degenerate (any placements fit).
+MIN_LABELS = 3
+
+
+def _placements(task: tuple):
+    '''Loads the vectors of a run and reduces them, in a process of the pool.'''
+    path, method = task
+    labels, z = load_vectors(path)
+    if method != 'none':
+        z, _ = reduce_dimension.fit_space(z, method)
+    return labels, np.asarray(z, dtype=np.float64)
+
+
+def load_runs(paths: list, method: str = 'pca', workers: int = 1):
+    '''Returns the labels with a party common to all the runs (in the order of the first) and their placements.'''
+    with Pool(workers) as pool:
+        runs = pool.map(_placements, [(path, method) for path in paths])
+
+    labels = list(runs[0][0])
+    for run_labels, _ in runs[1:]:
+        common = set(run_labels)
+        labels = [label for label in labels if label in common]
+    parties, _ = split_label(pd.Series(labels, dtype=str))
+    labels = [label for label, party in zip(labels, parties) if isinstance(party, str)]
+    if len(labels) < MIN_LABELS:
+        raise ValueError(f'The runs share {len(labels)} labels with a party of the registry, fewer than the '
+                         f'{MIN_LABELS} needed to align them: {", ".join(paths)}')
+
+    placements = np.stack([z[pd.Index(run_labels).get_indexer(labels)] for run_labels, z in runs])
+    return labels, placements
+
+
+def procrustes(placements: np.ndarray, reference: np.ndarray):
+    '''
+    Aligns the placements (runs, labels, dimensions) to the reference (labels, dimensions) with a rotation (or
+    reflection) and a scale each. Returns the aligned placements, in the position and scale of the reference, and the
+    disparities (as scipy.spatial.procrustes).
+    '''
+    centre = reference.mean(axis=0)
+    scale = np.linalg.norm(reference - centre)
+    target = (reference - centre) / scale
+
+    x = placements - placements.mean(axis=1, keepdims=True)
+    x = x / np.maximum(np.linalg.norm(x, axis=(1, 2), keepdims=True), 1e-12)
+
+    # Orthogonal Procrustes of every run: the rotation is U V' of the SVD of X' T, and the scale the sum of its values.
+    u, s, vt = np.linalg.svd(np.swapaxes(x, 1, 2) @ target)
+    aligned = x @ (u @ vt) * s.sum(axis=1)[:, None, None]
+    disparity = ((aligned - target) ** 2).sum(axis=(1, 2))
+
+    return aligned * scale + centre, disparity
+
+
+def ranks(labels: list, positions: np.ndarray) -> np.ndarray:
+    '''Rank (runs, labels) of every label by its position within its period, in every run.'''
+    _, periods = split_label(pd.Series(labels, dtype=str))
+    table = pd.DataFrame(positions.T)
+    return table.groupby(periods.fillna('').to_numpy()).rank().to_numpy().T
+
+
+def stability(labels: list, placements: np.ndarray):
+    '''Returns the tables of labels and of runs, and the aligned placements, with the first run as the reference.'''
+    aligned, disparity = procrustes(placements, placements[0])
+
+    mean = aligned.mean(axis=0)
+    dispersion = np.linalg.norm(aligned - mean, axis=2).mean(axis=0)
+    ranking = ranks(labels, aligned[:, :, 0])
+    same = ranking == ranking[0]
+
+    parties, periods = split_label(pd.Series(labels, dtype=str))
+    label_table = pd.DataFrame({'label': labels, 'party': parties.to_numpy(), 'period': periods.to_numpy()})
+    for d in range(min(mean.shape[1], 2)):
+        label_table[f'dim{d + 1}'] = mean[:, d]
+    label_table['dispersion'] = dispersion
+    label_table['rank_stability'] = same.mean(axis=0)
+
+    first = aligned[:, :, 0]
+    order = first.argsort(axis=1).argsort(axis=1).astype(np.float64)
+    spearman = [np.corrcoef(order[0], order[i])[0, 1] for i in range(len(order))]
+    run_table = pd.DataFrame({'run': np.arange(len(placements)), 'disparity': disparity, 'spearman': spearman,
+                              'rank_agreement': same.mean(axis=1)})
+
+    return label_table, run_table, aligned
+
+
+def sweep_stability(output_dir: str, results: pd.DataFrame, names: list, method: str = 'pca',
+                    workers: int = 1) -> pd.DataFrame:
+    '''
+    Stability of the models saved by a sweep (see src/models/sweep.py) across the seeds of every combination of
+    parameters, saved in {output dir}/stability.csv.
+    '''
+    rows = []
+    for params, jobs in results.groupby(names):
+        paths = [os.path.join(output_dir, 'models', f'{job}.mdl') for job in jobs.sort_values('seed')['job']]
+        paths = [path for path in paths if os.path.exists(path)]
+        if len(paths) < 2:
+            continue
+
+        # A combination whose runs cannot be aligned is reported and left out, as the rest can.
+        try:
+            labels, placements = load_runs(paths, method, workers)
+        except ValueError as error:
+            print(f'Stability of {dict(zip(names, params))} skipped. {error}')
+            continue
+        label_table, run_table, _ = stability(labels, placements)
+        rows.append({**dict(zip(names, params)), 'runs': len(paths),
+                     'dispersion': label_table['dispersion'].mean(),
+                     'rank_stability': label_table['rank_stability'].mean(),
+                     'max_disparity': run_table['disparity'].max()})
+
+    table = pd.DataFrame(rows)
+    if len(table):
+        table.to_csv(os.path.join(output_dir, STABILITY), index=False)
+    return table
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) >= 6, 'Usage: python -m src.analysis.stability [output dir] [method] [workers] ' \
+                               '[model or store] [model or store] ...'
+
+    output_dir = sys.argv[1]
+    method = sys.argv[2]
+    workers = int(sys.argv[3])
+    paths = sys.argv[4:]
+    assert method == 'none' or method in reduce_dimension.METHODS, \
+        f'Methods allowed: none, {", ".join(reduce_dimension.METHODS)}'
+
+    labels, placements = load_runs(paths, method, workers)
+    label_table, run_table, aligned = stability(labels, placements)
+    run_table.insert(1, 'path', paths)
+
+    os.makedirs(output_dir, exist_ok=True)
+    label_table.to_csv(os.path.join(output_dir, 'labels.csv'), index=False)
+    run_table.to_csv(os.path.join(output_dir, 'runs.csv'), index=False)
+
+    # The aligned placements to overlay, unless they are vectors.
+    if method != 'none':
+        runs, n, dimensions = aligned.shape
+        overlay = pd.DataFrame({'run': np.repeat(np.arange(runs), n), 'label': np.tile(labels, runs)})
+        for d in range(dimensions):
+            overlay[f'dim{d + 1}'] = aligned[:, :, d].ravel()
+        overlay.to_csv(os.path.join(output_dir, 'aligned.csv'), index=False)
+
+    print(run_table.to_string(index=False))
+    print(f'{len(labels)} labels aligned. Mean dispersion {label_table["dispersion"].mean():.4f}, mean rank stability '
+          f'{label_table["rank_stability"].mean():.3f}. Reports saved in {output_dir}.')
@@ -1,37 +1,152 @@
-import os
+'''
+Script to concatenate the CSV files exported from https://congreso.es into a single file.
+
+The files are streamed in chunks, several files at the same time, and never modified: the "; " inside the names of
+the initiatives, which break the files delimited with semicolons, are replaced by ", " while reading. Each file is
+first written to a temporary part and the parts are then appended to the output in the order of the file names, so
+the memory used does not depend on the number or size of the files.
+
+The functions below are also used by preprocess_metadata.py to read the exports in the same way.
+
+Usage: $python -m src.data.concatenate [input dir] [output file] [delimiter (optional)] [workers (optional)]
+
+- input dir: directory with the CSV files (e.g. 'by-legislature').
+- output file: path of the concatenated file (e.g. 'all-interventions.csv').
+- delimiter: delimiter of the files, e.g. ';'. By default, it is detected from the header of each file.
+- workers: number of files read at the same time (default: number of CPUs).
+'''
+
 import glob
-import pandas as pd
+import os
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Number of rows read at a time from each file.
+CHUNKSIZE = 100_000
+
+
+class RepairedFile:
+    '''File opened for reading where every "; " is replaced by ", " on the fly, as pandas reads it.'''
+
+    def __init__(self, path: str):
+        self.file = open(path, 'r', encoding='utf-8-sig', newline='')
+
+    def read(self, size: int = -1) -> str:
+        text = self.file.read(size)
+
+        # Never split a "; " between two reads.
+        while text.endswith(';'):
+            extra = self.file.read(1)
+            if not extra:
+                break
+            text += extra
+
+        return text.replace('; ', ', ')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def detect_delimiter(path: str) -> str:
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        header = f.readline()
+
+    return ';' if header.count(';') > header.count(',') else ','
+
+
+def read_export(path: str, delimiter: str = None, chunksize: int = CHUNKSIZE, usecols: list = None):
+    '''
+    Yields the rows of an exported CSV file as dataframes of chunksize rows, with all the values as strings. Files
+    delimited with semicolons are repaired while reading.
+    '''
+    delimiter = delimiter or detect_delimiter(path)
+
+    if delimiter == ';':
+        source = RepairedFile(path)
+    else:
+        source = open(path, 'r', encoding='utf-8-sig', newline='')
+
+    with source:
+        yield from pd.read_csv(source, sep=delimiter, chunksize=chunksize, usecols=usecols, dtype=str)
+
+
+def write_part(path: str, part: str, delimiter: str = None, chunksize: int = CHUNKSIZE, usecols: list = None,
+               transform=None) -> str:
+    '''Streams a file into a part (an intermediate CSV file), applying transform to every chunk.'''
+    header = True
+    for chunk in read_export(path, delimiter, chunksize, usecols):
+        if transform is not None:
+            chunk = transform(chunk)
+        chunk.to_csv(part, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+    return part if not header else None
+
+
+def merge(filenames: list, output_file: str, delimiter: str = None, workers: int = None, chunksize: int = CHUNKSIZE,
+          usecols: list = None, transform=None, deduplicate: bool = False, encoding: str = 'utf-8'):
+    '''
+    Concatenates the files into output_file. Several files are processed at the same time into temporary parts,
+    which are then appended in the order of filenames. If deduplicate, rows already written are skipped; only a
+    64-bit hash of each distinct row is kept in memory. Returns the number of rows written.
+    '''
+    workers = workers or os.cpu_count()
+    parent = os.path.dirname(os.path.abspath(output_file))
+
+    with tempfile.TemporaryDirectory(dir=parent) as tmp, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_part, path, os.path.join(tmp, f'{i:05d}.csv'), delimiter, chunksize, usecols,
+                               transform) for i, path in enumerate(filenames)]
+
+        seen = set()
+        rows = 0
+        header = True
+        with open(output_file, 'w', encoding=encoding, newline='') as output:
+            # The parts are appended in order, as soon as each one is ready.
+            for future in futures:
+                part = future.result()
+                if part is None:
+                    continue
+
+                for chunk in pd.read_csv(part, chunksize=chunksize, dtype=str, keep_default_na=False):
+                    if deduplicate:
+                        hashes = pd.util.hash_pandas_object(chunk, index=False).tolist()
+                        keep = []
+                        for h in hashes:
+                            keep.append(h not in seen)
+                            seen.add(h)
+                        chunk = chunk.loc[keep]
+
+                    chunk.to_csv(output, header=header, index=False)
+                    header = False
+                    rows += len(chunk)
+
+                os.remove(part)
 
-assert len(sys.argv) == 3, 'Usage: python concatenate.py [relative path]'\
-                        ' [output file] [delimiter]'
+    return rows
 
-workdir = sys.argv[1] # e.g. 'by-legislature'
-title = sys.argv[2] # e.g. 'all-interventions.csv'
-delimiter = sys.argv[3] # e.g. ';'
 
-os.chdir(f'./{workdir}')
+if __name__ == '__main__':
 
-# Get all the file names.
-filenames = [i for i in glob.glob('*.csv')]
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m src.data.concatenate [input dir] [output file] ' \
+                                    '[delimiter (optional)] [workers (optional)]'
 
-# Change all "; " for ", " to fix all the CSV files where \
-# initative names include a semicolon.
-for f in filenames:
-    text = open(f"{f}", "r")
-    text = ''.join([i for i in text]).replace("; ", ", ")
-    x = open(f"{f}","w")
-    x.writelines(text)
-    x.close()
+    workdir = sys.argv[1]  # e.g. 'by-legislature'
+    title = sys.argv[2]  # e.g. 'all-interventions.csv'
+    delimiter = sys.argv[3] if len(sys.argv) > 3 else None  # e.g. ';'
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
 
-# Get all files as dataframes in pandas.
-files = []
-for i in range(0, len(filenames) - 1):
-    # print(f'{i}')
-    files.append(pd.read_csv(filenames[i], delimiter=delimiter))
+    # Get all the file names.
+    filenames = sorted(glob.glob(os.path.join(workdir, '*.csv')))
 
-# Combine all files.
-concatenated = pd.concat(files)
+    rows = merge(filenames, title, delimiter, workers, encoding='utf-8-sig')
 
-# Export.
-concatenated.to_csv(f"../{title}", index=False, encoding='utf-8-sig')
\ No newline at end of file
+    print(f'Concatenated {len(filenames)} files ({rows} rows) into {title}.')
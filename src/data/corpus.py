@@ -0,0 +1,289 @@
+'''
+Memory-mapped corpus of integer-encoded documents, used to train Doc2Vec and to count the occurrence of terms
+without loading the tokens as Python strings. A corpus is a directory with:
+
+- vocab.txt: one token per line; the id of a token is its line number (from 0).
+- tokens.int32: the ids of the tokens of all the documents, one after the other, as a flat array of int32.
+- offsets.npy: int64 array with the position of the first token of every document, plus the total number of tokens
+  at the end, so the document i is tokens[offsets[i]:offsets[i + 1]].
+- tags.parquet: one row per document with its «label» and any other column given when building it (e.g. the
+  political group or the date), see src/data/dataset.py.
+- lines.txt (optional): the documents with tokens as text, one per line with the tokens separated by spaces (the
+  LineSentence format of gensim), written the first time it is needed to train with corpus_file (see
+  src/models/doc2vec.py). Empty documents are left out: gensim skips empty lines without moving on to the next tag, so
+  every document after one would train the vector of the previous line.
+
+The corpus is written in a streaming way, one document at a time, and read with numpy memory maps, so the tokens
+are only loaded from disk when they are used and shared between processes by the page cache.
+
+Usage: $python -m src.data.corpus [input file] [output dir]
+
+- input file: .parquet or .csv file with a corpus with the format [label, document] (see generate-corpus.py).
+- output dir: directory where the memory-mapped corpus is saved.
+'''
+
+import json
+import os
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from gensim.models.doc2vec import TaggedDocument
+
+from src.data.dataset import read_dataset, write_dataset
+
+VOCAB = 'vocab.txt'
+TOKENS = 'tokens.int32'
+OFFSETS = 'offsets.npy'
+TAGS = 'tags.parquet'
+META = 'meta.json'
+# Previous versions wrote the empty documents too, in corpus.txt, which is not used any more.
+LINES = 'lines.txt'
+
+# Number of token ids kept in memory before writing them to disk.
+BUFFER_SIZE = 1 << 20
+
+
+def is_corpus(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META))
+
+
+class CorpusWriter:
+    '''
+    Writes a memory-mapped corpus one document at a time. The vocabulary is built on the fly, assigning ids in order
+    of first appearance. Use it as a context manager, or call close() at the end.
+    '''
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / META).unlink(missing_ok=True)
+
+        self.ids = {}
+        self.buffer = array('i')
+        self.offsets = array('q', [0])
+        self.tags = []
+        self.tokens = open(self.path / TOKENS, 'wb')
+
+    def add(self, document: list, label: str, **columns):
+        '''Adds a document (a list of tokens) with its label and any other column for the tag table.'''
+        ids = self.ids
+        for token in document:
+            index = ids.get(token)
+            if index is None:
+                index = ids[token] = len(ids)
+            self.buffer.append(index)
+
+        self.offsets.append(self.offsets[-1] + len(document))
+        self.tags.append({'label': label, **columns})
+
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.buffer.tofile(self.tokens)
+        self.buffer = array('i')
+
+    def close(self):
+        self.flush()
+        self.tokens.close()
+
+        with open(self.path / VOCAB, 'w', encoding='utf-8') as f:
+            f.writelines(f'{token}\n' for token in self.ids)
+
+        np.save(self.path / OFFSETS, np.frombuffer(self.offsets, dtype=np.int64))
+        write_dataset(pd.DataFrame(self.tags), str(self.path / TAGS))
+
+        # Written last, so an interrupted corpus is not taken as a valid one.
+        meta = {'documents': len(self.tags), 'tokens': self.offsets[-1], 'vocabulary': len(self.ids)}
+        (self.path / META).write_text(json.dumps(meta))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.tokens.close()
+
+
+def write_corpus(data: pd.DataFrame, path: str):
+    '''Saves a corpus with the format [label, document] (plus any other columns kept in the tag table).'''
+    columns = [c for c in data.columns if c not in ('label', 'document')]
+    with CorpusWriter(path) as writer:
+        for row in data.itertuples(index=False):
+            row = row._asdict()
+            writer.add(row['document'], row['label'], **{c: row[c] for c in columns})
+
+
+def encode(documents: pa.ListArray):
+    '''
+    Encodes a pyarrow ListArray of documents (see dataset.read_lists) into the arrays of a corpus, with pyarrow: returns
+    the vocabulary (in order of first appearance, as CorpusWriter), the token ids and the offsets. Missing documents
+    are empty.
+    '''
+    # Missing documents have no values in the flattened array.
+    encoded = pc.dictionary_encode(documents.flatten())
+    if len(encoded) == 0:
+        return [], np.zeros(0, dtype=np.int32), np.zeros(len(documents) + 1, dtype=np.int64)
+
+    vocab = encoded.dictionary.to_pylist()
+    tokens = encoded.indices.to_numpy().astype(np.int32, copy=False)
+    offsets = documents.offsets.to_numpy().astype(np.int64)
+
+    return vocab, tokens, offsets - offsets[0]
+
+
+def gather(tokens: np.ndarray, offsets: np.ndarray, rows: np.ndarray):
+    '''Returns the token ids and offsets of the given documents (in the given order), without a loop over them.'''
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    # Position in tokens of every token of the selected documents.
+    index = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+    return tokens[index], new_offsets
+
+
+def save_corpus(path: str, vocab: list, tokens: np.ndarray, offsets: np.ndarray, tags: pd.DataFrame):
+    '''
+    Saves a corpus given as arrays (e.g. a selection of the documents of another one). Only the tokens used are kept
+    in the vocabulary, in their previous order.
+    '''
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / META).unlink(missing_ok=True)
+
+    used = np.zeros(len(vocab), dtype=bool)
+    used[tokens] = True
+    remap = np.cumsum(used, dtype=np.int64) - 1
+
+    tokens = remap[tokens].astype(np.int32) if len(tokens) else tokens.astype(np.int32)
+    tokens.tofile(path / TOKENS)
+    with open(path / VOCAB, 'w', encoding='utf-8') as f:
+        f.writelines(f'{vocab[i]}\n' for i in np.flatnonzero(used).tolist())
+
+    np.save(path / OFFSETS, offsets.astype(np.int64))
+    write_dataset(tags.reset_index(drop=True), str(path / TAGS))
+
+    # Written last, so an interrupted corpus is not taken as a valid one.
+    meta = {'documents': len(tags), 'tokens': int(offsets[-1]), 'vocabulary': int(used.sum())}
+    (path / META).write_text(json.dumps(meta))
+
+
+class TaggedCorpus:
+    '''
+    Iterable of TaggedDocuments over a memory-mapped corpus, to train Doc2Vec. It can be iterated several times (one
+    per epoch) and only builds the list of words of one document at a time. The words are the strings of the
+    vocabulary, so no new string is created per token.
+    '''
+
+    def __init__(self, corpus: 'Corpus', documents=None):
+        self.corpus = corpus
+        self.documents = range(len(corpus)) if documents is None else documents
+
+    def __iter__(self):
+        vocab, tokens, offsets, labels = self.corpus.vocab, self.corpus.tokens, self.corpus.offsets, self.corpus.labels
+        for i in self.documents:
+            ids = tokens[offsets[i]:offsets[i + 1]].tolist()
+            yield TaggedDocument([vocab[j] for j in ids], [labels[i]])
+
+    def __len__(self):
+        return len(self.documents)
+
+
+class Corpus:
+    '''Reads a memory-mapped corpus. The tokens and offsets are memory maps; only the vocabulary and tags are loaded.'''
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META).read_text())
+
+        with open(self.path / VOCAB, encoding='utf-8') as f:
+            self.vocab = f.read().split('\n')[:-1]
+        self.ids = {token: index for index, token in enumerate(self.vocab)}
+
+        self.offsets = np.load(self.path / OFFSETS, mmap_mode='r')
+        if self.meta['tokens'] > 0:
+            self.tokens = np.memmap(self.path / TOKENS, dtype=np.int32, mode='r', shape=(self.meta['tokens'],))
+        else:
+            self.tokens = np.zeros(0, dtype=np.int32)
+
+        self.tags = read_dataset(str(self.path / TAGS))
+        self.labels = self.tags['label'].astype(str).tolist()
+
+    def __len__(self):
+        return self.meta['documents']
+
+    def ids_of(self, i: int) -> np.ndarray:
+        '''Returns the token ids of the document i.'''
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def words(self, i: int) -> list:
+        '''Returns the document i as a list of tokens.'''
+        return [self.vocab[j] for j in self.ids_of(i).tolist()]
+
+    def tagged(self, documents=None) -> TaggedCorpus:
+        '''Returns a streaming iterable of TaggedDocuments over all the documents (or the given ones).'''
+        return TaggedCorpus(self, documents)
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def frequencies(self) -> np.ndarray:
+        '''Returns the number of occurrences of every token of the vocabulary in the whole corpus.'''
+        return np.bincount(self.tokens, minlength=len(self.vocab))
+
+    def nonempty(self) -> np.ndarray:
+        '''Returns the indices of the documents with at least one token.'''
+        return np.flatnonzero(np.diff(self.offsets) > 0)
+
+    def lines(self) -> str:
+        '''
+        Returns the path of the corpus as a text file with one document per line, in the order of the corpus but
+        without the empty documents (so the line number of a document is its position in nonempty()), and writes it if
+        it does not exist yet.
+        '''
+        path = self.path / LINES
+        if path.exists() and path.stat().st_mtime >= (self.path / META).stat().st_mtime:
+            return str(path)
+
+        tmp = self.path / f'{LINES}.tmp'
+        vocab = self.vocab
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for i in self.nonempty().tolist():
+                f.write(' '.join([vocab[j] for j in self.ids_of(i).tolist()]) + '\n')
+
+        # Renamed at the end, so an interrupted file is never used.
+        os.replace(tmp, path)
+        return str(path)
+
+    def contains(self, terms: list) -> np.ndarray:
+        '''Returns a boolean array telling which documents contain any of the given terms.'''
+        ids = [self.ids[term] for term in terms if term in self.ids]
+        result = np.zeros(len(self), dtype=bool)
+        if not ids or len(self.tokens) == 0:
+            return result
+
+        # Count the hits of every document with a cumulative sum, which also works for empty documents.
+        hits = np.concatenate([[0], np.cumsum(np.isin(self.tokens, ids), dtype=np.int64)])
+        result[:] = hits[self.offsets[1:]] > hits[self.offsets[:-1]]
+        return result
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) == 3, 'Usage: python -m src.data.corpus [input file] [output dir]'
+
+    input_file = sys.argv[1]
+    output_dir = sys.argv[2]
+
+    write_corpus(read_dataset(input_file), output_dir)
+
+    print(f'Corpus saved in {output_dir}.')
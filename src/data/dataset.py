@@ -0,0 +1,130 @@
+'''
+Columnar storage for the dataset of interventions. The dataset is saved as a Parquet file where the token
+columns («clean_text», «phrases» and the «document» of a corpus) are real lists of strings, and the columns with
+few distinct values («political_group», «legislatura», «orador») are categorical. Reading only some of the
+columns loads just those columns from disk, with no parsing of strings.
+
+CSV files are still supported as input: their token columns are turned back into lists with utils.string_to_list.
+
+Usage: $python -m src.data.dataset [input file] [output file]
+
+- input file: .csv file with the dataset (e.g. the output of preprocess_texts.py).
+- output file: .parquet file to save it.
+'''
+
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.utils import string_to_list
+
+LIST_COLUMNS = ['clean_text', 'phrases', 'document']
+CATEGORICAL_COLUMNS = ['political_group', 'legislatura', 'orador']
+
+
+def is_parquet(path: str) -> bool:
+    return str(path).endswith('.parquet')
+
+
+def write_dataset(data: pd.DataFrame, path: str):
+    '''Saves the dataset as a .parquet file, or as a .csv file for any other extension.'''
+    if not is_parquet(path):
+        data.to_csv(path, index=False)
+        return
+
+    data = data.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in data.columns:
+            data[column] = data[column].astype('category')
+
+    for column in LIST_COLUMNS:
+        if column in data.columns:
+            data[column] = data[column].map(list)
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    pq.write_table(table, path, compression='zstd')
+
+
+def read_dataset(path: str, columns: list = None) -> pd.DataFrame:
+    '''
+    Reads the given columns (all by default) of a dataset saved as .parquet or .csv. The token columns are returned as
+    lists of strings in both cases.
+    '''
+    if not is_parquet(path):
+        data = pd.read_csv(path, usecols=columns)
+        for column in LIST_COLUMNS:
+            if column in data.columns:
+                data[column] = data[column].map(lambda x: string_to_list(x) if isinstance(x, str) else [])
+        return data
+
+    table = pq.read_table(path, columns=columns)
+    lists = [column for column in LIST_COLUMNS if column in table.column_names]
+
+    # Lists are converted directly by pyarrow, instead of going through numpy arrays in pandas.
+    data = table_to_pandas(table.select([c for c in table.column_names if c not in lists]))
+    for column in lists:
+        data[column] = table.column(column).to_pylist()
+
+    if columns is not None:
+        data = data[columns]
+
+    return data
+
+
+def read_lists(path: str, columns: list = None):
+    '''
+    Like read_dataset, but the token columns are not converted into Python lists: returns the dataframe with the other
+    columns and a dictionary with every token column as a pyarrow ListArray, so the tokens can be processed without
+    creating a Python string per token (see corpus.encode).
+    '''
+    if not is_parquet(path):
+        data = read_dataset(path, columns)
+        lists = {c: pa.array(data.pop(c), type=pa.list_(pa.string())) for c in LIST_COLUMNS if c in data.columns}
+        return data, lists
+
+    table = pq.read_table(path, columns=columns)
+    names = [column for column in LIST_COLUMNS if column in table.column_names]
+
+    data = table_to_pandas(table.select([c for c in table.column_names if c not in names]))
+    lists = {column: table.column(column).combine_chunks() for column in names}
+
+    return data, lists
+
+
+def table_to_pandas(table: pa.Table) -> pd.DataFrame:
+    data = table.to_pandas()
+
+    # Parquet only keeps the dictionary encoding of string columns, e.g. «legislatura» comes back as integers.
+    for column in CATEGORICAL_COLUMNS:
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+
+    return data
+
+
+def iter_dataset(path: str, column: str, batch_size: int = 10_000):
+    '''Yields the values of a column of a dataset one by one, reading batch_size rows at a time.'''
+    if is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=[column]):
+            yield from batch.column(0).to_pylist()
+        return
+
+    for chunk in pd.read_csv(path, usecols=[column], chunksize=batch_size):
+        values = chunk[column]
+        if column in LIST_COLUMNS:
+            values = values.map(lambda x: string_to_list(x) if isinstance(x, str) else [])
+        yield from values
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) == 3, 'Usage: python -m src.data.dataset [input file] [output file]'
+
+    input_file = sys.argv[1]
+    output_file = sys.argv[2]
+
+    write_dataset(read_dataset(input_file), output_file)
+
+    print(f'Dataset saved in {output_file}.')
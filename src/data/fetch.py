@@ -0,0 +1,212 @@
+'''
+Fetch stage for the PDFs of the Diario de Sesiones. The PDFs are downloaded with a bounded pool of threads that share
+one pooled requests.Session, and they are stored in an on-disk cache so that re-runs (or partial re-runs) of
+obtain_texts.py do not need to download them again.
+
+The cache is content-addressed: every PDF is stored once under the SHA-256 of its bytes, and an append-only index maps
+each URL to the hash of its content. The layout of the cache directory is:
+
+    {cache dir}/index.tsv               one line per download: {content hash}\t{url}
+    {cache dir}/ab/abcdef....pdf        the PDF itself, named after its content hash.
+
+Downloads are retried with exponential backoff and the requests to the same host are spaced by a minimum interval,
+so the server is never hit more often than the given rate.
+
+Usage: $python -m src.data.fetch [input file] [cache dir] [workers]
+
+- input file: csv file with the metadata, containing a column called «enlace_pdf».
+- cache dir: directory where the PDFs are cached.
+- workers: number of concurrent downloads.
+'''
+
+import hashlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import monotonic, sleep
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# Status codes after which it makes sense to try again.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    '''
+    Creates a session whose connection pool is large enough for all the threads using it, so that connections are
+    reused instead of opened for every request.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+
+    return session
+
+
+class RateLimiter:
+    '''
+    Spaces the requests to the same host by at least 1 / rate seconds. It is shared by all the threads of a pool.
+    '''
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host: str):
+        # Reserve the next free slot for the host and sleep outside the lock until it arrives.
+        with self.lock:
+            now = monotonic()
+            slot = max(now, self.next_slot.get(host, 0))
+            self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            sleep(slot - now)
+
+
+class PDFCache:
+    '''
+    Content-addressed cache of PDFs keyed by URL. See the module docstring for the layout.
+    '''
+
+    def __init__(self, root: str = './tmp/pdfs'):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / 'index.tsv'
+        self.lock = threading.Lock()
+        self.index = {}
+
+        # Later lines win, so a URL that was downloaded again points to its latest content.
+        if self.index_path.exists():
+            with open(self.index_path, encoding='utf-8') as f:
+                for line in f:
+                    digest, _, url = line.rstrip('\n').partition('\t')
+                    if url:
+                        self.index[url] = digest
+
+    def blob(self, digest: str) -> Path:
+        return self.root / digest[:2] / f'{digest}.pdf'
+
+    def get(self, url: str):
+        '''Returns the path of the cached PDF for the URL, or None if it is not cached.'''
+        digest = self.index.get(url)
+        if digest is None:
+            return None
+
+        path = self.blob(digest)
+        return path if path.exists() else None
+
+    def put(self, url: str, content: bytes) -> Path:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob(digest)
+
+        # Identical PDFs behind different URLs are stored only once.
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f'{path.name}.{threading.get_ident()}.part')
+            tmp.write_bytes(content)
+            os.replace(tmp, path)
+
+        with self.lock:
+            self.index[url] = digest
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(f'{digest}\t{url}\n')
+
+        return path
+
+
+class Fetcher:
+    '''
+    Downloads PDFs concurrently into a PDFCache. Only the URLs that are not in the cache touch the network.
+
+    - cache_dir: directory of the cache.
+    - workers: number of concurrent downloads.
+    - rate: maximum number of requests per second to the same host.
+    - retries: number of attempts before giving up on a URL.
+    - backoff: seconds to wait after the first failed attempt, doubled after every further one.
+    - timeout: seconds to wait for the server before considering the attempt failed.
+    - session: optional session, e.g. pointing to a local stub server when testing.
+    '''
+
+    def __init__(self, cache_dir: str = './tmp/pdfs', workers: int = 8, rate: float = 4.0, retries: int = 5,
+                 backoff: float = 2.0, timeout: float = 60.0, session: requests.Session = None):
+        self.cache = PDFCache(cache_dir)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session if session is not None else make_session(workers)
+        self.limiter = RateLimiter(rate)
+
+    def download(self, url: str) -> bytes:
+        host = urlparse(url).netloc
+
+        for attempt in range(self.retries):
+            self.limiter.wait(host)
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+
+                if response.status_code == 200 and response.content[:4] == b'%PDF':
+                    return response.content
+
+                # Client errors other than throttling will not be fixed by trying again.
+                if response.status_code != 200 and response.status_code not in RETRY_STATUS:
+                    print(f'Error: PDF not downloaded ({response.status_code}): {url}')
+                    return None
+
+                print(f'Error: PDF not downloaded ({response.status_code}), attempt {attempt + 1}: {url}')
+
+            except requests.RequestException as e:
+                print(f'Error: PDF not downloaded ({type(e).__name__}), attempt {attempt + 1}: {url}')
+
+            if attempt < self.retries - 1:
+                sleep(self.backoff * 2 ** attempt)
+
+        return None
+
+    def fetch(self, url: str):
+        '''Returns the path to the PDF of the URL, downloading it if needed, or None if it could not be downloaded.'''
+        path = self.cache.get(url)
+        if path is not None:
+            return path
+
+        content = self.download(url)
+        if content is None:
+            return None
+
+        return self.cache.put(url, content)
+
+    def fetch_all(self, urls) -> dict:
+        '''Fetches all the unique URLs concurrently and returns a dictionary {url} : {path or None}.'''
+        urls = list(dict.fromkeys(urls))
+        missing = [url for url in urls if self.cache.get(url) is None]
+        print(f'{len(urls) - len(missing)} PDFs in cache, {len(missing)} to download.')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            paths = dict(zip(urls, pool.map(self.fetch, urls)))
+
+        return paths
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) == 4, 'Usage: python -m src.data.fetch [input file] [cache dir] [workers]'
+
+    input_file = sys.argv[1]
+    cache_dir = sys.argv[2]
+    workers = int(sys.argv[3])
+
+    data = pd.read_csv(input_file, usecols=['enlace_pdf'])
+    paths = Fetcher(cache_dir, workers).fetch_all(data['enlace_pdf'])
+
+    failed = sum(path is None for path in paths.values())
+    print(f'Finished fetching {len(paths)} PDFs ({failed} failed).')
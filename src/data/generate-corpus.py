@@ -1,43 +1,205 @@
 '''
-This script generates the corpus as a .csv file with the format [label, document].
+This script generates the corpus with the format [label, document], either as a memory-mapped corpus of token ids
+(see src/data/corpus.py) or as a .parquet (or .csv) file.
 
-The label is: '{political_group}-{legislature}'
+The dataset is read once and its tokens are encoded once; every requested level of aggregation (and time window) is
+then a selection of the encoded documents with its own labels, so several corpora cost little more than one. The
+levels of aggregation are:
 
-Usage: $python3 generate-corpus.py [input file] [output file]
+- pg-leg: '{political_group} L{legislature}', e.g. 'PP L7' (default).
+- pg-year: '{political_group} {year}', e.g. 'PP 2019'.
+- pg-month: '{political_group} {year}-{month}', e.g. 'PP 2019-03'.
+- mp: '{speaker} ({political_group})', e.g. 'SÁNCHEZ PÉREZ-CASTEJÓN, PEDRO (PSOE)'.
+- mp-year: '{speaker} ({political_group}) {year}'.
+- mp-leg: '{speaker} ({political_group}) L{legislature}'.
 
-- input file: csv file with entire dataset.
-- output file: path for the corpus to be saved.
+Usage: $python3 -m src.data.generate-corpus [input file] [output file] [parties (optional)] [levels (optional)]
+                                            [windows (optional)] [documents (optional)]
+
+- input file: .parquet or .csv file with entire dataset. Only the needed columns are read.
+- output file: path for the corpus to be saved. If it ends in .parquet or .csv, the corpus is saved as a dataset
+  (in .parquet files the documents are real lists of tokens); otherwise, as a directory with a memory-mapped corpus.
+  With several levels or windows, every corpus is saved in the directory output file/{name} (e.g. corpus/pg-year), or
+  as output file-{name}.parquet for datasets, where the name is the level, followed by the window if there are
+  several (e.g. pg-year_2016-01-01_2019-12-31).
+- parties: 'all' (default) keeps every political group; 'registered' only keeps the parties of the registry in
+  src/features/parties.py, in the legislatures in which they had a parliamentary group.
+- levels: comma-separated levels of aggregation, e.g. 'pg-leg,pg-year,mp' (default 'pg-leg').
+- windows: comma-separated date windows '{first date}:{last date}' (both included, either may be left empty), e.g.
+  '2016-01-01:2019-12-31,2020-01-01:', or 'all' (default) for the whole period.
+- documents: 'interventions' (default), one document per intervention, or 'concatenated', one document per label
+  with all its interventions one after the other (in the order of the dataset).
 
 '''
 
-# TODO: Implement other ways of generating corpus, e.g. by PG-Year, PG-month, MP, MP-Year, MP-Legislature, etc.
-# TODO? Implement a function to select time window.
+import os
+import sys
 
+import numpy as np
 import pandas as pd
-import sys
+import pyarrow as pa
+
+from src.data.corpus import encode, gather, save_corpus
+from src.data.dataset import read_lists, write_dataset
+from src.features.parties import map_categories, merge, valid
+from src.features.political_group import GROUP
+
+# Level of aggregation -> columns of its labels (and of its tag table).
+LEVELS = {
+    'pg-leg': ['political_group', 'legislatura'],
+    'pg-year': ['political_group', 'year'],
+    'pg-month': ['political_group', 'month'],
+    'mp': ['speaker', 'political_group'],
+    'mp-year': ['speaker', 'political_group', 'year'],
+    'mp-leg': ['speaker', 'political_group', 'legislatura'],
+}
+
+
+def parse_windows(windows: str) -> list:
+    '''Returns the list of (first, last) dates of the windows, with None for the open ends.'''
+    if windows == 'all':
+        return [(None, None)]
+
+    parsed = []
+    for window in windows.split(','):
+        assert ':' in window, f'The window {window} must be {{first date}}:{{last date}}.'
+        first, last = window.split(':', 1)
+        parsed.append((pd.Timestamp(first) if first else None, pd.Timestamp(last) if last else None))
+
+    return parsed
+
+
+def window_name(window: tuple) -> str:
+    first, last = window
+    return f'{first.date() if first is not None else ""}_{last.date() if last is not None else ""}'
+
+
+def add_columns(df: pd.DataFrame, levels: list) -> pd.DataFrame:
+    '''Adds the columns needed by the labels of the levels, computed once per distinct value.'''
+    columns = {c for level in levels for c in LEVELS[level]}
+
+    if 'year' in columns:
+        df['year'] = map_categories(df['fecha'], lambda f: str(f.year))
+    if 'month' in columns:
+        df['month'] = map_categories(df['fecha'], lambda f: f'{f.year}-{f.month:02d}')
+    if 'speaker' in columns:
+        df['speaker'] = map_categories(df['orador'].astype(str), lambda o: GROUP.sub('', o))
+
+    return df
+
+
+def labels_of(df: pd.DataFrame, level: str) -> pd.Series:
+    group = df['political_group'].astype(str)
+
+    if level.startswith('mp'):
+        label = df['speaker'].astype(str) + ' (' + group + ')'
+    else:
+        label = group
+
+    if level.endswith('-leg'):
+        label = label + ' L' + df['legislatura'].astype(str)
+    elif level.endswith('-year'):
+        label = label + ' ' + df['year'].astype(str)
+    elif level.endswith('-month'):
+        label = label + ' ' + df['month'].astype(str)
+
+    return label
+
+
+def output_path(output_file: str, name: str, single: bool) -> str:
+    if single:
+        return output_file
+
+    if output_file.endswith(('.parquet', '.csv')):
+        root, extension = os.path.splitext(output_file)
+        return f'{root}-{name}{extension}'
+
+    return os.path.join(output_file, name)
+
+
+def save(path: str, vocab: list, tokens: np.ndarray, offsets: np.ndarray, tags: pd.DataFrame):
+    if path.endswith(('.parquet', '.csv')):
+        words = pa.array(vocab, type=pa.string()).take(pa.array(tokens))
+        documents = pa.ListArray.from_arrays(pa.array(offsets), words)
+        df = tags.reset_index(drop=True)
+        df.insert(1, 'document', documents.to_pylist())
+        write_dataset(df, path)
+    else:
+        save_corpus(path, vocab, tokens, offsets, tags)
+
 
 def main():
-    assert len(sys.argv) == 3, 'Usage: python3 generate-corpus.py [input file] [output file]'
+    assert 3 <= len(sys.argv) <= 7, 'Usage: python3 -m src.data.generate-corpus [input file] [output file] ' \
+                                    '[parties (optional)] [levels (optional)] [windows (optional)] ' \
+                                    '[documents (optional)]'
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
+    parties = sys.argv[3] if len(sys.argv) > 3 else 'all'
+    levels = sys.argv[4].split(',') if len(sys.argv) > 4 else ['pg-leg']
+    windows = parse_windows(sys.argv[5]) if len(sys.argv) > 5 else [(None, None)]
+    documents = sys.argv[6] if len(sys.argv) > 6 else 'interventions'
+    assert parties in ('all', 'registered'), 'The parties must be all or registered.'
+    assert all(level in LEVELS for level in levels), f'The levels must be some of {", ".join(LEVELS)}.'
+    assert documents in ('interventions', 'concatenated'), 'The documents must be interventions or concatenated.'
+
+    # Read only the needed columns, once.
+    columns = ['political_group', 'legislatura', 'clean_text']
+    if windows != [(None, None)] or any(c in ('year', 'month') for level in levels for c in LEVELS[level]):
+        columns.append('fecha')
+    if any(level.startswith('mp') for level in levels):
+        columns.append('orador')
+
+    df, lists = read_lists(input_file, columns)
+    vocab, tokens, offsets = encode(lists['clean_text'])
+    print(f'Read {len(df)} interventions with {len(tokens)} tokens ({len(vocab)} distinct).')
+
+    # Remove NaNs and empty tokens (['nan'] comes from empty texts in .csv files).
+    lengths = np.diff(offsets)
+    keep = df.notna().all(axis=1).to_numpy() & (lengths > 0)
+    if 'nan' in vocab:
+        keep &= ~((lengths == 1) & (tokens[np.minimum(offsets[:-1], len(tokens) - 1)] == vocab.index('nan')))
+
+    if 'fecha' in df.columns:
+        df['fecha'] = pd.to_datetime(df['fecha'])
+
+    # Merge the groups left as raw codes into their parties.
+    df['political_group'] = merge(df['political_group'])
 
-    df = pd.read_csv(input_file)
+    if parties == 'registered':
+        keep &= valid(df['political_group'], df['legislatura']).to_numpy()
 
-    # We create a new column called 'political_group_legis' concatenating the content of two columns.
-    df['political_group_legislature'] = df['political_group'] + ' L' + df['legislatura'].astype(str)
+    df = add_columns(df, levels)
+    single = len(levels) == 1 and len(windows) == 1
 
-    # Keep only relevant columns.
-    df = df[['political_group_legislature', 'clean_text']]
+    for window in windows:
+        selected = keep.copy()
+        if window[0] is not None:
+            selected &= (df['fecha'] >= window[0]).to_numpy()
+        if window[1] is not None:
+            selected &= (df['fecha'] <= window[1]).to_numpy()
+        rows = np.flatnonzero(selected)
 
-    # Rename labels.
-    df.columns = ['label', 'document']
+        for level in levels:
+            name = level if len(windows) == 1 else f'{level}_{window_name(window)}'
+            tags = df.iloc[rows][LEVELS[level]].reset_index(drop=True)
+            tags.insert(0, 'label', labels_of(tags, level).to_numpy())
 
-    # Remove NaNs and empty tokens.
-    df = df.loc[df['document'] != "['nan']"].reset_index(drop=True)
-    df = df.dropna().reset_index(drop=True)
+            if documents == 'concatenated':
+                # The interventions of every label, one after the other, become a single document.
+                order = np.argsort(tags['label'].to_numpy(), kind='stable')
+                level_tokens, level_offsets = gather(tokens, offsets, rows[order])
+                tags = tags.iloc[order].reset_index(drop=True)
+                first = np.flatnonzero(np.r_[True, tags['label'].to_numpy()[1:] != tags['label'].to_numpy()[:-1]])
+                level_offsets = np.append(level_offsets[first], level_offsets[-1])
+                counts = np.diff(np.append(first, len(tags)))
+                tags = tags.iloc[first].reset_index(drop=True)
+                tags['interventions'] = counts
+            else:
+                level_tokens, level_offsets = gather(tokens, offsets, rows)
 
-    # Save to path.  
-    df.to_csv(output_file, index=False)
+            path = output_path(output_file, name, single)
+            save(path, vocab, level_tokens, level_offsets, tags)
+            print(f'{name}: {len(tags)} documents, {tags["label"].nunique()} labels. Saved in {path}.')
 
-main()
\ No newline at end of file
+main()
@@ -1,84 +1,375 @@
 '''
-This script uses Selenium to go to https://congreso.es and obtain all the interventions for a given period of time.
-There was no need to change the User Agent of the webdriver or use other anti-blocking techniques since the website
-allows scrapping. The sleep() methods are there to prevent the server from blocking the connection to the IP.
-'''
+This script obtains the metadata of all the interventions for a given period of time from https://congreso.es as the
+CSV files of the open-data export. The requests to the server are spaced to prevent it from blocking the connection to
+the IP. There are two clients of the search page of interventions:
+
+- browser (default): drives the page in Chrome with Selenium, running the scripts of the page (crearListado,
+  exportOpendata and downloadFile), as the harvest has always been done.
+- http (--http): calls the endpoints used by those scripts directly, with a pooled session and several pages of
+  results downloaded at the same time. The names of the resources and fields are kept in the constants below and have
+  not been checked against a recording of the website yet (the recording in data/harvest-stub is synthetic), so this
+  client is experimental.
+
+The period is split into windows. Since the website only allows exporting up to 1000 results per search, a window
+with more results is split in two halves until every window fits. The files are named after their window and page of
+results. After each window, a watermark with the last harvested date is stored in the output directory, so daily runs
+only fetch the new interventions plus OVERLAP days, since the Diario de Sesiones is sometimes published with delay.
+
+The windows of the overlap differ from those of the previous run, so the output directory holds the interventions of
+the overlap twice, under different names. The duplicates are not removed here: the directory has to be read with
+preprocess_metadata.py, which removes them (in the 'stream' mode, with deduplicate=True of concatenate.merge), or
+they have to be removed by whatever else reads it.
 
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
+The responses of the server to the http client can be recorded (see Recording) and replayed offline by a local stub
+server, to test the client without the website (see harvest_stub.py).
 
-from datetime import date, timedelta
+Usage: $python -m src.data.harvest [output dir] [since (optional)] [until (optional)]
+       $python -m src.data.harvest --http [output dir] [since (optional)] [until (optional)] [url (optional)]
+                                   [record dir (optional)]
+
+- output dir: directory where the CSV files and the watermark are saved.
+- since: first date to harvest (dd/mm/yyyy). By default, the day after the watermark minus the overlap.
+- until: last date to harvest (dd/mm/yyyy). By default, today.
+- url: URL of the search page (default URL), e.g. that of a stub server.
+- record dir: directory where every request and its response are recorded, to replay them with harvest_stub.py.
+'''
+
+import hashlib
+import json
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
+from pathlib import Path
 from time import sleep
+from urllib.parse import urlparse
+
+import requests
+
+from src.data.fetch import RateLimiter, make_session
+
+URL = 'https://www.congreso.es/busqueda-de-intervenciones'
+
+# Liferay parameters of the portlet of interventions.
+PORTLET = {'p_p_id': 'intervenciones', 'p_p_lifecycle': '2', 'p_p_state': 'normal', 'p_p_mode': 'view',
+           'p_p_cacheability': 'cacheLevelPage', '_intervenciones_statusOpenData': 'true'}
+COUNT_RESOURCE = 'filtrarListado'
+EXPORT_RESOURCE = 'exportarOpenData'
+
+# Maximum number of results that can be exported per search, and number of results per file.
+MAX_RESULTS = 1000
+PAGE_SIZE = 100
+
+# Days harvested again before the watermark.
+OVERLAP = 7
+
+# Seconds the browser waits for the results of a search and between scripts, and for a download at most.
+WAIT = 4
+PAUSE = 0.5
+DOWNLOAD_TIMEOUT = 60
+
+WATERMARK = 'watermark.json'
+
+
+class Recording:
+    '''
+    Responses of the server by request, in a directory with:
+
+    - index.jsonl: one line per request, with its resource, its fields, and the status, Content-Type and body file of
+      its response.
+    - bodies/{hash}.txt: the bodies of the responses, by the hash of their content.
+    '''
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.responses = {}
+        self.lock = threading.Lock()
+
+        index = self.path / 'index.jsonl'
+        if index.exists():
+            for line in index.read_text(encoding='utf-8').splitlines():
+                entry = json.loads(line)
+                self.responses[self.key(entry['resource'], entry['fields'])] = entry
+
+    @staticmethod
+    def key(resource: str, fields: dict) -> str:
+        return json.dumps([resource, fields], sort_keys=True)
+
+    def save(self, resource: str, fields: dict, response: requests.Response):
+        name = f'{hashlib.sha256(response.content).hexdigest()[:16]}.txt'
+        entry = {'resource': resource, 'fields': fields, 'status': response.status_code,
+                 'content_type': response.headers.get('Content-Type', ''), 'body': name}
+
+        with self.lock:
+            (self.path / 'bodies').mkdir(parents=True, exist_ok=True)
+            (self.path / 'bodies' / name).write_bytes(response.content)
+            with open(self.path / 'index.jsonl', 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.responses[self.key(resource, fields)] = entry
+
+    def find(self, resource: str, fields: dict):
+        '''Returns the status, Content-Type and body (bytes) of the recorded response, or None.'''
+        entry = self.responses.get(self.key(resource, fields))
+        if entry is None:
+            return None
+
+        return entry['status'], entry['content_type'], (self.path / 'bodies' / entry['body']).read_bytes()
+
+
+class Harvester:
+    '''
+    Splits a period into windows that can be exported, downloads their pages of results and keeps the watermark. The
+    clients implement count and download.
+
+    - output_dir: directory where the CSV files and the watermark are saved.
+    - workers: number of pages downloaded at the same time.
+    '''
+
+    def __init__(self, output_dir: str, workers: int = 1):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+
+    def count(self, since: date, until: date) -> int:
+        '''Returns the total number of results of the search.'''
+        raise NotImplementedError
 
-# We obtain the total amount of days to iterate over.
-d1 = date(2023, 1, 24)
-d2 = date(2023, 2, 5)
-delta = (d2 - d1).days
+    def download(self, since: date, until: date, first: int, total: int) -> Path:
+        '''Downloads the page of results starting at the result number first (from 1).'''
+        raise NotImplementedError
 
-period = 7 # Amount of days to iterate over.
+    def path(self, since: date, until: date, first: int) -> Path:
+        return self.output_dir / f'{since:%Y%m%d}-{until:%Y%m%d}-{first:04d}.csv'
 
-# Initialize the web driver and open the website.
-driver = webdriver.Chrome(ChromeDriverManager().install())
-driver.get("https://www.congreso.es/busqueda-de-intervenciones?p_p_id=intervenciones&_intervenciones_statusOpenData=true")
+    def windows(self, since: date, until: date):
+        '''Yields (since, until, total) for windows with at most MAX_RESULTS results, in chronological order.'''
+        total = self.count(since, until)
 
-for i in range(0, delta, period):
-    num = []
-    since = 0
-    until = 0
+        if total > MAX_RESULTS and since < until:
+            middle = since + (until - since) // 2
+            yield from self.windows(since, middle)
+            yield from self.windows(middle + timedelta(1), until)
+        elif total > MAX_RESULTS:
+            print(f'>{MAX_RESULTS} results on a single day: {since:%d/%m/%Y}. Only the first {MAX_RESULTS} are saved.')
+            yield since, until, MAX_RESULTS
+        else:
+            yield since, until, total
 
-    since = d1 + timedelta(i)
-    until = since + timedelta(period)
+    def harvest(self, since: date, until: date, period: int = 7) -> list:
+        '''Harvests the interventions between the two dates (both included) and returns the paths of the files.'''
+        paths = []
 
-    since = str(f'{since:%d/%m/%Y}')
-    until = str(f'{until:%d/%m/%Y}')
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            start = since
+            while start <= until:
+                end = min(start + timedelta(period - 1), until)
 
-    script_since = f"document.getElementById('_intervenciones_fecDesde').value = '{since}'"
-    script_until = f"document.getElementById('_intervenciones_fecHasta').value = '{until}'"
+                for window_since, window_until, total in self.windows(start, end):
+                    # Only download when there is something to download (one file per page of results).
+                    firsts = range(1, total + 1, PAGE_SIZE)
+                    download = partial(self.download, window_since, window_until, total=total)
+                    paths.extend(pool.map(download, firsts))
 
-    driver.execute_script("document.getElementById('_intervenciones_legislatura').selectedIndex = '0'")
+                    self.save_watermark(window_until)
+                    print(f'{total} results on dates since: {window_since:%d/%m/%Y}; until: {window_until:%d/%m/%Y}')
 
-    driver.execute_script(script_since)
+                start = end + timedelta(1)
 
-    sleep(0.5)
+        return paths
 
-    driver.execute_script(script_until)
+    def load_watermark(self):
+        path = self.output_dir / WATERMARK
+        if not path.exists():
+            return None
 
-    driver.execute_script("resetSavedSearchIntervenciones()")
+        return datetime.strptime(json.loads(path.read_text())['last_date'], '%Y-%m-%d').date()
 
-    driver.execute_script("crearListado(1, 1)")
+    def save_watermark(self, day: date):
+        # Never move the watermark backwards when harvesting an older period again.
+        current = self.load_watermark()
+        if current is not None and current >= day:
+            return
 
-    # Get the total number of results
-    # The structure of the text changes 
-    # depending on the size of the output
+        path = self.output_dir / WATERMARK
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'last_date': f'{day:%Y-%m-%d}'}))
+        tmp.replace(path)
 
-    sleep(4)
 
-    while len(num) == 0:
-        num = driver.find_element('id', '_intervenciones_resultsShowedIntervenciones')
-        num = num.text.split()
+def parse_count(text: str) -> int:
+    '''Total number of results in the text of _intervenciones_resultsShowedIntervenciones.'''
+    # The structure of the text changes depending on the size of the output.
+    num = text.split()
 
-    if len(num) < 3:
-        num = int(num[0])
+    if len(num) == 0:
+        return 0
+    elif len(num) < 3:
+        return int(num[0].replace('.', ''))
     else:
-        num = int(num[len(num) - 1])
+        return int(num[len(num) - 1].replace('.', ''))
 
-    if num > 1000:
-        print(f'<1000 results. On dates since: {since}; until: {until}')
 
-    # Only download when there is something to download.
-    if num != 0:
+class BrowserHarvester(Harvester):
+    '''
+    Harvests by driving the search page in Chrome. Chrome downloads the files into the output directory, where they are
+    renamed after their window.
 
-        # Export the results to CSV.
-        driver.execute_script("exportOpendata('csv')")
+    - output_dir: directory where the CSV files and the watermark are saved.
+    - url: URL of the search page.
+    '''
 
-        sleep(0.5)
+    def __init__(self, output_dir: str, url: str = URL):
+        # Only the browser client needs Selenium.
+        from selenium import webdriver
+        from webdriver_manager.chrome import ChromeDriverManager
 
-        for current in range(1, num, 100):
-            # Script with argument for downloading the specific page
+        # A single browser: the pages are downloaded one after another.
+        super().__init__(output_dir, workers=1)
 
-            download_script = f"downloadFile({current}, {num}, 'csv')"
+        options = webdriver.ChromeOptions()
+        options.add_experimental_option('prefs', {'download.default_directory': str(self.output_dir.resolve()),
+                                                  'download.prompt_for_download': False})
+        self.driver = webdriver.Chrome(ChromeDriverManager().install(), options=options)
+        self.driver.get(f'{url}?p_p_id=intervenciones&_intervenciones_statusOpenData=true')
+
+    def count(self, since: date, until: date) -> int:
+        self.driver.execute_script("document.getElementById('_intervenciones_legislatura').selectedIndex = '0'")
+        self.driver.execute_script(f"document.getElementById('_intervenciones_fecDesde').value = '{since:%d/%m/%Y}'")
+        sleep(PAUSE)
+        self.driver.execute_script(f"document.getElementById('_intervenciones_fecHasta').value = '{until:%d/%m/%Y}'")
+
+        self.driver.execute_script('resetSavedSearchIntervenciones()')
+        self.driver.execute_script('crearListado(1, 1)')
+        sleep(WAIT)
+
+        return parse_count(self.driver.find_element('id', '_intervenciones_resultsShowedIntervenciones').text)
+
+    def download(self, since: date, until: date, first: int, total: int) -> Path:
+        # The search of the window is the last one counted (windows yields a window right after counting it).
+        if first == 1:
+            self.driver.execute_script("exportOpendata('csv')")
+            sleep(PAUSE)
+
+        before = set(self.output_dir.glob('*.csv'))
+        self.driver.execute_script(f"downloadFile({first}, {total}, 'csv')")
+
+        # Wait for the new file, which Chrome names with a .crdownload suffix until it is complete.
+        waited = 0
+        while waited < DOWNLOAD_TIMEOUT:
+            sleep(PAUSE)
+            waited += PAUSE
+            new = set(self.output_dir.glob('*.csv')) - before
+            if new and not list(self.output_dir.glob('*.crdownload')):
+                return new.pop().replace(self.path(since, until, first))
+
+        raise TimeoutError(f'Download not finished after {DOWNLOAD_TIMEOUT} seconds: {since:%d/%m/%Y} - '
+                           f'{until:%d/%m/%Y}, result {first}')
+
+    def close(self):
+        self.driver.quit()
+
+
+class HttpHarvester(Harvester):
+    '''
+    Harvests by calling the endpoints of the search page directly (experimental, see the module description).
+
+    - output_dir: directory where the CSV files and the watermark are saved.
+    - url: URL of the search page, e.g. a local stub server when testing.
+    - workers: number of pages downloaded at the same time.
+    - rate: maximum number of requests per second to the server.
+    - retries: number of attempts before giving up on a request.
+    - backoff: seconds to wait after the first failed attempt, doubled after every further one.
+    - record: directory where the requests and their responses are recorded (see Recording), or None.
+    '''
+
+    def __init__(self, output_dir: str, url: str = URL, workers: int = 4, rate: float = 2.0, retries: int = 5,
+                 backoff: float = 2.0, session: requests.Session = None, record: str = None):
+        super().__init__(output_dir, workers)
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session if session is not None else make_session(workers)
+        self.limiter = RateLimiter(rate)
+        self.recording = Recording(record) if record is not None else None
+
+    def request(self, resource: str, fields: dict) -> str:
+        host = urlparse(self.url).netloc
+
+        for attempt in range(self.retries):
+            self.limiter.wait(host)
+            try:
+                response = self.session.post(self.url, params={**PORTLET, 'p_p_resource_id': resource},
+                                             data=fields, timeout=60)
+                response.raise_for_status()
+                if self.recording is not None:
+                    self.recording.save(resource, fields, response)
+
+                # Without a charset in the Content-Type, requests decodes text/* as ISO-8859-1, but the site is UTF-8.
+                if 'charset=' not in response.headers.get('Content-Type', '').lower():
+                    response.encoding = 'utf-8'
+                return response.text
+
+            except requests.RequestException as e:
+                print(f'Error: request failed ({type(e).__name__}), attempt {attempt + 1}: {resource} {fields}')
+                if attempt < self.retries - 1:
+                    sleep(self.backoff * 2 ** attempt)
+
+        raise ConnectionError(f'Request failed after {self.retries} attempts: {resource} {fields}')
+
+    @staticmethod
+    def search(since: date, until: date) -> dict:
+        # Every legislature, between the two dates (both included).
+        return {'_intervenciones_legislatura': '', '_intervenciones_fecDesde': f'{since:%d/%m/%Y}',
+                '_intervenciones_fecHasta': f'{until:%d/%m/%Y}'}
+
+    def count(self, since: date, until: date) -> int:
+        html = self.request(COUNT_RESOURCE, {**self.search(since, until), '_intervenciones_paginaActual': '1'})
+
+        found = re.search(r'id="_intervenciones_resultsShowedIntervenciones"[^>]*>([^<]*)<', html)
+        return parse_count(found.group(1) if found else '')
+
+    def download(self, since: date, until: date, first: int, total: int) -> Path:
+        fields = {**self.search(since, until), '_intervenciones_inicio': str(first),
+                  '_intervenciones_fin': str(min(first + PAGE_SIZE - 1, total)), '_intervenciones_total': str(total),
+                  '_intervenciones_formato': 'csv'}
+        text = self.request(EXPORT_RESOURCE, fields)
+
+        path = self.path(since, until, first)
+        path.write_text(text, encoding='utf-8')
+
+        return path
+
+
+if __name__ == '__main__':
+
+    http = '--http' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if arg != '--http']
+    assert 1 <= len(args) <= (5 if http else 3), \
+        'Usage: python -m src.data.harvest [output dir] [since (optional)] [until (optional)], or ' \
+        'python -m src.data.harvest --http [output dir] [since (optional)] [until (optional)] [url (optional)] ' \
+        '[record dir (optional)]'
+
+    if http:
+        url = args[3] if len(args) > 3 else URL
+        record = args[4] if len(args) > 4 else None
+        harvester = HttpHarvester(args[0], url, record=record)
+    else:
+        harvester = BrowserHarvester(args[0])
+
+    if len(args) > 1:
+        since = datetime.strptime(args[1], '%d/%m/%Y').date()
+    else:
+        watermark = harvester.load_watermark()
+        assert watermark is not None, 'There is no watermark in the output directory: the first date is needed.'
+        since = watermark + timedelta(1) - timedelta(OVERLAP)
 
-            # Run the script
-            driver.execute_script(download_script)
+    until = datetime.strptime(args[2], '%d/%m/%Y').date() if len(args) > 2 else date.today()
 
-            sleep(0.5)
+    try:
+        paths = harvester.harvest(since, until)
+    finally:
+        if not http:
+            harvester.close()
+    print(f'Finished harvesting {len(paths)} files.')
@@ -0,0 +1,94 @@
+'''
+Local stub of the search page of interventions of https://congreso.es, which replays the responses recorded by the
+http client of the harvester (see Recording in harvest.py), so it can be tested offline: the adaptive splitting of the
+windows, the pages and the encoding of the files are exercised against the recorded responses, without the website.
+A request that was not recorded gets a 404 and is reported.
+
+Running this script starts the stub with a recording, harvests a period from it into the output directory and checks
+the result: every request was recorded, the files hold as many interventions as the count of the whole period, every
+file is read by concatenate.py and the watermark is the last date.
+
+The recording in data/harvest-stub is synthetic: it was recorded from a local imitation of the portlet, with the
+resources and fields of harvest.py, for the period 01/02/2023 - 03/02/2023 (1020 results, split into windows of 900
+and 120). It checks the harvester against the format it expects, not against the website: recordings of the website
+are made with the record dir of harvest.py --http, and should replace it.
+
+Usage: $python -m src.data.harvest_stub [recording dir] [output dir] [since] [until]
+
+- recording dir: directory with the recorded responses, e.g. data/harvest-stub.
+- output dir: directory where the harvested CSV files and the watermark are saved.
+- since, until: period to harvest (dd/mm/yyyy), which must be that of the recording.
+'''
+
+import sys
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.data.concatenate import read_export
+from src.data.harvest import HttpHarvester, Recording
+
+
+class StubServer:
+    '''Serves the responses of a recording on a local port, in a thread. Use it as a context manager.'''
+
+    def __init__(self, recording: str, port: int = 0):
+        self.recording = Recording(recording)
+        self.missing = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                resource = parse_qs(urlparse(self.path).query).get('p_p_resource_id', [''])[0]
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                fields = {name: values[0] for name, values in parse_qs(body, keep_blank_values=True).items()}
+
+                found = stub.recording.find(resource, fields)
+                if found is None:
+                    stub.missing.append((resource, fields))
+                    self.send_error(404, 'Request not recorded')
+                    return
+
+                status, content_type, content = found
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/busqueda-de-intervenciones'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) == 5, 'Usage: python -m src.data.harvest_stub [recording dir] [output dir] [since] [until]'
+
+    since = datetime.strptime(sys.argv[3], '%d/%m/%Y').date()
+    until = datetime.strptime(sys.argv[4], '%d/%m/%Y').date()
+
+    with StubServer(sys.argv[1]) as stub:
+        # No retries nor waits: a request that was not recorded fails at once.
+        harvester = HttpHarvester(sys.argv[2], stub.url, rate=0, retries=1)
+        paths = harvester.harvest(since, until)
+        total = harvester.count(since, until)
+
+    assert not stub.missing, f'Requests not recorded: {stub.missing}'
+    rows = sum(len(chunk) for path in paths for chunk in read_export(str(path)))
+    assert rows == total, f'The files hold {rows} interventions, but the count of the period is {total}.'
+    assert harvester.load_watermark() == until, f'The watermark is {harvester.load_watermark()}, not {until}.'
+
+    print(f'Harvested {len(paths)} files with {rows} interventions from the stub. The harvester works offline.')
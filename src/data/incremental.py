@@ -0,0 +1,107 @@
+'''
+Incremental processing of the dataset of interventions. Every intervention is identified by a fingerprint: a hash of
+its date, «numero_expediente» and «orador», together with a hash of the rest of its columns (its text, once it has
+one) and a salt with the version of the processing (e.g. the parameters or the source code of the stage). A stage
+run in incremental mode only processes the rows whose fingerprint it has not seen, and merges them into its previous
+output:
+
+- new rows (e.g. a new plenary week) are processed and added;
+- changed rows get a new fingerprint, so they are processed again and their previous version is dropped;
+- rows no longer in the input are dropped from the output;
+- if nothing changed, nothing is processed and the output is not written again.
+
+The fingerprints already processed are kept next to the output, in {output file}.fingerprints (one per line), since
+a stage may drop some rows (e.g. those without text), which must not be processed again either. The output itself has
+a column «fingerprint» with the fingerprint of the input row of every output row.
+'''
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data.dataset import read_dataset, write_dataset
+
+KEY = ['fecha', 'numero_expediente', 'orador']
+
+
+def fingerprint(data: pd.DataFrame, salt: str = '') -> pd.Series:
+    '''Returns the fingerprint of every row as a hexadecimal string.'''
+    content = sorted(c for c in data.columns if c not in KEY and c != 'fingerprint')
+
+    # Columns as strings, so the fingerprints do not depend on the types read from .csv or .parquet files.
+    values = data[KEY + content].astype(str)
+    hashes = pd.util.hash_pandas_object(values, index=False, hash_key=hash_key(salt)).to_numpy()
+
+    return pd.Series([f'{h:016x}' for h in hashes.tolist()], index=data.index)
+
+
+def hash_key(salt: str) -> str:
+    # pandas takes a key of 16 bytes for its hashes.
+    return hashlib.sha256(salt.encode('utf-8')).hexdigest()[:16]
+
+
+def source_hash(*paths: str) -> str:
+    '''Hash of the content of some files (e.g. the source code of a stage), to be used as salt.'''
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+
+    return digest.hexdigest()[:16]
+
+
+def seen_path(output_file: str) -> str:
+    return f'{output_file}.fingerprints'
+
+
+def run_incremental(data: pd.DataFrame, output_file: str, process, salt: str = '', sort_by: str = None):
+    '''
+    Runs process (a function that takes a dataframe and returns it processed, keeping its columns) only on the rows of
+    data not processed yet, merges the result into output_file and saves it. The merged rows keep the order of data,
+    or are sorted by the column sort_by. Returns the merged dataframe and the number of rows processed.
+    '''
+    data = data.copy()
+    data['fingerprint'] = fingerprint(data, salt)
+    current = data['fingerprint'].to_numpy()
+
+    if os.path.exists(output_file) and os.path.exists(seen_path(output_file)):
+        seen = np.array(Path(seen_path(output_file)).read_text().split())
+        previous = read_dataset(output_file)
+    else:
+        seen = np.array([], dtype=str)
+        previous = None
+
+    new = ~np.isin(current, seen)
+    removed = ~np.isin(seen, current)
+    print(f'Incremental: {new.sum()} new or changed rows, {len(current) - new.sum()} unchanged, '
+          f'{removed.sum()} removed.')
+
+    if previous is not None and not new.any() and not removed.any():
+        return previous, 0
+
+    processed = process(data.loc[new].reset_index(drop=True))
+
+    if previous is not None:
+        # Keep the previous rows still in the input and not processed again.
+        keep = previous['fingerprint'].isin(current) & ~previous['fingerprint'].isin(current[new])
+        merged = pd.concat([previous.loc[keep], processed], ignore_index=True)
+    else:
+        merged = processed
+
+    if sort_by is not None:
+        merged = merged.sort_values(by=sort_by, kind='stable').reset_index(drop=True)
+    else:
+        # Position of the first row of data with every fingerprint.
+        positions = pd.Series(np.arange(len(current)), index=current)
+        positions = positions[~positions.index.duplicated()]
+        order = np.argsort(positions.loc[merged['fingerprint']].to_numpy(), kind='stable')
+        merged = merged.iloc[order].reset_index(drop=True)
+
+    write_dataset(merged, output_file)
+
+    # Written after the output, so an interrupted run processes the new rows again (and replaces them).
+    Path(seen_path(output_file)).write_text('\n'.join(np.unique(current)) + '\n')
+
+    return merged, int(new.sum())
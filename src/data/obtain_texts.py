@@ -4,104 +4,267 @@ of the Congreso de los Diputados in Spain. The script: (1) downloads the corresp
 the type of document, (3) cleans the text, (4) transforms it into a dictionary and merges interventions for the same day, topic
 and speaker, and finally (5) turns the interventions into a string that becomes the column feature 'text' in the dataframe.
 
-Usage: python obtain-texts.py [input file] [output file]
+The PDFs are downloaded concurrently before parsing and kept in a cache (see fetch.py), so re-runs do not download them again.
+Each PDF is parsed only once, and with several parse workers the PDFs (and the pages of long PDFs) are parsed in parallel.
+The parsed sessions are kept in a cache by URL (see parse_cache.py), so later runs do not parse them again. Step (4) is done
+by the segmentation engine in segment.py; text2dict is kept as the reference implementation.
+
+In the incremental mode, only the interventions that are new or changed since the last run get their text, and they
+are merged into the existing output file (see src/data/incremental.py). A change of the parser processes all of them
+again.
+
+Usage: python -m src.data.obtain_texts [input file] [output file] [download workers] [parse workers] [mode]
+
+- download workers: optional, number of concurrent downloads (default 8).
+- parse workers: optional, number of processes parsing PDFs (default 1, i.e. no pool).
+- mode: optional, 'full' (default) or 'incremental'.
 '''
 
+import hashlib
+import inspect
 import pandas as pd
 import pdfplumber
-import requests
+from pdfplumber import utils
 import re
 from timeit import default_timer as timer
 import sys
-from pathlib import Path
-from time import sleep
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-# Function to download a PDF file given an url and leave it in a temporary directory.
-def download_pdf(url, path='./tmp/temp.pdf'):
-    session_obj = requests.Session()
+from src.data.fetch import Fetcher
+from src.data.incremental import run_incremental
+from src.data.parse_cache import ParseCache
+from src.data import segment as segment_module
+from src.data.segment import SpeakerIndex, segment
+
+# Areas of the page with the text itself, as ratios (x0, top, x1, bottom) of the width and height of the page.
+SINGLE_COLUMN = [(0, 0.12, 0.90, 0.93)]
+TWO_COLUMNS = [(0, 0.08, 0.5, 0.93), (0.50, 0.08, 0.95, 0.93)]
+
+# A line of text is a header or a footer if it is repeated, at the same height and but for its numbers, on at least
+# REPEATED of the pages extracted together, and there are at least MIN_PAGES of them to tell.
+REPEATED = 0.6
+MIN_PAGES = 3
 
-    # Tries to download the PDF. If error, waits 2 seconds and tries again.
-    downloaded = False
-    while not downloaded:
-        try:
-            response = session_obj.get(url, headers={"User-Agent": "Mozilla/5.0"})
-            downloaded = True
-        except:
-            print('Error: PDF not downloaded')
-            sleep(2)
 
-    f = response.content
+def layout(legislature, date):
+    '''
+    Returns the areas to crop from each page and the number of trailing pages to skip, depending on the format of the
+    Diario de Sesiones for the legislature and date. Returns (None, 0) if the format is not supported.
+    '''
+    date = datetime.strptime(date, '%Y-%m-%d')
+
+    # The change happened on pause between periodos de sesiones in the summmer of 2012.
+    if legislature > 10 or (legislature == 10 and date > datetime.strptime('2012-08-01', '%Y-%m-%d')):
+        # The new format applies.
+        return SINGLE_COLUMN, 0
 
-    # Putting the file in a temporary directory.
-    filename = Path(path)
-    filename.write_bytes(f)
+    elif legislature > 6:
+        # The old format applies, in two columns. The last page is not part of the session.
+        return TWO_COLUMNS, 1
 
+    return None, 0
 
-def pdf2text(legislature, date, path='./tmp/temp.pdf'):
+
+def count_pages(path):
     with pdfplumber.open(path) as pdf:
-        text = "" # Temporary string where all text goes.
-        tp = len(pdf.pages) # Total number of pages.
-        start = timer()
-        date = datetime.strptime(date, '%Y-%m-%d')
-
-        if legislature > 10:
-            for i in range(tp):
-                page = pdf.pages[i]
-                # Crop the area of the page corresponding to the text itself.
-                page = page.crop((0, 0.12 * float(page.height), 0.90 * float(page.width), 0.93 * float(page.height)))
-
-                # Extract the text from the selected area.
-                new_text = page.extract_text() + '\n'
-                
-                text += new_text
-
-        elif legislature > 6 and legislature < 10:
-            for i in range(tp-1):
-                page = pdf.pages[i]
-                # Crop the area of the page corresponding to the text itself.
-                left_half = page.crop((0, 0.08 * float(page.height), 0.5 * float(page.width), 0.93 * float(page.height)))
-                right_half = page.crop((0.50 * float(page.width), 0.08 * float(page.height), 0.95 * float(page.width), 0.93 * float(page.height)))
-
-                # Extract the text from the selected area.
-                new_text = left_half.extract_text() + '\n'
-                new_text += right_half.extract_text() + '\n'
-                text += new_text
-
-        elif legislature == 10:
-            # The change happened on pause between periodos de sesiones in the summmer of 2012.
-            if date > datetime.strptime('2012-08-01', '%Y-%m-%d'):
-                # The new format applies.
-                for i in range(tp):
-                    page = pdf.pages[i]
-                    # Crop the area of the page corresponding to the text itself.
-                    page = page.crop((0, 0.12 * float(page.height), 0.90 * float(page.width), 0.93 * float(page.height)))
-
-                    # Extract the text from the selected area.
-                    new_text = page.extract_text() + '\n'
-
-                    text += new_text
+        return len(pdf.pages)
 
-            else:
-                # The old format applies.
-                for i in range(tp-1):
-                    page = pdf.pages[i]
-                    # Crop the area of the page corresponding to the text itself.
-                    left_half = page.crop((0, 0.08 * float(page.height), 0.5 * float(page.width), 0.93 * float(page.height)))
-                    right_half = page.crop((0.50 * float(page.width), 0.08 * float(page.height), 0.95 * float(page.width), 0.93 * float(page.height)))
-
-                    # Extract the text from the selected area.
-                    new_text = left_half.extract_text() + '\n'
-                    new_text += right_half.extract_text() + '\n'
-                    text += new_text
-        
+
+def split_chars(page, boxes):
+    '''
+    Assigns every character of the page to the box (column) it falls into, reading the characters of the page once.
+    Characters outside every box (header, footer and margins) are left out, and the ones crossing the border of their
+    box are clipped to it, exactly as page.crop() does. Returns the characters of each box, or None if the page cannot
+    be classified because a character falls into more than one box.
+    '''
+    buckets = [[] for _ in boxes]
+
+    for char in page.chars:
+        found = None
+
+        for i, (x0, top, x1, bottom) in enumerate(boxes):
+            if char['x0'] <= x1 and char['x1'] >= x0 and char['top'] <= bottom and char['bottom'] >= top:
+                if found is not None:
+                    return None
+                found = i
+
+        if found is None:
+            continue
+
+        x0, top, x1, bottom = boxes[found]
+        if char['x0'] >= x0 and char['x1'] <= x1 and char['top'] >= top and char['bottom'] <= bottom:
+            buckets[found].append(char)
         else:
-            print('Warning: Invalid legislature. The code only supports scrapping form legislature 7 onwards.')
+            clipped = utils.clip_obj(char, boxes[found])
+            if clipped is not None:
+                buckets[found].append(clipped)
+
+    return buckets
+
+
+def body_region(pages):
+    '''
+    Returns the top and bottom of the body of the pages, between their headers and their footers: the lines of text
+    (characters grouped by their top) repeated on at least REPEATED of the pages at the same height, with their
+    numbers (e.g. of the page) left aside, in the upper or the lower half of the page. Either is None when there is no
+    such line, or when there are fewer than MIN_PAGES pages.
+    '''
+    if len(pages) < MIN_PAGES:
+        return None, None
+
+    found = {}
+    for page in pages:
+        lines = set()
+        for line in utils.cluster_objects(page.chars, 'top', 1):
+            text = re.sub(r'\d+', '#', ''.join(char['text'] for char in sorted(line, key=lambda char: char['x0'])))
+            lines.add((round(min(char['top'] for char in line)), round(max(char['bottom'] for char in line)),
+                       text.strip()))
+        for line in lines:
+            found[line] = found.get(line, 0) + 1
+
+    middle = float(pages[0].height) / 2
+    repeated = [(top, bottom) for (top, bottom, text), n in found.items() if text and n >= REPEATED * len(pages)]
+    headers = [bottom for top, bottom in repeated if bottom < middle]
+    footers = [top for top, bottom in repeated if top > middle]
+
+    # A point of margin, since the heights are rounded.
+    return (max(headers) + 1 if headers else None), (min(footers) - 1 if footers else None)
+
+
+def extract_pages(path, areas, first, last, backend='chars'):
+    '''
+    Extracts the text of the pages [first, last) of the PDF, cropping the given areas of every page in order.
+
+    - backend: 'chars' to split the characters of each page into the areas in a single pass, with the body region
+      between the headers and footers found on the pages (see body_region) instead of the top and bottom of the areas,
+      which are kept when there are none, and falling back to cropping that body region for the pages that cannot be
+      split; 'crop' to crop each area and extract its text separately.
+    '''
+    text = "" # Temporary string where all text goes.
+
+    with pdfplumber.open(path) as pdf:
+        pages = [pdf.pages[i] for i in range(first, last)]
+        header, footer = body_region(pages) if backend == 'chars' else (None, None)
+
+        for page in pages:
+            width = float(page.width)
+            height = float(page.height)
+            boxes = [(x0 * width, top * height, x1 * width, bottom * height) for x0, top, x1, bottom in areas]
+
+            buckets = None
+            if backend == 'chars':
+                boxes = [(x0, top if header is None else header, x1, bottom if footer is None else footer)
+                         for x0, top, x1, bottom in boxes]
+                buckets = split_chars(page, boxes)
+
+            if buckets is not None:
+                for chars in buckets:
+                    text += utils.extract_text(chars) + '\n'
+            else:
+                for box in boxes:
+                    # Crop the area of the page corresponding to the text itself and extract the text from it.
+                    text += page.crop(box).extract_text() + '\n'
+
+    return text
+
+
+def pdf2text(legislature, date, path, backend='chars'):
+    start = timer()
+    areas, skip = layout(legislature, date)
+
+    if areas is None:
+        print('Warning: Invalid legislature. The code only supports scrapping form legislature 7 onwards.')
+        return ""
+
+    text = extract_pages(path, areas, 0, count_pages(path) - skip, backend)
 
     end = timer()
     print(f'Time for PDF2Text extract_text(): {end - start} seconds')
     return text
 
+
+def _try(function, *args):
+    # Exceptions are returned instead of raised so that one broken PDF does not stop the whole pool.
+    try:
+        return function(*args)
+    except Exception as e:
+        return e
+
+
+def parse_pdfs(jobs, workers=1, pages_per_task=32, backend='chars'):
+    '''
+    Extracts the text of several PDFs and yields (key, text) in the same order as the jobs, with text = None if the PDF
+    could not be parsed. Each job is a tuple (key, legislature, date, path). The backend is passed to extract_pages.
+
+    With workers > 1 the PDFs are spread across a pool of processes, and PDFs longer than pages_per_task are split
+    into chunks of pages that are parsed in parallel and joined back in page order. The number of tasks in flight is
+    bounded, so only a few PDFs are held in memory at once.
+    '''
+    if workers <= 1:
+        for key, legislature, date, path in jobs:
+            text = _try(pdf2text, legislature, date, path, backend) if path is not None else None
+            yield key, (None if isinstance(text, Exception) else text)
+        return
+
+    start = timer()
+    parsed = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = list(jobs)
+        paths = [path for _, _, _, path in jobs]
+
+        # Counting pages is cheap compared with extracting the text, and it is needed to split the PDFs.
+        counts = pool.map(_try, [count_pages] * len(paths), [p for p in paths if p is not None], chunksize=8)
+        counts = iter(counts)
+
+        pending = deque()
+        in_flight = 0
+
+        for key, legislature, date, path in jobs:
+            areas, skip = layout(legislature, date)
+            futures = None
+
+            if path is not None:
+                count = next(counts)
+                if areas is None:
+                    print('Warning: Invalid legislature. The code only supports scrapping form legislature 7 onwards.')
+                    futures = []
+                elif not isinstance(count, Exception):
+                    futures = [pool.submit(_try, extract_pages, path, areas, first,
+                                           min(first + pages_per_task, count - skip), backend)
+                               for first in range(0, count - skip, pages_per_task)]
+
+            pending.append((key, futures))
+            in_flight += len(futures or [])
+
+            # Yield the finished PDFs at the head of the queue before submitting more work.
+            while pending and (in_flight > 4 * workers or all(f.done() for f in pending[0][1] or [])):
+                key, futures = pending.popleft()
+                in_flight -= len(futures or [])
+                parsed += 1
+                yield key, _join(futures)
+
+        while pending:
+            key, futures = pending.popleft()
+            parsed += 1
+            yield key, _join(futures)
+
+    end = timer()
+    print(f'Time for parsing {parsed} PDFs with {workers} workers: {end - start} seconds')
+
+
+def _join(futures):
+    if futures is None:
+        return None
+
+    chunks = [f.result() for f in futures]
+    if any(isinstance(chunk, Exception) for chunk in chunks):
+        return None
+
+    return ''.join(chunks)
+
 def cleantext(text):
 
     # Sanitize "\u2002" by changing them for " ".
@@ -205,48 +368,83 @@ def text2dict(cleaned):
 
     return dic
 
-def obtain_texts(data):
-    texts = []
-    previous_url = ''
-
-    for row in range(len(data)):
-        # The speaker's surname, topic id and url of the intervention.
-        surname = data.loc[row]['orador'].split(',')[0].lower()
-        topic = data.loc[row]['numero_expediente'][0:10]
-        url = data.loc[row]['enlace_pdf']
-        legislature = data.loc[row]['legislatura']
-        date = data.loc[row]['fecha']
-
-        if url != previous_url:
-            # Perform all the necessary steps.
-            download_pdf(url)
-        
-            try:
-                pdf_text = pdf2text(legislature, date)
-            except:
-                # In case the PDF cannot be parsed, a log is printed, the next pdf url is downloaded
-                # and the text ends up being empty for that intervention.
-                pdf_text = ''
-                print(f'Error parsing PDF in row: {row}')
-                previous_url = ''
+def parser_version():
+    '''
+    Version of the parser used to invalidate the parse cache: a hash of the source of every function that determines
+    the parsed sessions (including the segmentation engine), together with the version of pdfplumber. Any change to
+    them invalidates the cached sessions.
+    '''
+    functions = [layout, split_chars, body_region, extract_pages, pdf2text, cleantext]
+    source = ''.join(inspect.getsource(f) for f in functions) + repr((SINGLE_COLUMN, TWO_COLUMNS, REPEATED, MIN_PAGES))
+    source += inspect.getsource(segment_module)
+    source += pdfplumber.__version__
+
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
 
-            cleaned = cleantext(pdf_text)
-            processed = text2dict(cleaned)
-            previous_url = url
 
-        count = 0
-        text = ''
+def find_intervention(index, topic, surname, row):
+    speakers = index.speakers(topic, surname)
 
-        if topic in processed.keys():
-            for item in processed[topic].keys():
-                if surname in item.lower():
-                    text = processed[topic][item]
-                    count += 1
+    # Making sure there are no duplicates in the interventions.
+    if len(speakers) > 1: print(f'A speaker appeared two times in row {row}')
 
-        # Making sure there are no duplicates in the interventions.
-        if count > 1: print(f'A speaker appeared two times in row {row}')
+    return index.lookup(topic, surname)
 
-        texts.append(text)
+
+def obtain_texts(data, fetcher=None, workers=1, cache=None):
+    texts = [''] * len(data)
+
+    if cache is None:
+        cache = ParseCache(version=parser_version())
+
+    # Rows of each PDF, in order of first appearance. Each PDF is parsed once, taking the legislature and date from
+    # its first row, and its parsed session is kept in the cache for any later row or run.
+    rows_by_url = data.groupby('enlace_pdf', sort=False).indices
+
+    def assign(url, processed):
+        index = SpeakerIndex(processed)
+
+        for row in rows_by_url[url]:
+            # The speaker's surname and topic id of the intervention.
+            surname = data.loc[row]['orador'].split(',')[0]
+            topic = data.loc[row]['numero_expediente'][0:10]
+
+            texts[row] = find_intervention(index, topic, surname, row)
+
+    missing = []
+    for url in rows_by_url:
+        processed = cache.get(url)
+        if processed is None:
+            missing.append(url)
+        else:
+            assign(url, processed)
+
+    print(f'{len(rows_by_url) - len(missing)} parsed sessions in cache, {len(missing)} to parse.')
+
+    # Download all the PDFs that are not parsed yet before parsing them.
+    if fetcher is None:
+        fetcher = Fetcher()
+    paths = fetcher.fetch_all(missing)
+
+    jobs = [(url, data.loc[rows_by_url[url][0]]['legislatura'], data.loc[rows_by_url[url][0]]['fecha'], paths[url])
+            for url in missing]
+
+    for url, pdf_text in parse_pdfs(jobs, workers):
+        failed = pdf_text is None
+
+        if failed:
+            # In case the PDF cannot be downloaded or parsed, a log is printed, the next pdf url is processed
+            # and the text ends up being empty for its interventions. The failure is not cached.
+            pdf_text = ''
+            print(f'Error parsing PDF in rows: {rows_by_url[url].tolist()}')
+
+        cleaned = cleantext(pdf_text)
+        processed = segment(cleaned).to_dict()
+
+        if not failed:
+            cache.put(url, processed)
+
+        assign(url, processed)
 
     return texts
 
@@ -254,14 +452,27 @@ def obtain_texts(data):
 if __name__ == '__main__':
     # Import data.
 
-    assert len(sys.argv) == 3, 'Usage: python obtain-texts.py [input file] [output file]'
+    assert 3 <= len(sys.argv) <= 6, 'Usage: python -m src.data.obtain_texts [input file] [output file] ' \
+                                    '[download workers (optional)] [parse workers (optional)] [mode (optional)]'
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
+    download_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    parse_workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    mode = sys.argv[5] if len(sys.argv) > 5 else 'full'
+    assert mode in ('full', 'incremental'), 'The mode must be full or incremental.'
 
     data = pd.read_csv(input_file)
-    texts = obtain_texts(data)
-    data['text'] = texts
-    data.to_csv(output_file, index=False)
+    fetcher = Fetcher(workers=download_workers)
+
+    def add_texts(data):
+        data['text'] = obtain_texts(data, fetcher, parse_workers)
+        return data
+
+    if mode == 'incremental':
+        run_incremental(data, output_file, add_texts, salt=parser_version())
+    else:
+        data = add_texts(data)
+        data.to_csv(output_file, index=False)
 
     print('Succesfully extracted texts!')
@@ -0,0 +1,76 @@
+'''
+Persistent cache of parsed sessions for obtain_texts.py. It maps the URL of each PDF of the Diario de Sesiones to the
+dictionary {topic} : {{speaker} : {text}} returned by text2dict, so that any row, in any order and in any later run,
+gets its intervention without downloading or parsing the PDF again.
+
+The entries are stored as zlib-compressed JSON in a single SQLite file. Each entry records the version of the parser
+that produced it, and entries from other versions are dropped when the cache is opened. When the stored size goes over
+the given limit, the least recently used entries are evicted.
+'''
+
+import json
+import sqlite3
+import zlib
+from pathlib import Path
+from time import time
+
+
+class ParseCache:
+    '''
+    - path: SQLite file of the cache.
+    - version: version of the parser. Entries with a different version are discarded.
+    - max_bytes: maximum size of the compressed entries before evicting the least recently used ones.
+    '''
+
+    def __init__(self, path: str = './tmp/parsed.sqlite', version: str = '', max_bytes: int = 2 * 1024 ** 3):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        self.max_bytes = max_bytes
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS sessions (url TEXT PRIMARY KEY, version TEXT, size INTEGER, '
+                        'accessed REAL, data BLOB)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)')
+
+        # Stale entries were produced by another version of pdf2text / text2dict.
+        stale = self.db.execute('DELETE FROM sessions WHERE version != ?', (version,)).rowcount
+        self.db.commit()
+        if stale > 0:
+            print(f'Dropped {stale} parsed sessions from an older parser version.')
+
+    def __contains__(self, url: str) -> bool:
+        return self.db.execute('SELECT 1 FROM sessions WHERE url = ?', (url,)).fetchone() is not None
+
+    def get(self, url: str):
+        '''Returns the parsed session of the URL, or None if it is not cached.'''
+        row = self.db.execute('SELECT data FROM sessions WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+
+        self.db.execute('UPDATE sessions SET accessed = ? WHERE url = ?', (time(), url))
+        self.db.commit()
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url: str, processed: dict):
+        data = zlib.compress(json.dumps(processed, ensure_ascii=False).encode('utf-8'), 6)
+
+        self.db.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)',
+                        (url, self.version, len(data), time(), data))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM sessions').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Delete from the least recently used entry until the cache fits again.
+        for url, size in self.db.execute('SELECT url, size FROM sessions ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM sessions WHERE url = ?', (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        self.db.close()
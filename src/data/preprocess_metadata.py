@@ -14,7 +14,16 @@ The script:
 7. Eliminates NaNs.
 8. Replaces the roman numbers for legislature.
 
-Usage: $python preprocess_metadata.py [directory with files] [output file]
+The files can be the by-legislature files or the weekly exports of harvest.py: they are read with the functions of
+concatenate.py, which detect the delimiter and repair the "; " of the files delimited with semicolons without
+modifying them. In the 'stream' mode, the files are processed in chunks and in parallel, and the output is written
+as it is produced, so the memory used does not grow with the number of exports.
+
+Usage: $python -m src.data.preprocess_metadata [directory with files] [output file] [mode (optional)]
+                                               [workers (optional)]
+
+- mode: 'memory' (default), which loads all the files and sorts the whole output, or 'stream'.
+- workers: number of files processed at the same time in the 'stream' mode (default: number of CPUs).
 
 '''
 
@@ -22,6 +31,9 @@ import pandas as pd
 import os
 import glob
 import re
+import sys
+
+from src.data.concatenate import CHUNKSIZE, merge, read_export
 
 
 # Eliminate around 15 rows in L03 that are missplaced.
@@ -38,27 +50,19 @@ ERRORS_L4 = ['COMPARECENCIA DE AUTORIDADES Y FUNCIONARIOS EN COMISION.',
              'COMPARECENCIA DEL GOBIERNO EN COMISION (ART. 44).']
 
 
-def preprocess(dir: str) -> pd.DataFrame:
-    os.chdir(f'./{dir}')
+COLUMNS = ['legislatura', 'fecha', 'objeto_iniciativa', 'numero_expediente', 'autores', 'nombre_sesion', 'orador',
+           'enlace_pdf']
 
-    # Get all the file names.
-    filenames = [i for i in glob.glob('*.csv')]
-
-    files = []
-    for i in range(0, len(filenames)):
-        files.append(pd.read_csv(filenames[i]))
-
-    # Concatenate all files in one.
-    data = pd.concat(files) 
 
+def clean(data: pd.DataFrame) -> pd.DataFrame:
+    '''Steps 2 to 8 for a part of the metadata, except the removal of duplicates across parts.'''
     # Keep only useful fields.
-    data = data[['legislatura', 'fecha', 'objeto_iniciativa',
-                 'numero_expediente', 'autores', 'nombre_sesion',
-                 'orador', 'enlace_pdf']]
+    data = data[COLUMNS]
 
     # Eliminate around 15 rows in L03 that are missplaced and others in L04.
-    data = data.drop(data.loc[data['fecha'].isin(ERRORS_L3)].index)
-    data = data.drop(data.loc[data['legislatura'].isin(ERRORS_L4)].index)
+    # (Filtered with masks: the index of the concatenated files is not unique.)
+    data = data.loc[~data['fecha'].isin(ERRORS_L3)]
+    data = data.loc[~data['legislatura'].isin(ERRORS_L4)]
 
     # Eliminating 2 rows in L06 that are missplaced.
     data = data.loc[(data['fecha'] != 'Pregunta-Contestación')]
@@ -70,8 +74,8 @@ def preprocess(dir: str) -> pd.DataFrame:
     # drop duplicates.
     data = data.astype({'enlace_pdf': 'string'})
     data['enlace_pdf'] = data['enlace_pdf'].str.replace(
-        r'\#page=[\d]{1,3}', '')
-    
+        r'\#page=[\d]{1,3}', '', regex=True)
+
     # Remove duplicates.
     data = data.sort_values(by=['fecha', 'enlace_pdf']
                             ).drop_duplicates().reset_index(drop=True)
@@ -83,7 +87,6 @@ def preprocess(dir: str) -> pd.DataFrame:
     # these are irrelevant.
     data = data[data['objeto_iniciativa'].str.contains(
         'Constitución de la Comisión') == False].reset_index(drop=True)
-    
 
     # Substitute roman numbers for integers values.
     data['legislatura'] = data['legislatura'].replace(
@@ -93,15 +96,48 @@ def preprocess(dir: str) -> pd.DataFrame:
 
     return data
 
+
+def preprocess(dir: str) -> pd.DataFrame:
+    # Get all the file names.
+    filenames = sorted(glob.glob(os.path.join(dir, '*.csv')))
+
+    files = []
+    for i in range(0, len(filenames)):
+        files.append(pd.concat(read_export(filenames[i], usecols=COLUMNS)))
+
+    # Concatenate all files in one.
+    data = pd.concat(files, ignore_index=True)
+
+    return clean(data)
+
+
+def preprocess_stream(dir: str, output_file: str, workers: int = None, chunksize: int = CHUNKSIZE) -> int:
+    '''
+    Same as preprocess, but streaming the files in chunks (several files at the same time) straight into output_file,
+    so the memory used stays flat however many exports there are. The rows are sorted by date and PDF link within
+    each chunk, and the duplicates are removed across all the files. Returns the number of rows written.
+    '''
+    filenames = sorted(glob.glob(os.path.join(dir, '*.csv')))
+
+    return merge(filenames, output_file, workers=workers, chunksize=chunksize, usecols=COLUMNS, transform=clean,
+                 deduplicate=True)
+
+
 if __name__ == '__main__':
 
-    assert len(
-        sys.argv) == 3, 'Usage: python preprocess_metadata.py [directory with files] [output file]'
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m src.data.preprocess_metadata [directory with files] ' \
+                                    '[output file] [mode (optional)] [workers (optional)]'
 
     dir = sys.argv[1]
     output_file = sys.argv[2]
-
-    data = preprocess(dir)
-    data.to_csv(f'../{output_file}', index=False)
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'memory'
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    assert mode in ('memory', 'stream'), 'The mode must be memory or stream.'
+
+    if mode == 'stream':
+        preprocess_stream(dir, output_file, workers)
+    else:
+        data = preprocess(dir)
+        data.to_csv(output_file, index=False)
 
     print('Finished pre-processing metadata.')
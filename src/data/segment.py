@@ -0,0 +1,138 @@
+'''
+Segmentation engine for the texts of the Diario de Sesiones. It replaces the chain of re.split calls of text2dict in
+obtain_texts.py: the transcript is tokenised once into topic and speaker spans, which are offsets into the original
+text, and the texts are only materialised when the dictionary {topic} : {{speaker} : {text}} is built. The output of
+Session.to_dict() is the same as the output of text2dict.
+
+The module also provides a speaker index to find the intervention of a speaker in a topic with a hash lookup instead
+of scanning every speaker of the topic with a substring search.
+'''
+
+import re
+import unicodedata
+
+# Title of a topic: capitalized words ending with the file number, which is the id of the topic. Same as text2dict.
+TOPIC = re.compile(
+    r'[—–\-A-Z /\n,.\d?¿:;!¡ÑÇÁÉÍÓÚÜÀÈÌÒÙ)(]{30,1000}\([NúÚmMeErRoOdDxXpPiInNtT \n]{21,26}([\d]{3}/[\d]{6})[\).]{0,2}'
+    r'[\n]{0,4}')
+
+# Start of an intervention, e.g. 'El señor RAJOY BREY:'. Same as text2dict.
+SPEAKER = re.compile(
+    r'[ ]{0,3}[ElLa]{2} señor[\w]{0,1} [A-ZÑÁÉÍÓÚÜÀÈÌÒÙÇ\n\-, ]{2,150}[() A-Za-zñáéíóúüàèìòùç\-\n,]{0,50}:')
+
+# Longest sequence of words of a speaker label that can be looked up in the index.
+MAX_NGRAM = 8
+
+
+def _normalise(text: str) -> str:
+    # Newlines become spaces, then double spaces and a leading and trailing space are removed, as in text2dict.
+    text = text.replace('\n', ' ').replace('  ', ' ')
+
+    if text[:1] == ' ':
+        text = text[1:]
+    if text[-1:] == ' ':
+        text = text[:-1]
+
+    return text
+
+
+class Session:
+    '''
+    A segmented session. topics maps the id of each topic to the list of its interventions, in order, as tuples of
+    offsets (speaker start, speaker end, text start, text end) into text. A topic that is discussed several times in
+    the session (e.g. debate and voting) keeps all its interventions under the same id.
+    '''
+
+    def __init__(self, text: str, topics: dict):
+        self.text = text
+        self.topics = topics
+
+    def interventions(self, topic: str):
+        '''Yields (speaker, text) for every intervention of the topic, before merging them by speaker.'''
+        spans = self.topics.get(topic, [])
+
+        for i, (speaker_start, speaker_end, text_start, text_end) in enumerate(spans):
+            speaker = _normalise(self.text[speaker_start:speaker_end])
+            text = self.text[text_start:text_end]
+
+            # text2dict leaves the last intervention of each topic as it is.
+            if i < len(spans) - 1:
+                text = _normalise(text)
+
+            yield speaker, text
+
+    def to_dict(self) -> dict:
+        '''Returns the dictionary {topic} : {{speaker} : {text}}, merging the interventions by speaker.'''
+        dic = {}
+
+        for topic in self.topics:
+            results = {}
+            for speaker, text in self.interventions(topic):
+                if speaker in results:
+                    results[speaker] = results[speaker] + '\n' + text
+                else:
+                    results[speaker] = text
+
+            dic[topic] = results
+
+        return dic
+
+
+def segment(cleaned: str) -> Session:
+    '''
+    Tokenises the clean text obtained from the PDF into topics and interventions in a single pass of each regex. The
+    text before the first topic (the summary of the session) and before the first speaker of each topic (the title)
+    are left out.
+    '''
+    topics = {}
+    titles = list(TOPIC.finditer(cleaned))
+
+    for i, title in enumerate(titles):
+        start = title.end()
+        end = titles[i + 1].start() if i + 1 < len(titles) else len(cleaned)
+        spans = topics.setdefault(title.group(1), [])
+
+        speakers = list(SPEAKER.finditer(cleaned, start, end))
+        for j, speaker in enumerate(speakers):
+            text_end = speakers[j + 1].start() if j + 1 < len(speakers) else end
+            spans.append((speaker.start(), speaker.end(), speaker.end(), text_end))
+
+    return Session(cleaned, topics)
+
+
+def fold(text: str) -> tuple:
+    '''Lower-cases the text, removes the accents and returns its words, e.g. 'Núñez-Encabo' -> ('nunez', 'encabo').'''
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+
+    return tuple(re.findall(r'[a-z0-9]+', text))
+
+
+class SpeakerIndex:
+    '''
+    Index of the speakers of a parsed session ({topic} : {{speaker} : {text}}, e.g. from Session.to_dict() or the
+    parse cache). Every run of consecutive words of each speaker label is indexed after folding, so the lookup of the
+    surname of a row is a single hash lookup.
+    '''
+
+    def __init__(self, processed: dict):
+        self.processed = processed
+        self.index = {}
+
+        for topic, speakers in processed.items():
+            for speaker in speakers:
+                words = fold(speaker)
+                keys = {words[i:j] for i in range(len(words))
+                        for j in range(i + 1, min(i + MAX_NGRAM, len(words)) + 1)}
+
+                for key in keys:
+                    self.index.setdefault((topic, key), []).append(speaker)
+
+    def speakers(self, topic: str, surname: str) -> list:
+        '''Returns the speakers of the topic whose label contains the surname, in order of appearance.'''
+        return self.index.get((topic, fold(surname)), [])
+
+    def lookup(self, topic: str, surname: str):
+        '''Returns the text of the speaker of the topic matching the surname (the last one if several match).'''
+        speakers = self.speakers(topic, surname)
+        return self.processed[topic][speakers[-1]] if speakers else ''
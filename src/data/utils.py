@@ -4,11 +4,15 @@ of data.
 
 1. string_to_list: when saving pandas dataframes as .csv files that contain a 
 list within cells, the lists turn into strings. This function fixes that 
-turning them back to lists.
+turning them back to lists. It is kept as a compatibility reader for old .csv
+files; new datasets are saved as .parquet with real lists (see dataset.py).
+2. Progress: prints the progress of a long loop with its rate and the estimated
+time to finish it.
 
 '''
 
 import pandas as pd
+from timeit import default_timer as timer
 
 def string_to_list(string: str):
 
@@ -17,4 +21,36 @@ def string_to_list(string: str):
     for item in string:
         lst.append(item.replace("'", ""))
 
-    return lst
\ No newline at end of file
+    return lst
+
+
+class Progress:
+    '''
+    Prints the progress of a loop over total items, at most once every interval
+    seconds: e.g. 'Cleaning: 1200/5000 (24.0%), 85.3 items/s, ETA 44 s.'
+    '''
+
+    def __init__(self, total: int, name: str = 'Progress', unit: str = 'items', interval: float = 10):
+        self.total = total
+        self.name = name
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.start = timer()
+        self.last = self.start
+
+    def rate(self) -> float:
+        return self.done / max(timer() - self.start, 1e-9)
+
+    def update(self, n: int = 1):
+        self.done += n
+        now = timer()
+        if now - self.last >= self.interval or self.done >= self.total:
+            self.last = now
+            print(self)
+
+    def __str__(self):
+        rate = self.rate()
+        eta = (self.total - self.done) / rate if rate > 0 else float('inf')
+        return f'{self.name}: {self.done}/{self.total} ({self.done / max(self.total, 1):.1%}), ' \
+               f'{rate:.1f} {self.unit}/s, ETA {eta:.0f} s.'
@@ -0,0 +1,87 @@
+'''
+Batched lemmatisation of texts with spaCy. The model is loaded once, without the components that lemmas do not need
+(the parser and the named entity recogniser), and the texts are streamed through nlp.pipe in batches, optionally in
+several processes.
+
+The rule-based lemmatiser of the Spanish model only depends on the text of the token, its part of speech and its
+morphological features, so the lemma of every (text, pos, morph) is kept in a bounded memo: given how skewed the
+vocabulary of the interventions is, most tokens are found there and the rules of the lemmatiser are only run for the
+rare ones. The lemmas are the same as running the whole pipeline on every text.
+
+Usage: $python -m src.features.lemmatise [text]
+'''
+
+import sys
+from collections import OrderedDict
+
+import spacy
+
+MODEL = 'es_core_news_sm'
+
+# Components of the pipeline not needed for lemmas.
+DISABLED = ['parser', 'ner']
+
+
+class Lemmatiser:
+    '''
+    - model: name of the spaCy model.
+    - batch_size: number of texts processed together by nlp.pipe.
+    - n_process: number of processes used by nlp.pipe.
+    - cache_size: maximum number of (text, pos, morph) kept in the memo of lemmas.
+    '''
+
+    def __init__(self, model: str = MODEL, batch_size: int = 64, n_process: int = 1, cache_size: int = 200_000):
+        # The lemmatizer is also disabled: it is called below, only for the tokens that are not in the memo.
+        self.nlp = spacy.load(model, disable=DISABLED + ['lemmatizer'])
+        self.lemmatizer = self.nlp.get_pipe('lemmatizer')
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lemma(self, token) -> str:
+        # Lemmas already set by the previous components (e.g. the attribute ruler) are kept, as the lemmatizer does.
+        if token.lemma != 0 and not self.lemmatizer.overwrite:
+            return token.lemma_
+
+        key = (token.text, token.pos, str(token.morph))
+        lemma = self.cache.get(key)
+        if lemma is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return lemma
+
+        self.misses += 1
+        lemma = self.lemmatizer.lemmatize(token)[0]
+        self.cache[key] = lemma
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        # The lemmatizer keeps its own unbounded cache.
+        if len(self.lemmatizer.cache) > self.cache_size:
+            self.lemmatizer.cache.clear()
+
+        return lemma
+
+    def pipe(self, texts, batch_size: int = None, n_process: int = None):
+        '''
+        Yields the list of lemmas of every text, in order. The batch size and number of processes default to those of
+        the lemmatiser.
+        '''
+        batch_size = batch_size or self.batch_size
+        n_process = n_process or self.n_process
+        for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+            yield [self.lemma(token) for token in doc]
+
+    def __call__(self, text: str) -> list:
+        # A single text goes straight through the pipeline, never through a pool of processes.
+        return [self.lemma(token) for token in self.nlp(text)]
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) == 2, 'Usage: python -m src.features.lemmatise [text]'
+
+    print(Lemmatiser()(sys.argv[1]))
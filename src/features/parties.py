@@ -0,0 +1,131 @@
+'''
+Registry of the political parties: the raw codes of the parliamentary groups in «orador» (e.g. GCUP-EC-GC, GS) that
+are merged into each party to keep a constant label throughout the entire time period, together with the colour and
+marker used to plot the party and the legislatures in which it had its own group.
+
+Everything that needs to know about parties (political_group.py, the corpus generator and the plots of
+reduce-dimension.py and the notebooks) takes it from here.
+
+Usage: $python -m src.features.parties
+'''
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Colour of the labels that do not belong to any party of the registry.
+DEFAULT_COLOR = '#000000'
+DEFAULT_MARKER = '2'
+
+
+class Party:
+    '''
+    - name: merged label of the party, e.g. 'UP'.
+    - codes: raw codes of the parliamentary groups merged into the party.
+    - color: colour used in the plots.
+    - marker: matplotlib marker used in the plots.
+    - legislatures: (first, last) legislature in which the party had a parliamentary group (approximately).
+    '''
+
+    def __init__(self, name, codes, color, marker, legislatures):
+        self.name = name
+        self.codes = codes
+        self.color = color
+        self.marker = marker
+        self.legislatures = legislatures
+
+    def valid(self, legislature: int) -> bool:
+        return self.legislatures[0] <= legislature <= self.legislatures[1]
+
+
+PARTIES = [
+    # UP, IP, IU & Co.
+    Party('UP', ['GCUP-EC-GC', 'GCUP-EC-EM', 'GP-EC-EM', 'GIU', 'GIU-IU-ICV', 'GIP', 'GIU-ICV', 'IULV-CA'],
+          '#a245b2', '+', (3, 14)),
+
+    # PP.
+    Party('PP', ['GP', 'PPC'], '#1eb3e6', 'v', (1, 14)),
+
+    Party('PSOE', ['GS'], '#c10200', 'x', (1, 14)),
+    Party('CS', ['GCs'], '#f87729', '1', (11, 14)),
+    Party('VOX', ['GVOX'], '#82b431', '.', (13, 14)),
+    Party('CIU', ['GC-CiU'], DEFAULT_COLOR, DEFAULT_MARKER, (1, 10)),
+    Party('PNV', ['GV-PNV', 'GV (EAJ-PNV)'], '#008146', DEFAULT_MARKER, (1, 14)),
+    Party('EHB', ['GEH Bildu'], '#bbce00', DEFAULT_MARKER, (14, 14)),
+
+    # ERC. GER-IU-ICV since it was mostly ERC and almost no IU.
+    Party('ERC', ['GER-IU-ICV', 'GR', 'GER', 'ERC', 'GER-ERC'], '#f99f00', DEFAULT_MARKER, (8, 14)),
+]
+
+BY_NAME = {party.name: party for party in PARTIES}
+
+# Raw group code -> merged party.
+GROUPS = {code: party.name for party in PARTIES for code in party.codes}
+
+
+def map_categories(values: pd.Series, function) -> pd.Series:
+    '''
+    Applies function to every distinct value of a series, as a categorical series: the function only runs once per
+    category and the rows are remapped with their integer codes, so millions of rows take milliseconds.
+    '''
+    values = values.astype('category')
+    mapped = values.cat.categories.map(function)
+    categories = pd.Index(mapped.dropna().unique())
+
+    # Code of the new category of every old category (-1 for NaN).
+    remap = np.append(categories.get_indexer(mapped), -1)
+    codes = remap[values.cat.codes.to_numpy()]
+
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+
+
+def merge(groups: pd.Series) -> pd.Series:
+    '''Merges the raw codes of a series of groups into their parties; other values (e.g. GMx) are kept as they are.'''
+    return map_categories(groups, lambda code: GROUPS.get(code, code))
+
+
+def find_party(label: str):
+    # A party or a raw code, followed by the legislature or other parts of the label (e.g. 'PP L7', 'PSOE-10').
+    prefix = re.match(r'^(.+?)(?:[ -]L?\d+.*)?$', label, flags=re.S).group(1)
+    if prefix in BY_NAME:
+        return prefix
+    if prefix in GROUPS:
+        return GROUPS[prefix]
+
+    # The group of a speaker, e.g. 'SÁNCHEZ PÉREZ-CASTEJÓN, PEDRO (GS)' or 'SÁNCHEZ PÉREZ-CASTEJÓN, PEDRO (PSOE) L14'.
+    found = re.search(r'\(([^()]*)\)', label)
+    if found is not None:
+        group = found.group(1)
+        return group if group in BY_NAME else GROUPS.get(group)
+
+    return None
+
+
+def party_of(labels: pd.Series) -> pd.Series:
+    '''Party of every label of a model (e.g. 'PP L7', 'PSOE 2019-03', 'GS' or a speaker). Unknown parties are NaN.'''
+    return map_categories(labels.astype(str), find_party)
+
+
+def colors(labels: pd.Series) -> pd.Series:
+    return party_of(labels).map({p.name: p.color for p in PARTIES}).astype(object).fillna(DEFAULT_COLOR)
+
+
+def markers(labels: pd.Series) -> pd.Series:
+    return party_of(labels).map({p.name: p.marker for p in PARTIES}).astype(object).fillna(DEFAULT_MARKER)
+
+
+def valid(parties: pd.Series, legislatures: pd.Series) -> pd.Series:
+    '''Tells which rows have a party of the registry that had a group in their legislature.'''
+    first = parties.map({p.name: p.legislatures[0] for p in PARTIES}).astype(float)
+    last = parties.map({p.name: p.legislatures[1] for p in PARTIES}).astype(float)
+    legislatures = legislatures.astype(float)
+
+    return (first <= legislatures) & (legislatures <= last)
+
+
+if __name__ == '__main__':
+
+    for party in PARTIES:
+        print(f'{party.name}: {", ".join(party.codes)} ({party.color}, {party.marker}), '
+              f'L{party.legislatures[0]}-L{party.legislatures[1]}')
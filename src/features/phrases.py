@@ -0,0 +1,231 @@
+'''
+Detection of bigrams and trigrams in the tokens of the interventions, as a stage separate from the cleaning. The phrase
+models are trained by streaming the «clean_text» column of the dataset from disk, and saved as versioned artifacts:
+
+{phrases dir}/
+    LATEST                  number of the last version.
+    v0001/
+        meta.json           parameters, number of documents and history of the version.
+        bigram.phrases      full models, with the counts of the words and pairs, needed to update them.
+        trigram.phrases
+        bigram.phraser      frozen models, which only keep the phrases and are used to apply them.
+        trigram.phraser
+    v0002/ ...
+
+A new version is created every time the models are trained or updated, so the phrases used for a dataset can always
+be reproduced. Updating adds the counts of new documents (e.g. a new month of interventions) to the last version
+without reading the previous documents again. The counts of the trigram model for the previous documents were taken
+on the bigrams of their version, which is the usual approximation of incremental training.
+
+Usage: $python -m src.features.phrases train [input file] [phrases dir]
+       $python -m src.features.phrases update [input file] [phrases dir]
+       $python -m src.features.phrases apply [input file] [phrases dir] [output file] [workers (optional)]
+                                             [mode (optional)]
+
+- input file: .parquet or .csv file with the column «clean_text» (the output of preprocess_texts.py).
+- phrases dir: directory with the versions of the phrase models.
+- output file: copy of the input with an additional column «phrases» with the tokens joined into bigrams and trigrams.
+- workers: number of processes applying the phrases (default 1).
+- mode: 'full' (default) or 'incremental', which only phrases the documents that are new or changed since the last
+  run with the same version of the models (see src/data/incremental.py).
+'''
+
+import json
+import sys
+from datetime import datetime
+from multiprocessing import Pool
+from pathlib import Path
+
+import gensim
+from gensim.models.phrases import FrozenPhrases, Phrases
+
+from src.data.dataset import iter_dataset, read_dataset, write_dataset
+from src.data.incremental import run_incremental, source_hash
+from src.data.utils import Progress
+
+MIN_COUNT = 3
+THRESHOLD = 30
+
+
+class Sentences:
+    '''Re-iterable stream of the lists of tokens of a column of a dataset, read from disk in batches.'''
+
+    def __init__(self, path: str, column: str = 'clean_text'):
+        self.path = path
+        self.column = column
+        self.documents = None
+
+    def __iter__(self):
+        documents = 0
+        for tokens in iter_dataset(self.path, self.column):
+            documents += 1
+            yield tokens if tokens is not None else []
+
+        # Number of documents, known after the first complete pass.
+        self.documents = documents
+
+
+def count(sentences) -> int:
+    return sentences.documents if isinstance(sentences, Sentences) else len(sentences)
+
+
+class PhraseModels:
+    '''The bigram and trigram models of a version: full models (to update them) and frozen ones (to apply them).'''
+
+    def __init__(self, bigram: Phrases, trigram: Phrases, meta: dict):
+        self.bigram = bigram
+        self.trigram = trigram
+        self.meta = meta
+        self.freeze()
+
+    def freeze(self):
+        self.bigram_phraser = FrozenPhrases(self.bigram)
+        self.trigram_phraser = FrozenPhrases(self.trigram)
+
+    @classmethod
+    def train(cls, sentences, min_count: int = MIN_COUNT, threshold: float = THRESHOLD):
+        '''Trains the models on an iterable of lists of tokens, which is read twice.'''
+        bigram = Phrases(sentences, min_count=min_count, threshold=threshold)
+        trigram = Phrases(FrozenPhrases(bigram)[sentences], min_count=min_count, threshold=threshold)
+
+        meta = {'min_count': min_count, 'threshold': threshold, 'documents': count(sentences),
+                'gensim': gensim.__version__}
+        return cls(bigram, trigram, meta)
+
+    def update(self, sentences):
+        '''Adds the counts of new documents to the models and freezes them again.'''
+        self.bigram.add_vocab(sentences)
+        self.trigram.add_vocab(FrozenPhrases(self.bigram)[sentences])
+        self.meta['documents'] += count(sentences)
+        self.freeze()
+
+    def __call__(self, tokens: list) -> list:
+        return self.trigram_phraser[self.bigram_phraser[tokens]]
+
+    def apply(self, documents) -> list:
+        '''Returns the documents with their bigrams and trigrams joined.'''
+        return [self(tokens) for tokens in documents]
+
+    def save(self, root: str, note: str = '') -> int:
+        '''Saves the models as a new version in root and returns its number.'''
+        root = Path(root)
+        latest = latest_version(root)
+        version = (latest or 0) + 1
+        path = root / f'v{version:04d}'
+        path.mkdir(parents=True, exist_ok=True)
+
+        self.bigram.save(str(path / 'bigram.phrases'))
+        self.trigram.save(str(path / 'trigram.phrases'))
+        self.bigram_phraser.save(str(path / 'bigram.phraser'))
+        self.trigram_phraser.save(str(path / 'trigram.phraser'))
+
+        # The parent is the version the models were loaded from (none if they were just trained).
+        self.meta.update({'version': version, 'parent': self.meta.get('version'),
+                          'created': datetime.now().isoformat(timespec='seconds')})
+        self.meta.setdefault('history', []).append({'version': version, 'note': note,
+                                                    'documents': self.meta['documents']})
+        (path / 'meta.json').write_text(json.dumps(self.meta, indent=1))
+
+        # Written last, so an interrupted save is never the latest version.
+        (root / 'LATEST').write_text(str(version))
+        return version
+
+    @classmethod
+    def load(cls, root: str, version: int = None, frozen: bool = False):
+        '''Loads a version (the latest by default). With frozen, only the frozen models are loaded.'''
+        version = version or latest_version(root)
+        assert version is not None, f'There are no phrase models in {root}.'
+        path = Path(root) / f'v{version:04d}'
+        meta = json.loads((path / 'meta.json').read_text())
+
+        if frozen:
+            models = cls.__new__(cls)
+            models.bigram = models.trigram = None
+            models.meta = meta
+            models.bigram_phraser = FrozenPhrases.load(str(path / 'bigram.phraser'))
+            models.trigram_phraser = FrozenPhrases.load(str(path / 'trigram.phraser'))
+            return models
+
+        return cls(Phrases.load(str(path / 'bigram.phrases')), Phrases.load(str(path / 'trigram.phrases')), meta)
+
+
+def latest_version(root: str):
+    path = Path(root) / 'LATEST'
+    return int(path.read_text()) if path.exists() else None
+
+
+# Phrase models of the workers of apply_parallel, loaded once per worker.
+_worker_models = None
+
+
+def _init_worker(root: str, version: int):
+    global _worker_models
+    _worker_models = PhraseModels.load(root, version, frozen=True)
+
+
+def _apply_chunk(documents: list) -> list:
+    return _worker_models.apply(documents)
+
+
+def apply_parallel(documents: list, root: str, version: int = None, workers: int = 1, chunksize: int = 500):
+    '''Yields the documents with their phrases, in order, using the given version of the models in several processes.'''
+    version = version or latest_version(root)
+    chunks = (documents[i:i + chunksize] for i in range(0, len(documents), chunksize))
+    progress = Progress(len(documents), 'Phrases', 'docs')
+
+    if workers <= 1:
+        _init_worker(root, version)
+        for chunk in chunks:
+            progress.update(len(chunk))
+            yield from _apply_chunk(chunk)
+        return
+
+    with Pool(workers, initializer=_init_worker, initargs=(root, version)) as pool:
+        for result in pool.imap(_apply_chunk, chunks):
+            progress.update(len(result))
+            yield from result
+
+
+if __name__ == '__main__':
+
+    assert len(sys.argv) >= 4 and sys.argv[1] in ('train', 'update', 'apply'), \
+        'Usage: python -m src.features.phrases [train/update/apply] [input file] [phrases dir] ' \
+        '[output file (apply)] [workers (apply, optional)]'
+
+    mode = sys.argv[1]
+    input_file = sys.argv[2]
+    root = sys.argv[3]
+
+    if mode == 'train':
+        models = PhraseModels.train(Sentences(input_file))
+        version = models.save(root, 'train')
+        print(f'Phrase models trained on {models.meta["documents"]} documents and saved as version {version}.')
+
+    elif mode == 'update':
+        models = PhraseModels.load(root)
+        models.update(Sentences(input_file))
+        version = models.save(root, f'update with {input_file}')
+        print(f'Phrase models updated ({models.meta["documents"]} documents) and saved as version {version}.')
+
+    else:
+        assert 5 <= len(sys.argv) <= 7, 'Usage: python -m src.features.phrases apply [input file] [phrases dir] ' \
+                                        '[output file] [workers (optional)] [mode (optional)]'
+        output_file = sys.argv[4]
+        workers = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+        mode = sys.argv[6] if len(sys.argv) > 6 else 'full'
+        assert mode in ('full', 'incremental'), 'The mode must be full or incremental.'
+        version = latest_version(root)
+
+        def add_phrases(dataframe):
+            dataframe['phrases'] = list(apply_parallel(dataframe['clean_text'].tolist(), root, version, workers))
+            return dataframe
+
+        dataframe = read_dataset(input_file)
+
+        if mode == 'incremental':
+            # A new version of the models phrases all the documents again.
+            run_incremental(dataframe, output_file, add_phrases, salt=f'v{version}' + source_hash(__file__))
+        else:
+            write_dataset(add_phrases(dataframe), output_file)
+
+        print(f'Bigrams and Trigrams added with version {version}. Results in {output_file}.')
@@ -1,80 +1,68 @@
 '''
 Creates a new feature called «political_group» that includes the political 
 group of each speaker. Groups are merged to keep a constant label throughout 
-the entire time period.
+the entire time period, with the registry of parties in src/features/parties.py.
 
-Usage: $python political_group.py [input file] [output file]'
+In the incremental mode, only the interventions that are new or changed since the last run are labelled and merged
+into the existing output file (see src/data/incremental.py).
+
+Usage: $python -m src.features.political_group [input file] [output file] [mode (optional)]
+
+- mode: 'full' (default) or 'incremental'.
 '''
 
 import pandas as pd
 import re
+import sys
+
+from src.data.incremental import run_incremental, source_hash
+from src.features import parties
+from src.features.parties import map_categories, merge
 
-group_merger = {
-    # UP, IP, IU & Co.
-    'GCUP-EC-GC': 'UP',
-    'GCUP-EC-EM': 'UP',
-    'GP-EC-EM': 'UP',
-    'GIU': 'UP',
-    'GIU-IU-ICV': 'UP',
-    'GIP': 'UP',
-    'GIU-ICV': 'UP',
-    'IULV-CA': 'UP',
-
-    # PP.
-    'GP': 'PP',
-    'PPC': 'PP',
-
-    'GS': 'PSOE',   # PSOE.
-    'GCs': 'CS',    # Ciudadanos.
-    'GVOX': 'VOX',  # Vox.
-    'GC-CiU': 'CIU',  # CIU.
-
-    # PNV.
-    'GV-PNV': 'PNV',
-    'GV (EAJ-PNV)': 'PNV',
-
-    # EH Bildu.
-    'GEH Bildu': 'EHB',
-
-    # ERC.
-    'GER-IU-ICV': 'ERC',  # Since it was mostly ERC and almost no IU.
-    'GR': 'ERC',
-    'GER': 'ERC',
-    'ERC': 'ERC',
-    'GER-ERC': 'ERC'}
+# Group at the end of «orador», from the first parenthesis on (the groups may have their own parentheses).
+GROUP = re.compile(r' \((.*).$', flags=re.S)
 
 def political_group(data):
+    '''
+    Returns the raw political group of every intervention, e.g. GP, GCUP-EC-GC, taken from the parentheses at the end
+    of «orador» ('' if there is none), as a categorical series. The group is extracted once per distinct speaker.
+    '''
+    return map_categories(data['orador'], extract_group)
 
-   # Adding the political group as a new feature.
-    political_group = data['orador'].str.split(r' \(', 1)
 
+def extract_group(orador: str) -> str:
+    # e.g. 'SÁNCHEZ PÉREZ-CASTEJÓN, PEDRO (GS)' -> 'GS'.
+    found = GROUP.search(orador)
+    return found.group(1) if found is not None else ''
 
-    # Filling the cases where there is no political group.
-    for i in range(len(political_group)):
-        try: political_group[i][1]
-        except: political_group[i].append('')
 
+def label(data):
+    '''Adds the merged political group of every intervention to the data.'''
+    data = data.reset_index(drop=True)
+
+    # Speakers without «orador» have no group either.
+    data['political_group'] = merge(political_group(data.fillna({'orador': ''})))
+
+    return data
 
-    # Clean the list to only include the political group, e.g. GP, GCUP-EC-GC.
-    political_group = [political_group[i][1][:-1]
-                       for i in range(len(political_group))]
 
-    return political_group
-    
 if __name__ == '__main__':
 
-    assert len(
-        sys.argv) == 3, 'Usage: python political_group.py [input file] [output file]'
+    assert 3 <= len(sys.argv) <= 4, 'Usage: python -m src.features.political_group [input file] [output file] ' \
+                                    '[mode (optional)]'
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'full'
+    assert mode in ('full', 'incremental'), 'The mode must be full or incremental.'
 
     data = pd.read_csv(input_file)
-    pgs = political_group(data)
-    data['political_group'] = pgs
-
-    data ['political_group'] = data['political_group'].replace(group_merger)
 
-    data.to_csv(output_file, index=False)
+    if mode == 'incremental':
+        # The labels come from the registry of parties too, so a change of it relabels every row.
+        run_incremental(data, output_file, label, salt=source_hash(__file__, parties.__file__))
+    else:
+        data = label(data)
+        data.to_csv(output_file, index=False)
 
     print('Finished pre-processing political groups.')
@@ -9,21 +9,35 @@ Script to clean and tokenize the texts from the parliamentary interventions. The
 5. (Optional, based on argument 'lemmatised') Lemmatisation.
 5. Tokenizing.
 
-Usage: $python3 clean-tokenize.py [input file] [lemmatised (true/false)] [output file]
+Usage: $python3 -m src.features.preprocess_texts [input file] [lemmatised (true/false)] [output file] [workers]
+                                                 [chunk size] [mode]
 
-- input file: .csv file containing a dataframe with a column called «text» containing the documents to clean and tokenize.
+- input file: .csv or .parquet file containing a dataframe with a column called «text» containing the documents to clean and tokenize.
 - lemmatised: boolean argument. True = lemmatised tokens. False = not lemmatised.
-- output file: the script returns a copy of the dataframe as .csv containing an additional column called «clean_text» with the list of tokens.
+- output file: the script returns a copy of the dataframe as .parquet (or .csv) containing an additional column called «clean_text» with
+  the list of tokens. In .parquet files they are saved as real lists (see src/data/dataset.py). The column «phrases», with the
+  tokens joined into bigrams and trigrams, is added afterwards by src/features/phrases.py.
+- workers: optional, number of processes cleaning the texts (default 1). Each worker loads its own tokenizer and, when
+  lemmatising, its own spaCy model (see src/features/lemmatise.py).
+- chunk size: optional, number of texts sent to a worker at a time (default 200).
+- mode: optional, 'full' (default) or 'incremental'. In the incremental mode, only the interventions that are new or
+  changed since the last run are cleaned, and they are merged into the existing output file (see
+  src/data/incremental.py).
 '''
 
 import pandas as pd
 import nltk
-import gensim
 import string
 from nltk.tokenize import ToktokTokenizer
-import spacy
+import inspect
 import sys
 import re
+from multiprocessing import Pool
+
+from src.data.dataset import read_dataset, write_dataset
+from src.data.incremental import run_incremental, source_hash
+from src.data.utils import Progress
+from src.features.lemmatise import Lemmatiser
 
 tok = ToktokTokenizer()
 
@@ -48,123 +62,190 @@ other_stopwords = ['socialista', 'socialistas', 'popular', 'populares', 'ciudada
 
 stopwords = nltk.corpus.stopwords.words('spanish')
 
+# One word per line (without the line breaks, which would never match a token).
 with open('spanish.txt') as f:
-    words = f.readlines()
+    words = f.read().split()
 
-stopwords = stopwords + procedural + other_stopwords + words
+# Built once, when the module is loaded.
+stopwords = frozenset(stopwords + procedural + other_stopwords + words)
 
-def clean(text: str, lemmatise: bool = False) -> list:
+# Words split at the end of a line (con-\ngreso) and by a hyphen and a space (con- greso), replaced one after the
+# other.
+HYPHENATION = [re.compile(r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\-\n)"),
+               re.compile(r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\- )")]
+
+# \t, \n, \r and punctuation to spaces, and en- and em-dashes, '«' and '»' removed. Repeated spaces are left to the
+# tokenizer, which collapses them.
+TRANSLATION = str.maketrans({**{c: ' ' for c in '\t\n\r' + string.punctuation},
+                             **{c: None for c in '–—«»―'}})
+
+
+def tokenise(text: str) -> list:
+    '''Normalisation and tokenisation of the text, before lemmatising and removing the stopwords.'''
 
     # Text to lowercase.
     text = text.lower()
 
     # Turning splitted words into 1, e.g. con-\ngreso to congreso.
-    regex = r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\-\n)"
-    text = re.sub(regex, r'\1', text)
+    for regex in HYPHENATION:
+        text = regex.sub(r'\1', text)
 
-    regex = r"([a-zA-ZñáéíóúüàèìòùçÑÁÉÍÓÚÜÀÈÌÒÙÇ])(\- )"
-    text = re.sub(regex, r'\1', text)
+    # Removing \n, \t, \r, punctuation, dashes, '«' and '»' in a single pass.
+    text = text.translate(TRANSLATION)
 
-    # Removing \n, \t, \r.
-    text = text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+    # Tokenizing.
+    tokens = tok.tokenize(text)
 
-    # Removing punctuation.
-    text = text.translate(str.maketrans(
-        string.punctuation, ' '*len(string.punctuation)))
+    # Turning words that split in two into one. (e.g. ['presi-', 'dente'])
+    if '\xad' in text:
+        for i in range(len(tokens)):
+            if '\xad' in tokens[i]:
+                tokens[i] = tokens[i].replace('\xad', '')
+                if len(tokens) > i + 1:
+                    tokens[i] = tokens[i] + tokens[i+1]
+                    tokens[i+1] = ''
 
-    # Double spaces.
-    text = text.replace('  ', ' ')
+        tokens = [t for t in tokens if t != '']
 
-    # Removing en- and em-dashes, '«' and '»'.
-    chars = ['-', '–', '-', '—', '«', '»', '―']
-    for c in chars:
-        text = text.replace(c, '')
+    return tokens
 
-    # Tokenizing.
-    tokens = tok.tokenize(text)
 
-    # Turning words that split in two into one. (e.g. ['presi-', 'dente'])
-    for i in range(len(tokens)):
-        if '\xad' in tokens[i]:
-            tokens[i] = tokens[i].replace('\xad', '')
-            if len(tokens) > i + 1:
-                tokens[i] = tokens[i] + tokens[i+1]
-                tokens[i+1] = ''
+def remove_stopwords(tokens: list) -> list:
+    # Removing stop words, procedural words, short words and numbers.
+    return [w for w in tokens if len(w) > 2 and w not in stopwords and not w.isdigit()]
+
+
+# The lemmatiser is only loaded the first time it is needed, and then reused.
+_lemmatiser = None
+
+
+def get_lemmatiser() -> Lemmatiser:
+    global _lemmatiser
+    if _lemmatiser is None:
+        _lemmatiser = Lemmatiser()
+    return _lemmatiser
+
 
-    tokens = [t for t in tokens if t != ''] 
+def clean(text: str, lemmatise: bool = False) -> list:
+
+    tokens = tokenise(text)
 
     # Lemmatisation: first joining sentences and then lemmatising (the module 
     # splits it automatically).
     if lemmatise == True:
+        tokens = get_lemmatiser()(' '.join(tokens))
 
-        ltz = spacy.load('es_core_news_sm')
-        text = ' '.join(tokens)
+    return remove_stopwords(tokens)
 
-        doc = ltz(text)
-        lemmas = [ltz.lemma_ for ltz in doc]
 
-        # Removing stop words, procedural words, short words and numbers.
-        tokens = [w for w in lemmas if w not in stopwords and len(
-            w) > 2 and w != ' ' and not w.isdigit()]
+def clean_all(texts: list, lemmatise: bool = False, batch_size: int = 64, n_process: int = 1):
+    '''
+    Yields clean(text, lemmatise) for every text, in order. When lemmatising, the texts are streamed through the
+    pipeline of spaCy in batches (and in n_process processes).
+    '''
+    tokens = (tokenise(text) for text in texts)
 
-    else:
-        tokens = [w for w in tokens if w not in stopwords and len(
-            w) > 2 and w != ' ' and not w.isdigit()]
+    if not lemmatise:
+        yield from (remove_stopwords(t) for t in tokens)
+        return
 
-    return tokens
+    # The options are given to this pipe only: the lemmatiser is shared with clean().
+    for lemmas in get_lemmatiser().pipe((' '.join(t) for t in tokens), batch_size, n_process):
+        yield remove_stopwords(lemmas)
 
-def main():
-    assert len(sys.argv) == 4, 'Usage: python clean-tokenize.py [input file] [lemmatised (true/false)] [output file]'
 
-    input_file = sys.argv[1]
-    lemmatise = sys.argv[2]
-    output_file = sys.argv[3]
+# Options of the workers of clean_parallel, set once per worker by _init_worker.
+_worker_lemmatise = False
 
-    # Import data.
-    dataframe = pd.read_csv(input_file)
 
-    # Reduce data to only the rows with actual text.
-    dataframe = dataframe.loc[dataframe['text'] != 0].dropna().reset_index(drop=True)
-    dataframe = dataframe.loc[dataframe['text'] != "['nan']"].reset_index(drop=True)
+def _init_worker(lemmatise: bool):
+    global tok, _worker_lemmatise
+    tok = ToktokTokenizer()
+    _worker_lemmatise = lemmatise
 
-    # Turn relevant column to list.
-    corpus = dataframe['text'].to_list()
+    # Load the model once per worker, not once per chunk.
+    if lemmatise:
+        get_lemmatiser()
 
-    # Clean the list. # TODO: is this causing the problem with lists as strings?
-    clean_corpus = []
-    for i in range(len(corpus)):
-        clean_corpus.append(clean(corpus[i], lemmatise))
-        if i % 500 == 0:
-            print(f'Row cleaned: {i}. Result: {clean_corpus[i][0:79]}')
 
-    # Create new column with clean tokens.
-    print('Corpus cleaned.')
-    dataframe['clean_text'] = clean_corpus
+def _clean_chunk(texts: list) -> list:
+    return list(clean_all(texts, _worker_lemmatise))
 
-    # Create bigrams and trigrams.
-    bigram = gensim.models.Phrases(dataframe['clean_text'], min_count=3, threshold=30)
-    trigram = gensim.models.Phrases(bigram[dataframe['clean_text']], min_count=3, threshold=30)
 
-    bigram_mod = gensim.models.phrases.Phraser(bigram)
-    trigram_mod = gensim.models.phrases.Phraser(trigram)
+def clean_parallel(texts: list, lemmatise: bool = False, workers: int = None, chunksize: int = 200):
+    '''
+    Yields clean(text, lemmatise) for every text, in order, splitting the texts into chunks of chunksize cleaned by
+    a pool of workers. The tokenizer, the stopwords and the lemmatiser are set up once per worker.
+    '''
+    chunks = (texts[i:i + chunksize] for i in range(0, len(texts), chunksize))
+    progress = Progress(len(texts), 'Cleaning', 'docs')
 
-    def get_phrases(x):
-        return trigram_mod[bigram_mod[x]]
+    with Pool(workers, initializer=_init_worker, initargs=(lemmatise,)) as pool:
+        for result in pool.imap(_clean_chunk, chunks):
+            progress.update(len(result))
+            yield from result
 
-    dataframe['phrases'] = dataframe['clean_text'].apply(get_phrases)
-    print('Bigrams and Trigrams created.')
 
-    # Re-sort by date.
-    dataframe = dataframe.sort_values(by='fecha').reset_index(drop=True)
+def main():
+    assert 4 <= len(sys.argv) <= 7, 'Usage: python -m src.features.preprocess_texts [input file] ' \
+                                    '[lemmatised (true/false)] [output file] [workers (optional)] ' \
+                                    '[chunk size (optional)] [mode (optional)]'
 
-    # Save to output file.
-    dataframe.to_csv(output_file, index=False)
+    input_file = sys.argv[1]
+    lemmatise = sys.argv[2].lower() == 'true'
+    output_file = sys.argv[3]
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    chunksize = int(sys.argv[5]) if len(sys.argv) > 5 else 200
+    mode = sys.argv[6] if len(sys.argv) > 6 else 'full'
+    assert mode in ('full', 'incremental'), 'The mode must be full or incremental.'
+
+    # Import data.
+    dataframe = read_dataset(input_file)
+
+    def process(dataframe):
+        # Reduce data to only the rows with actual text.
+        dataframe = dataframe.loc[dataframe['text'] != 0].dropna().reset_index(drop=True)
+        dataframe = dataframe.loc[dataframe['text'] != "['nan']"].reset_index(drop=True)
+
+        # Turn relevant column to list.
+        corpus = dataframe['text'].to_list()
+
+        # Clean the list, in chunks split among the workers.
+        if workers > 1:
+            clean_corpus = list(clean_parallel(corpus, lemmatise, workers, chunksize))
+        else:
+            clean_corpus = []
+            progress = Progress(len(corpus), 'Cleaning', 'docs')
+            for tokens in clean_all(corpus, lemmatise):
+                clean_corpus.append(tokens)
+                progress.update()
+
+        # Create new column with clean tokens.
+        print(f'Corpus cleaned: {len(corpus)} documents.')
+        dataframe['clean_text'] = clean_corpus
+
+        return dataframe
+
+    if mode == 'incremental':
+        # Any change to the cleaning or the stopwords processes all the texts again.
+        salt = source_hash(__file__, inspect.getfile(Lemmatiser), 'spanish.txt') + str(lemmatise)
+        dataframe, _ = run_incremental(dataframe, output_file, process, salt=salt, sort_by='fecha')
+    else:
+        dataframe = process(dataframe)
+
+        # Re-sort by date.
+        dataframe = dataframe.sort_values(by='fecha').reset_index(drop=True)
+
+        # Save to output file.
+        write_dataset(dataframe, output_file)
 
     # Count total amount of tokens at the end.
     tot_count = 0
-    for t in clean_corpus:
+    for t in dataframe['clean_text']:
         tot_count += len(t)
 
     print(f'Succesfully cleaned and tokenized all texts ({tot_count} tokens). Results in {output_file}.')
 
-main()
+
+if __name__ == '__main__':
+    main()
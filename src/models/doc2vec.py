@@ -0,0 +1,244 @@
+'''
+Training and evaluation of the Doc2Vec models, shared by train-doc2vec.py and the sweeps of sweep.py.
+
+The placement accuracy is the metric of notebooks/model_evaluation.ipynb: a vector is inferred for every held-out
+intervention, the tags closest to it are turned into their parties (e.g. 'PP L7' -> 'PP') and the intervention is
+correctly placed at N if its party is among the first N distinct parties. The random baseline at N is N divided by the
+number of parties.
+
+Models can also be trained from the corpus as a text file (train_file), with the corpus_file mode of gensim: every
+worker thread reads its own part of the file in C, with no Python iteration, so the training scales with the number of
+cores. In that mode gensim tags every document with its line number, so every intervention gets its own vector while
+training, and the vector of every label is then the mean of the vectors of its interventions (empty interventions are
+not in the file, see Corpus.lines). This is a different model from that of train, where all the interventions of a
+label train one shared vector, so its placements and accuracy have to be evaluated on their own (e.g. with
+placement_accuracy, see benchmarks/bench_doc2vec.py), not taken to be those of train. The interventions of a label
+cannot be written as one line to get a vector per label instead: gensim cuts every line of the file to its first
+10000 words.
+
+A trained model can also be updated with new material (e.g. a new legislature or month) instead of being trained again
+from scratch (update): the vocabulary is extended with the new tokens above min_count, the new tags (e.g. 'VOX L15')
+get new vectors, and the training goes on with the new documents mixed with a replay sample of the previous ones, so
+the previous tags keep being trained too. The drift of the vectors the model had before the update tells whether the
+update kept the embedding space (see drift).
+
+Usage: $python -m src.models.doc2vec [model] [corpus dir] [test size (optional)]
+'''
+
+import sys
+
+import gensim
+import numpy as np
+import pandas as pd
+from gensim.models import KeyedVectors
+from gensim.models.doc2vec import TaggedDocument
+from gensim.models.keyedvectors import prep_vectors
+
+from src.data.corpus import Corpus
+from src.features.parties import party_of
+
+# Configuration of the models of the thesis (see train-doc2vec.py).
+DEFAULTS = {
+    'dm': 1,
+    'dm_mean': 1,
+    'dbow_words': 0,
+    'vector_size': 200,
+    'window': 10,  # +- 10 words for the window size.
+    'min_count': 50,  # Only include tokens that with a minimum count of 50 occurrences.
+    'epochs': 10,
+    'hs': 0,
+    'alpha': 0.025,  # learning rate.
+}
+
+# Mean change of the placement of the previous tags above which a full retrain is advisable rather than an update.
+RETRAIN_THRESHOLD = 0.05
+
+# Rows of the similarities between tags computed at once by drift, so models with many tags (e.g. MPs) fit in memory.
+DRIFT_BATCH = 2048
+
+# Number of closest tags looked at to place an intervention, and positions at which the accuracy is measured.
+TOPN = 20
+TOP = [1, 2, 3, 4]
+
+
+def train(corpus, params: dict = None, workers: int = 1, seed: int = 1):
+    '''Trains a model on an iterable of TaggedDocuments (e.g. Corpus.tagged()), which is read once per epoch.'''
+    params = {**DEFAULTS, **(params or {})}
+    model = gensim.models.doc2vec.Doc2Vec(workers=workers, seed=seed, **params)
+
+    # Build the model vocabulary with the corpus.
+    model.build_vocab(corpus_iterable=corpus)
+
+    # Train the model.
+    model.train(corpus_iterable=corpus, total_examples=model.corpus_count, epochs=model.epochs)
+
+    return model
+
+
+def train_file(corpus: Corpus, params: dict = None, workers: int = 1, seed: int = 1):
+    '''
+    Trains a model from the corpus written as a text file, and gives it the vectors of the labels of the corpus, the
+    mean of the vectors of their documents (not the same model as train, see above).
+    '''
+    params = {**DEFAULTS, **(params or {})}
+    path = corpus.lines()
+    model = gensim.models.doc2vec.Doc2Vec(workers=workers, seed=seed, **params)
+
+    model.build_vocab(corpus_file=path)
+    model.train(corpus_file=path, total_examples=model.corpus_count, total_words=model.corpus_total_words,
+                epochs=model.epochs)
+
+    # The lines are the documents with tokens: the vector of line i is that of the document documents[i].
+    documents = corpus.nonempty()
+    assert len(model.dv) == len(documents), f'{path} has {len(model.dv)} lines, but the corpus has {len(documents)} ' \
+                                            f'documents with tokens.'
+    labels = corpus.labels
+    model.dv = label_vectors(model.dv.vectors, [labels[i] for i in documents.tolist()])
+    return model
+
+
+def label_vectors(vectors: np.ndarray, labels: list) -> KeyedVectors:
+    '''Returns the mean of the vectors of the documents of every label, in order of first appearance of the labels.'''
+    codes, uniques = pd.factorize(pd.Series(labels))
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    means = np.add.reduceat(vectors[order], starts, axis=0) / counts[:, None]
+
+    result = KeyedVectors(vectors.shape[1], dtype=vectors.dtype)
+    result.add_vectors(uniques.tolist(), means.astype(vectors.dtype))
+    return result
+
+
+class Mixture:
+    '''Re-iterable TaggedDocuments of the given documents of several corpora, shuffled once in a fixed order.'''
+
+    def __init__(self, sources: list, seed: int = 1):
+        # sources: list of (corpus, documents).
+        self.corpora = [corpus for corpus, _ in sources]
+        order = np.concatenate([np.stack([np.full(len(documents), i), np.asarray(documents, dtype=np.int64)], axis=1)
+                                for i, (_, documents) in enumerate(sources)])
+        self.order = order[np.random.default_rng(seed).permutation(len(order))]
+
+    def __iter__(self):
+        for source, document in self.order.tolist():
+            corpus = self.corpora[source]
+            yield TaggedDocument(corpus.words(document), [corpus.labels[document]])
+
+    def __len__(self):
+        return len(self.order)
+
+
+def update(model, corpus: Corpus, previous: Corpus = None, replay: float = 0.1, workers: int = 1, seed: int = 1):
+    '''
+    Goes on training a model with the documents of corpus and a replay sample (a fraction of the documents) of the
+    previous corpus the model was trained on. Returns the updated model and the drift of the tags it already had.
+    '''
+    keys, vectors = list(model.dv.index_to_key), model.dv.vectors.copy()
+
+    sources = [(corpus, range(len(corpus)))]
+    if previous is not None and replay > 0:
+        rng = np.random.default_rng(seed)
+        sources.append((previous, np.sort(rng.choice(len(previous), int(len(previous) * replay), replace=False))))
+    documents = Mixture(sources, seed)
+    print(f'Updating the model with {len(corpus)} new documents and {len(documents) - len(corpus)} replayed.')
+
+    # Adds the new tokens above min_count to the vocabulary, and extends the word vectors.
+    model.workers = workers
+    model.build_vocab(corpus_iterable=documents, update=True)
+
+    # gensim does not keep the previous tags when updating the vocabulary: the tags are rebuilt with the previous
+    # vectors, and new vectors for the new tags.
+    known = set(keys)
+    new = [tag for tag in model.dv.index_to_key if tag not in known]
+    model.dv = KeyedVectors(model.vector_size, dtype=vectors.dtype)
+    model.dv.add_vectors(keys + new, np.vstack([vectors, prep_vectors((len(new), model.vector_size),
+                                                                     seed=model.seed + len(keys))]))
+    model.dv.vectors_lockf = np.ones(1, dtype=vectors.dtype)
+
+    model.train(corpus_iterable=documents, total_examples=len(documents), epochs=model.epochs)
+
+    return model, drift(keys, vectors, model.dv)
+
+
+def drift(keys: list, previous: np.ndarray, dv: KeyedVectors) -> pd.DataFrame:
+    '''
+    Returns the drift of the previous vectors of the tags after an update: the cosine distance between the previous
+    and the updated vector of every tag, the change of its norm, and the mean change of its cosine similarity with the
+    other previous tags (how much its relative placement moved).
+    '''
+    current = np.vstack([dv[key] for key in keys])
+
+    def normalise(vectors):
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    before, after = normalise(previous), normalise(current)
+
+    # Sum of the changes of the similarities of every tag with the rest, DRIFT_BATCH tags at a time.
+    changes = np.zeros(len(keys))
+    for start in range(0, len(keys), DRIFT_BATCH):
+        end = min(start + DRIFT_BATCH, len(keys))
+        similarities = np.abs(before[start:end] @ before.T - after[start:end] @ after.T)
+        similarities[np.arange(end - start), np.arange(start, end)] = 0
+        changes[start:end] = similarities.sum(axis=1)
+
+    report = pd.DataFrame({'label': keys, 'party': party_of(pd.Series(keys)).astype(object).to_numpy()})
+    report['cosine_distance'] = 1 - np.sum(before * after, axis=1)
+    report['norm_change'] = np.linalg.norm(current, axis=1) / np.maximum(np.linalg.norm(previous, axis=1), 1e-12) - 1
+    report['placement_change'] = changes / max(len(keys) - 1, 1)
+    return report
+
+
+def split(documents: int, test_size: float, seed: int = 0):
+    '''Returns the indices of the training and held-out documents, sampled at random with the given seed.'''
+    rng = np.random.default_rng(seed)
+    test = np.sort(rng.choice(documents, int(documents * test_size), replace=False))
+    train = np.setdiff1d(np.arange(documents), test)
+    return train, test
+
+
+def placement_accuracy(model, corpus: Corpus, documents, topn: int = TOPN, top: list = TOP) -> dict:
+    '''
+    Returns the placement accuracy at every position of top over the given documents of the corpus (those whose label
+    has no party are skipped), together with the random baseline and the number of documents evaluated.
+    '''
+    tags = party_of(pd.Series(model.dv.index_to_key))
+    parties = set(tags.dropna())
+    tags = tags.astype(object).to_numpy()
+
+    labels = party_of(pd.Series(corpus.labels).iloc[list(documents)])
+    known = labels.isin(parties).to_numpy()
+    documents = np.asarray(documents)[known]
+    labels = labels.astype(object).to_numpy()[known]
+
+    hits = np.zeros(len(top), dtype=np.int64)
+    if len(documents):
+        # Cosine similarity of every inferred vector with every tag.
+        vectors = np.vstack([model.infer_vector(corpus.words(i)) for i in documents])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarities = vectors @ model.dv.get_normed_vectors().T
+        closest = np.argsort(-similarities, axis=1)[:, :topn]
+
+        for label, row in zip(labels, closest):
+            # Distinct parties of the closest tags, in order.
+            ranking = list(dict.fromkeys(p for p in tags[row] if p in parties))
+            hits += [label in ranking[:n] for n in top]
+
+    result = {f'accuracy@{n}': float(hits[i] / max(len(documents), 1)) for i, n in enumerate(top)}
+    result.update({f'random@{n}': min(n / max(len(parties), 1), 1.0) for n in top})
+    result['evaluated'] = len(documents)
+    return result
+
+
+if __name__ == '__main__':
+
+    assert 3 <= len(sys.argv) <= 4, 'Usage: python -m src.models.doc2vec [model] [corpus dir] [test size (optional)]'
+
+    model = gensim.models.doc2vec.Doc2Vec.load(sys.argv[1])
+    corpus = Corpus(sys.argv[2])
+    test_size = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    _, test = split(len(corpus), test_size)
+    for metric, value in placement_accuracy(model, corpus, test).items():
+        print(f'{metric}: {value}')
@@ -0,0 +1,259 @@
+'''
+Batch inference of vectors for new documents (e.g. the interventions of a new plenary week, or the documents of new
+MPs or time slices) with a trained Doc2Vec model, to place them in its embedding space without training it again.
+
+The documents are split in chunks and inferred by a pool of processes. Every process loads the model once, memory-
+mapping its large arrays (saved by gensim in separate .npy files), so they are shared by the page cache; the model is
+only read, never modified.
+
+The inference of a document is reproducible: its starting vector is drawn from a stable hash of its tokens (the
+infer_vector of gensim draws it from the built-in hash of Python, which changes in every process, so infer runs the
+same loop from its own starting vector), the random generator of the model is seeded, before every document, from
+that hash and the given seed, and the number of epochs is fixed, so a document always gets the same vector whatever
+the process or chunk that infers it. gensim itself is not modified, so the training and inference of other modules in
+the same process are not affected. The vectors are kept in a cache, {model}.inferred.npz, by the hash of the
+document, so documents already inferred with the same model, epochs and seed (e.g. repeated ones, or those of a run
+that is done again) are not inferred again.
+
+Usage: $python -m src.models.infer [model] [input file] [output dir] [workers (optional)] [epochs (optional)]
+                                   [seed (optional)]
+       $python -m src.models.infer [model] [input file] check [workers (optional)] [epochs (optional)]
+                                   [seed (optional)]
+
+- model: a gensim doc2vec model.
+- input file: directory with a memory-mapped corpus (see src/data/corpus.py), or .parquet or .csv file with the columns
+  [label, document] (see generate-corpus.py).
+- output dir: directory where the vectors are saved, in the order of the input, with a table of their labels and the
+  hashes of the documents (see src/models/vectors.py).
+- workers: number of processes (default 1).
+- epochs: number of epochs of the inference of every document (default: the epochs of the model).
+- seed: seed of the inference (default 1).
+
+With 'check' instead of the output dir, the first CHECK_DOCUMENTS documents are inferred in two new processes with
+different hash salts (the second with the given workers) and the vectors are compared; it fails if they differ.
+'''
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Pool
+
+import gensim
+import numpy as np
+from gensim import matutils
+from gensim.models.doc2vec_inner import train_document_dbow, train_document_dm, train_document_dm_concat
+from gensim.models.keyedvectors import pseudorandom_weak_vector
+
+from src.data.corpus import Corpus, is_corpus
+from src.data.dataset import read_dataset
+from src.data.utils import Progress
+from src.models.vectors import write_store
+
+# Documents inferred by the check of reproducibility.
+CHECK_DOCUMENTS = 200
+
+
+def document_hash(words: list) -> str:
+    return hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def stable_hash(string: str) -> int:
+    '''Hash of the text of a document (its tokens joined by spaces), the same in every process (see document_hash).'''
+    return int(hashlib.blake2b(string.encode('utf-8'), digest_size=16).hexdigest()[:8], 16)
+
+
+def stable_weak_vector(size, seed_string=None, hashfxn=None):
+    return pseudorandom_weak_vector(size, seed_string=seed_string, hashfxn=stable_hash)
+
+
+def infer(model, words: list, epochs: int, seed: int, key: str = None) -> np.ndarray:
+    '''
+    Infers the vector of a document, with the random generator of the model seeded from the document. It is the loop of
+    the infer_vector of gensim, from a starting vector drawn with the stable hash.
+    '''
+    key = key or document_hash(words)
+    model.random = np.random.RandomState((int(key[:8], 16) ^ seed) % 2 ** 32)
+
+    doctag_vectors = stable_weak_vector(model.dv.vector_size, seed_string=' '.join(words))
+    doctag_vectors = doctag_vectors.reshape(1, model.dv.vector_size)
+    doctags_lockf = np.ones(1, dtype=np.float32)
+    work = np.zeros(model.layer1_size, dtype=np.float32)
+    neu1 = matutils.zeros_aligned(model.layer1_size, dtype=np.float32)
+
+    alpha = model.alpha
+    alpha_delta = (model.alpha - model.min_alpha) / max(epochs - 1, 1)
+    for _ in range(epochs):
+        if model.sg:
+            train_document_dbow(model, words, [0], alpha, work, learn_words=False, learn_hidden=False,
+                                doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf)
+        elif model.dm_concat:
+            train_document_dm_concat(model, words, [0], alpha, work, neu1, learn_words=False, learn_hidden=False,
+                                     doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf)
+        else:
+            train_document_dm(model, words, [0], alpha, work, neu1, learn_words=False, learn_hidden=False,
+                              doctag_vectors=doctag_vectors, doctags_lockf=doctags_lockf)
+        alpha -= alpha_delta
+
+    return doctag_vectors[0]
+
+
+# Model and parameters of the processes of the pool, loaded once per process.
+_model = None
+_epochs = None
+_seed = None
+
+
+def _init_worker(model_path: str, epochs: int, seed: int):
+    global _model, _epochs, _seed
+    _model = gensim.models.doc2vec.Doc2Vec.load(model_path, mmap='r')
+    _epochs = epochs or _model.epochs
+    _seed = seed
+
+
+def _infer_chunk(chunk: list) -> np.ndarray:
+    # chunk: list of (hash, words).
+    vectors = np.zeros((len(chunk), _model.vector_size), dtype=np.float32)
+    for i, (key, words) in enumerate(chunk):
+        vectors[i] = infer(_model, words, _epochs, _seed, key)
+    return vectors
+
+
+class Cache:
+    '''Vectors already inferred, by document hash, for a model, number of epochs and seed.'''
+
+    def __init__(self, model_path: str, epochs: int, seed: int):
+        self.path = f'{model_path}.inferred.npz'
+
+        # Any change of the model file (e.g. a new training) or of the parameters starts a new cache. Caches written
+        # before the starting vectors were stable (without the 'stable' mark) are not reproducible, so they are dropped.
+        stat = os.stat(model_path)
+        self.salt = f'{stat.st_size}-{stat.st_mtime_ns}-{epochs}-{seed}-stable'
+
+        self.vectors = {}
+        if os.path.exists(self.path):
+            with np.load(self.path) as cache:
+                if str(cache['salt']) == self.salt:
+                    self.vectors = dict(zip(cache['keys'].tolist(), cache['vectors']))
+
+    def get(self, key: str):
+        return self.vectors.get(key)
+
+    def update(self, keys: list, vectors: np.ndarray):
+        self.vectors.update(zip(keys, vectors))
+
+    def save(self):
+        keys = list(self.vectors)
+        vectors = np.vstack([self.vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+        # Written to a temporary file and renamed, so an interrupted save keeps the previous cache.
+        tmp = f'{self.path}.tmp.npz'
+        np.savez(tmp, salt=np.array(self.salt), keys=np.array(keys), vectors=vectors)
+        os.replace(tmp, self.path)
+
+
+def infer_vectors(model_path: str, documents: list, workers: int = 1, epochs: int = None, seed: int = 1,
+                  chunksize: int = 500, cache: bool = True):
+    '''Returns the vectors of the documents (lists of tokens) and their hashes, inferred in several processes.'''
+    model = gensim.models.doc2vec.Doc2Vec.load(model_path, mmap='r')
+    epochs = epochs or model.epochs
+    keys = [document_hash(words) for words in documents]
+    vectors = np.zeros((len(documents), model.vector_size), dtype=np.float32)
+    del model
+
+    stored = Cache(model_path, epochs, seed) if cache else None
+
+    # Only the distinct documents not in the cache are inferred.
+    pending = {}
+    for i, key in enumerate(keys):
+        vector = stored.get(key) if stored is not None else None
+        if vector is not None:
+            vectors[i] = vector
+        else:
+            pending.setdefault(key, []).append(i)
+    print(f'Inference: {len(documents)} documents, {len(documents) - sum(map(len, pending.values()))} in the cache, '
+          f'{len(pending)} distinct documents to infer.')
+
+    jobs = [(key, documents[rows[0]]) for key, rows in pending.items()]
+    chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+    progress = Progress(len(jobs), 'Inference', 'docs')
+
+    if not jobs:
+        return vectors, keys
+
+    with Pool(workers, initializer=_init_worker, initargs=(model_path, epochs, seed)) as pool:
+        for chunk, inferred in zip(chunks, pool.imap(_infer_chunk, chunks)):
+            for (key, _), vector in zip(chunk, inferred):
+                vectors[pending[key]] = vector
+            if stored is not None:
+                stored.update([key for key, _ in chunk], inferred)
+            progress.update(len(chunk))
+
+    if stored is not None:
+        stored.save()
+
+    return vectors, keys
+
+
+def read_documents(input_file: str):
+    '''Returns the documents (lists of tokens) and the table of tags of a corpus or of a dataset [label, document].'''
+    if is_corpus(input_file):
+        corpus = Corpus(input_file)
+        return [corpus.words(i) for i in range(len(corpus))], corpus.tags
+
+    data = read_dataset(input_file)
+    return data.pop('document').tolist(), data
+
+
+def check(model_path: str, input_file: str, workers: int = 1, epochs: int = None, seed: int = 1,
+          documents: int = CHECK_DOCUMENTS) -> float:
+    '''
+    Infers the first documents of the input in two new processes, with different hash salts and numbers of workers,
+    without the cache, and returns the largest difference between their vectors (0 if the inference is reproducible).
+    '''
+    code = 'import sys, numpy as np\n' \
+           'from src.models.infer import infer_vectors, read_documents\n' \
+           'docs, _ = read_documents(sys.argv[2])\n' \
+           'vectors, _ = infer_vectors(sys.argv[1], docs[:int(sys.argv[3])], int(sys.argv[4]),\n' \
+           '                           int(sys.argv[5]) or None, int(sys.argv[6]), cache=False)\n' \
+           'np.save(sys.argv[7], vectors)\n'
+
+    vectors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for salt, n in (('1', 1), ('2', workers)):
+            path = os.path.join(tmp, f'{salt}.npy')
+            env = {**os.environ, 'PYTHONHASHSEED': salt}
+            subprocess.run([sys.executable, '-c', code, model_path, input_file, str(documents), str(n),
+                            str(epochs or 0), str(seed), path], env=env, check=True, stdout=subprocess.DEVNULL)
+            vectors.append(np.load(path))
+
+    return float(np.abs(vectors[0] - vectors[1]).max()) if vectors[0].size else 0.0
+
+
+if __name__ == '__main__':
+
+    assert 4 <= len(sys.argv) <= 7, 'Usage: python -m src.models.infer [model] [input file] [output dir] ' \
+                                    '[workers (optional)] [epochs (optional)] [seed (optional)]'
+
+    model_path = sys.argv[1]
+    input_file = sys.argv[2]
+    output_dir = sys.argv[3]
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    epochs = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    seed = int(sys.argv[6]) if len(sys.argv) > 6 else 1
+
+    if output_dir == 'check':
+        difference = check(model_path, input_file, workers, epochs, seed)
+        assert difference == 0, f'The inference is not reproducible: the vectors differ by up to {difference}.'
+        print('The inference is reproducible: two new processes inferred the same vectors.')
+        sys.exit(0)
+
+    documents, tags = read_documents(input_file)
+    vectors, keys = infer_vectors(model_path, documents, workers, epochs, seed)
+
+    tags = tags.copy()
+    tags['hash'] = keys
+    write_store(output_dir, vectors, tags, sort=False, model=model_path)
+
+    print(f'{len(vectors)} vectors saved in {output_dir}.')
@@ -0,0 +1,208 @@
+'''
+Sweep of Doc2Vec hyperparameters and seeds over a memory-mapped corpus (see src/data/corpus.py). Every job trains a
+model with a combination of parameters and a seed on the training documents and measures its placement accuracy on
+the held-out ones (see doc2vec.py); trainings with the same parameters and several seeds are the repeated runs used
+to check the stability of the placements.
+
+The jobs run in a pool of processes, each one training with its own number of threads. All the processes open the
+same corpus, whose tokens are memory maps shared by the page cache, so the corpus is in memory only once.
+
+The sweep is described by a .json file, e.g.:
+
+{
+    "search": "grid",
+    "params": {"vector_size": [50, 200], "window": [10, 20], "min_count": [5, 50], "epochs": [20]},
+    "seeds": [1, 2, 3],
+    "test_size": 0.1,
+    "split_seed": 0,
+    "save_models": false
+}
+
+- search: 'grid' trains every combination of the params; 'random' trains "trials" combinations sampled (with
+  "sample_seed") from them. In random searches, a parameter may also be a range {"low": 5, "high": 50, "log": true}
+  (integers if both ends are integers).
+- params: values of the parameters of Doc2Vec to try; the rest are the defaults of doc2vec.py.
+- seeds: seeds of every combination (default [1]).
+- test_size, split_seed: fraction of the documents held out to measure the placement accuracy, and seed of the split.
+  All the jobs are evaluated on the same documents.
+- save_models: whether to save the model of every job in {output dir}/models. The placements of the seeds of every
+  combination are then aligned and their stability reported in {output dir}/stability.csv (see
+  src/analysis/stability.py).
+
+The results are appended to {output dir}/results.csv as soon as every job finishes, one row per job with its id,
+parameters, seed, accuracy and training time. The id of a job is a hash of its parameters and seed, so running the
+same sweep again (e.g. after it was interrupted) only trains the jobs not in the results yet. A job that fails (e.g.
+with a min_count so high that the vocabulary is empty) does not stop the others: its id, parameters and error are
+appended to {output dir}/failed.csv, and it is tried again the next time the sweep runs.
+
+Usage: $python -m src.models.sweep [corpus dir] [sweep file] [output dir] [processes (optional)]
+                                   [threads per job (optional)]
+
+- processes: number of jobs trained at the same time (default: number of CPUs divided by threads per job).
+- threads per job: number of threads of every training (default 1).
+'''
+
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.stability import STABILITY, sweep_stability
+from src.data.corpus import Corpus
+from src.models.doc2vec import DEFAULTS, placement_accuracy, split, train
+
+RESULTS = 'results.csv'
+FAILED = 'failed.csv'
+
+
+def sample(space: dict, rng: np.random.Generator) -> dict:
+    '''Samples a combination of parameters from lists of values or ranges {"low", "high", "log"}.'''
+    params = {}
+    for name, values in space.items():
+        if isinstance(values, dict):
+            low, high = values['low'], values['high']
+            if values.get('log', False):
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = float(rng.uniform(low, high))
+            params[name] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else value
+        else:
+            params[name] = values[rng.integers(len(values))]
+
+    return params
+
+
+def jobs_of(sweep: dict) -> list:
+    '''Returns the jobs of a sweep as (id, params, seed), always in the same order.'''
+    space = sweep.get('params', {})
+    seeds = sweep.get('seeds', [1])
+
+    if sweep.get('search', 'grid') == 'grid':
+        names = sorted(space)
+        combinations = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    else:
+        rng = np.random.default_rng(sweep.get('sample_seed', 0))
+        combinations = [sample(space, rng) for _ in range(sweep.get('trials', 10))]
+
+    jobs = []
+    for params, seed in itertools.product(combinations, seeds):
+        key = json.dumps({'params': params, 'seed': seed}, sort_keys=True)
+        jobs.append((hashlib.sha256(key.encode('utf-8')).hexdigest()[:12], params, seed))
+
+    # Repeated combinations of a random search are trained once.
+    return list({job[0]: job for job in jobs}.values())
+
+
+def done_jobs(output_dir: str) -> set:
+    path = Path(output_dir) / RESULTS
+    return set(pd.read_csv(path, usecols=['job'], dtype=str)['job']) if path.exists() else set()
+
+
+# Corpus and split of the processes of the pool, opened once per process.
+_corpus = None
+_train = None
+_test = None
+
+
+def _init_worker(corpus_dir: str, test_size: float, split_seed: int):
+    global _corpus, _train, _test
+    _corpus = Corpus(corpus_dir)
+    _train, _test = split(len(_corpus), test_size, split_seed)
+
+
+def run_job(job: tuple, threads: int, models_dir: str = None) -> dict:
+    '''Trains and evaluates the model of a job, and returns its row of the results.'''
+    job_id, params, seed = job
+
+    start = timer()
+    model = train(_corpus.tagged(_train), params, workers=threads, seed=seed)
+    seconds = timer() - start
+
+    if models_dir is not None:
+        model.save(os.path.join(models_dir, f'{job_id}.mdl'))
+
+    result = {'job': job_id, 'seed': seed, **{**DEFAULTS, **params}, 'train_seconds': round(seconds, 1)}
+    result.update(placement_accuracy(model, _corpus, _test))
+    return result
+
+
+def run_sweep(corpus_dir: str, sweep: dict, output_dir: str, processes: int = None, threads: int = 1) -> pd.DataFrame:
+    '''Runs the jobs of the sweep not in the results of output_dir yet, and returns all the results.'''
+    processes = processes or max(1, (os.cpu_count() or 1) // threads)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    results_path = Path(output_dir) / RESULTS
+    failed_path = Path(output_dir) / FAILED
+
+    models_dir = None
+    if sweep.get('save_models', False):
+        models_dir = os.path.join(output_dir, 'models')
+        os.makedirs(models_dir, exist_ok=True)
+
+    jobs = jobs_of(sweep)
+    done = done_jobs(output_dir)
+    pending = [job for job in jobs if job[0] not in done]
+    print(f'Sweep: {len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run in {processes} '
+          f'processes with {threads} threads each.')
+
+    initargs = (corpus_dir, sweep.get('test_size', 0.1), sweep.get('split_seed', 0))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=initargs) as pool:
+        futures = {pool.submit(run_job, job, threads, models_dir): job for job in pending}
+
+        failed = 0
+        for n, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = pd.DataFrame([future.result()])
+            except Exception as error:
+                # The job is recorded and the sweep goes on; it is not in the results, so it runs again on resume.
+                job_id, params, seed = futures[future]
+                failure = pd.DataFrame([{'job': job_id, 'seed': seed, 'params': json.dumps(params, sort_keys=True),
+                                         'error': repr(error)}])
+                failure.to_csv(failed_path, mode='a', header=not failed_path.exists(), index=False)
+                failed += 1
+                print(f'Job {n}/{len(pending)} ({job_id}) failed: {error!r}.')
+                continue
+
+            # Every job is saved as soon as it finishes, so an interrupted sweep keeps it.
+            header = not results_path.exists()
+            result.to_csv(results_path, mode='a', header=header, index=False)
+            print(f'Job {n}/{len(pending)} ({result["job"][0]}): accuracy@1 {result["accuracy@1"][0]:.3f}.')
+
+    if pending and failed:
+        print(f'{failed} of {len(pending)} jobs failed, see {failed_path}.')
+
+    return pd.read_csv(results_path) if results_path.exists() else pd.DataFrame()
+
+
+if __name__ == '__main__':
+
+    assert 4 <= len(sys.argv) <= 6, 'Usage: python -m src.models.sweep [corpus dir] [sweep file] [output dir] ' \
+                                    '[processes (optional)] [threads per job (optional)]'
+
+    corpus_dir = sys.argv[1]
+    sweep = json.loads(Path(sys.argv[2]).read_text())
+    output_dir = sys.argv[3]
+    processes = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    threads = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+
+    results = run_sweep(corpus_dir, sweep, output_dir, processes, threads)
+    assert len(results), f'No job of the sweep finished, see {os.path.join(output_dir, FAILED)}.'
+
+    # Summary of the repeated runs of every combination: the parameters are the columns between the seed and the time.
+    names = results.columns[results.columns.get_loc('seed') + 1:results.columns.get_loc('train_seconds')].tolist()
+    summary = results.groupby(names)[['accuracy@1', 'accuracy@2', 'train_seconds']].agg(['mean', 'std', 'count'])
+    print(summary.sort_values(('accuracy@1', 'mean'), ascending=False).to_string())
+    print(f'Results in {os.path.join(output_dir, RESULTS)}.')
+
+    # Stability of the placements across the seeds of every combination.
+    if sweep.get('save_models', False):
+        stability = sweep_stability(output_dir, results, names, workers=processes or 1)
+        if len(stability):
+            print(stability.to_string(index=False))
+            print(f'Stability in {os.path.join(output_dir, STABILITY)}.')
@@ -1,24 +1,43 @@
 
 '''
 This script trains a doc2vec model taking as argument a corpus with the structure
-[{label}, {list of tokens}] as a .csv file. The model is trained creating vectors for each 
-unique label. However, the corpus has repeating labels corresponding to the desired level 
+[{label}, {list of tokens}], either a memory-mapped corpus (see src/data/corpus.py), which is streamed
+from disk, or a .parquet or .csv file (see src/data/dataset.py). The model 
+is trained creating vectors for each unique label. However, the corpus has repeating labels corresponding to the desired level 
 of aggregation, e.g. a model for 1 legislature and using as labels the names of MPs, or 
 a model for several legislatures using party-legislature as labels.
 
-Usage: $python3 train-doc2vec.py [input file] [output file]
+Usage: $python3 -m src.models.train-doc2vec [input file] [output file] [mode (optional)] [workers (optional)]
+       $python3 -m src.models.train-doc2vec [input file] [output file] update [workers] [base model]
+                                            [previous corpus (optional)] [replay (optional)]
 
-- input file: csv file with columns: [{label}, {list of tokens}].
+- input file: directory with a memory-mapped corpus, or .parquet or .csv file with columns: [{label}, {list of tokens}].
 - output file: path for the model to be saved.
+- mode: 'iterable' (default) streams the TaggedDocuments from Python; 'file' (only for memory-mapped corpora) trains
+  from the corpus written once as a text file, with no Python iteration, which scales with the number of workers. In
+  that mode the vector of every label is the mean of the vectors of its documents, which is a different model from
+  the iterable one, with its own accuracy (see src/models/doc2vec.py and benchmarks/bench_doc2vec.py).
+  'update' goes on training a model already trained (e.g. models/final.mdl) with the new documents of the input
+  corpus (e.g. a new legislature), instead of training it from scratch (see src/models/doc2vec.py).
+- workers: number of worker threads (default: number of CPUs).
+- base model: model to update.
+- previous corpus: memory-mapped corpus the base model was trained on, from which the replay sample is taken.
+- replay: fraction of the previous corpus trained again together with the new documents (default 0.1).
+
+The update reports how far the vectors of the base model drifted and saves the report in {output file}.drift.csv.
 
 '''
 
 import gensim
 import multiprocessing
 import logging
-import pandas as pd
 import sys
 
+from src.data.corpus import Corpus, is_corpus
+from src.data.dataset import read_dataset
+from src.models import doc2vec
+from src.models.doc2vec import DEFAULTS
+
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
 cores = multiprocessing.cpu_count()
@@ -29,52 +48,65 @@ def read_corpus(fname):
     for line in fname:
         yield gensim.models.doc2vec.TaggedDocument(line[1], [line[0]])
 
-def train(train_corpus):
-
-    # Declare model with the given hyperparameters.
-    model = gensim.models.doc2vec.Doc2Vec(
-        dm = 1,
-        dm_mean = 1,
-        dbow_words= 0,
-        vector_size = 200,
-        window = 10, # +- 10 words for the window size.
-        min_count = 50, # Only include tokens that with a minimum count of 50 occurrences.
-        workers = cores,
-        epochs = 10,
-        hs = 0,
-        alpha = 0.025 # learning rate.
-    )
-
-    # Build the model vocabulary with the corpus.
-    model.build_vocab(
-        corpus_iterable= train_corpus
-    )
-
-    # Train the model.
-    model.train(
-        corpus_iterable = train_corpus, 
-        total_examples = model.corpus_count,
-        epochs = model.epochs
-    )
+def train(train_corpus, workers=cores):
 
-    return model
+    # Declare and train the model with the hyperparameters of doc2vec.DEFAULTS (dm=1, vector_size=200, window=10,
+    # min_count=50, epochs=10), using all the cores.
+    return doc2vec.train(train_corpus, DEFAULTS, workers=workers)
 
 def main():
 
-    assert len(sys.argv) == 3, 'Usage: $python3 train-doc2vec.py [input file] [output file]'
+    assert 3 <= len(sys.argv) <= 8, 'Usage: $python3 -m src.models.train-doc2vec [input file] [output file] ' \
+                                    '[mode (optional)] [workers (optional)] [base model (update)] ' \
+                                    '[previous corpus (update, optional)] [replay (update, optional)]'
 
     input_file = sys.argv[1]
     output_file = sys.argv[2]
-
-    # Read the .txt file as a list.
-    corpus = pd.read_csv(input_file)
-    corpus_as_list = corpus.values.tolist()
-
-    # Turn into list of TaggedDocument.
-    train_corpus = list(read_corpus(corpus_as_list))
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'iterable'
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else cores
+    assert mode in ('iterable', 'file', 'update'), 'The mode must be iterable, file or update.'
+    assert mode == 'iterable' or is_corpus(input_file), f'The {mode} mode needs a memory-mapped corpus.'
+
+    if mode == 'update':
+        assert len(sys.argv) >= 6, 'The update mode needs the base model.'
+        model = gensim.models.doc2vec.Doc2Vec.load(sys.argv[5])
+        previous = Corpus(sys.argv[6]) if len(sys.argv) > 6 else None
+        replay = float(sys.argv[7]) if len(sys.argv) > 7 else 0.1
+
+        model, drift = doc2vec.update(model, Corpus(input_file), previous, replay, workers)
+        model.save(fname_or_handle = output_file)
+        drift.to_csv(f'{output_file}.drift.csv', index=False)
+
+        # Summary of the drift, by party.
+        print(drift.groupby('party')[['cosine_distance', 'placement_change']].mean().to_string())
+        change = drift['placement_change'].mean()
+        print(f'Mean cosine distance {drift["cosine_distance"].mean():.4f} (max {drift["cosine_distance"].max():.4f}), '
+              f'mean placement change {change:.4f}.')
+        if change > doc2vec.RETRAIN_THRESHOLD:
+            print(f'The placements moved more than {doc2vec.RETRAIN_THRESHOLD}: a full retrain is advisable.')
+        else:
+            print('The placements were kept: the update can be used.')
+        return
+
+    if mode == 'file':
+        # Train from the corpus as a text file, read by the worker threads without Python.
+        model = doc2vec.train_file(Corpus(input_file), DEFAULTS, workers=workers)
+        model.save(fname_or_handle = output_file)
+        return
+
+    if is_corpus(input_file):
+        # Stream the TaggedDocuments from the memory-mapped corpus.
+        train_corpus = Corpus(input_file).tagged()
+    else:
+        # Read the corpus as a list, with the documents as lists of tokens.
+        corpus = read_dataset(input_file, columns=['label', 'document'])
+        corpus_as_list = corpus.values.tolist()
+
+        # Turn into list of TaggedDocument.
+        train_corpus = list(read_corpus(corpus_as_list))
 
     # Train the model.
-    model = train(train_corpus)
+    model = train(train_corpus, workers)
 
     # Save the model.
     model.save(fname_or_handle = output_file)
@@ -0,0 +1,184 @@
+'''
+Compact store of the vectors of a trained Doc2Vec model, to use them without loading the whole pickled model (its
+vocabulary, word vectors and training weights). A store is a directory with:
+
+- vectors.npy: the vectors of the tags (or documents), one per row, as float32 or float16.
+- labels.parquet: one row per vector with its «label», its «party» (see src/features/parties.py), its «position» in
+  the model (or in the input of the inference) and any other column of its tags.
+- words.npy, words.txt (optional): the word vectors and the words, one per line, in the same order.
+- meta.json: the model, the size and the type of the vectors, and whether the rows are sorted by label. Written last.
+
+The arrays are opened as memory maps, so a store opens in milliseconds and several processes reading it share the same
+pages of memory. The rows of an exported model are sorted by label, so all the tags with a prefix (e.g. every 'PP L*'
+tag) are a contiguous slice of the array, returned without copying it.
+
+Usage: $python -m src.models.vectors [model] [output dir] [words (optional)] [dtype (optional)]
+
+- model: a gensim doc2vec model.
+- output dir: directory where the store is saved.
+- words: 'yes' to also save the word vectors (default 'no').
+- dtype: 'float32' (default) or 'float16', which halves the size of the store.
+'''
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import gensim
+import numpy as np
+import pandas as pd
+
+from src.data.dataset import read_dataset, write_dataset
+from src.features.parties import party_of
+
+VECTORS = 'vectors.npy'
+LABELS = 'labels.parquet'
+WORD_VECTORS = 'words.npy'
+WORDS = 'words.txt'
+META = 'meta.json'
+
+
+def is_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META))
+
+
+def write_store(path: str, vectors: np.ndarray, tags: pd.DataFrame, words: list = None,
+                word_vectors: np.ndarray = None, dtype: str = 'float32', sort: bool = True, model: str = None):
+    '''
+    Saves vectors with their table of tags (with a column «label»), and optionally the word vectors. If sort, the rows
+    are sorted by label; their previous order is kept in the column «position».
+    '''
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / META).unlink(missing_ok=True)
+
+    tags = tags.reset_index(drop=True).copy()
+    tags['label'] = tags['label'].astype(str)
+    tags['position'] = np.arange(len(tags))
+    if 'party' not in tags.columns:
+        tags['party'] = party_of(tags['label']).astype(object).to_numpy()
+
+    if sort:
+        order = np.argsort(tags['label'].to_numpy(), kind='stable')
+        tags = tags.iloc[order].reset_index(drop=True)
+        vectors = vectors[order]
+
+    np.save(path / VECTORS, np.asarray(vectors, dtype=dtype))
+    write_dataset(tags, str(path / LABELS))
+
+    if words is not None:
+        np.save(path / WORD_VECTORS, np.asarray(word_vectors, dtype=dtype))
+        with open(path / WORDS, 'w', encoding='utf-8') as f:
+            f.writelines(f'{word}\n' for word in words)
+
+    # Written last, so an interrupted store is not taken as a valid one.
+    meta = {'model': model, 'vectors': len(tags), 'vector_size': int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            'dtype': dtype, 'sorted': sort, 'words': len(words) if words is not None else 0}
+    (path / META).write_text(json.dumps(meta))
+
+
+def export(model_path: str, path: str, words: bool = False, dtype: str = 'float32'):
+    '''Saves the vectors of the tags of a model (and optionally its word vectors) as a store.'''
+    model = gensim.models.doc2vec.Doc2Vec.load(model_path, mmap='r')
+    tags = pd.DataFrame({'label': model.dv.index_to_key})
+
+    if words:
+        write_store(path, model.dv.vectors, tags, list(model.wv.index_to_key), model.wv.vectors, dtype,
+                    model=model_path)
+    else:
+        write_store(path, model.dv.vectors, tags, dtype=dtype, model=model_path)
+
+
+class VectorStore:
+    '''Reads a store. The vectors are memory maps; only the table of labels (and the words, if any) is loaded.'''
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META).read_text())
+        self.vectors = np.load(self.path / VECTORS, mmap_mode='r')
+        self.tags = read_dataset(str(self.path / LABELS))
+        self.labels = self.tags['label'].astype(str).tolist()
+        self.index = {label: i for i, label in enumerate(self.labels)}
+
+        self.words = None
+        self.word_vectors = None
+        if self.meta['words']:
+            with open(self.path / WORDS, encoding='utf-8') as f:
+                self.words = f.read().split('\n')[:-1]
+            self.word_vectors = np.load(self.path / WORD_VECTORS, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, label: str) -> np.ndarray:
+        return self.vectors[self.index[label]]
+
+    def rows(self, prefix: str):
+        '''Returns the rows of the labels starting with prefix: a slice if the store is sorted, an array otherwise.'''
+        if self.meta['sorted']:
+            labels = self.tags['label'].astype(str).to_numpy()
+            # All the labels starting with prefix sort between prefix and prefix followed by the last character.
+            start = int(np.searchsorted(labels, prefix, side='left'))
+            end = int(np.searchsorted(labels, prefix + '\U0010ffff', side='left'))
+            return slice(start, end)
+
+        return np.flatnonzero(self.tags['label'].astype(str).str.startswith(prefix).to_numpy())
+
+    def prefix(self, prefix: str):
+        '''Returns the labels and the vectors of the labels starting with prefix (a view of the memory map if sorted).'''
+        rows = self.rows(prefix)
+        labels = self.labels[rows] if isinstance(rows, slice) else [self.labels[i] for i in rows]
+        return labels, self.vectors[rows]
+
+    def matrix(self, dtype=np.float32) -> np.ndarray:
+        '''Returns all the vectors in memory, as float32 by default (e.g. for scikit-learn).'''
+        return np.asarray(self.vectors, dtype=dtype)
+
+    def in_model_order(self):
+        '''Returns the labels and the vectors in the order of the model (or of the inference).'''
+        order = np.argsort(self.tags['position'].to_numpy())
+        return [self.labels[i] for i in order], self.vectors[order]
+
+
+def load_vectors(path: str):
+    '''
+    Returns the labels and the vectors (in memory, as float32) of the tags of a model or of a store, in the order of
+    the model. Models are loaded with their large arrays memory-mapped.
+    '''
+    if is_store(path):
+        labels, vectors = VectorStore(path).in_model_order()
+        return labels, np.asarray(vectors, dtype=np.float32)
+
+    model = gensim.models.doc2vec.Doc2Vec.load(path, mmap='r')
+    return list(model.dv.index_to_key), np.asarray(model.dv.vectors, dtype=np.float32)
+
+
+def open_vectors(path: str):
+    '''
+    Like load_vectors, but without reading the vectors into memory: returns the labels and the memory map of the vectors
+    of a store (in its order) or of a model (if its vectors were saved in a separate file, as gensim does with large
+    arrays), to be read in chunks.
+    '''
+    if is_store(path):
+        store = VectorStore(path)
+        return store.labels, store.vectors
+
+    model = gensim.models.doc2vec.Doc2Vec.load(path, mmap='r')
+    return list(model.dv.index_to_key), model.dv.vectors
+
+
+if __name__ == '__main__':
+
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m src.models.vectors [model] [output dir] [words (optional)] ' \
+                                    '[dtype (optional)]'
+
+    model_path = sys.argv[1]
+    output_dir = sys.argv[2]
+    words = sys.argv[3] == 'yes' if len(sys.argv) > 3 else False
+    dtype = sys.argv[4] if len(sys.argv) > 4 else 'float32'
+    assert dtype in ('float32', 'float16'), 'The dtype must be float32 or float16.'
+
+    export(model_path, output_dir, words, dtype)
+
+    print(f'Vectors of {model_path} saved in {output_dir}.')
@@ -0,0 +1,284 @@
+'''
+Entry point to run the whole pipeline, from the harvested metadata to the reduced embedding space. The stages are
+declared below as a DAG with their inputs, parameters and outputs, and every stage is fingerprinted with the content
+hash of its inputs, its parameters and the source code of its scripts. Only the stages whose fingerprint changed (or
+whose outputs are missing) are run again, and independent branches run at the same time.
+
+Since the fingerprints use the content of the inputs, a stage whose output did not change does not trigger the
+stages downstream: e.g. fixing a typo in the stopword list re-runs the tokenisation and what depends on the tokens,
+but never the PDF extraction; and changing the parameters of t-SNE does not retrain Doc2Vec.
+
+The fingerprints are saved in {work dir}/.pipeline/state.json, together with a cache of the hashes of the files by
+size and modification time, so large files are only hashed again when they change.
+
+Usage (from the root of the repository): $python -m src.pipeline [exports dir] [work dir] [params file] [workers]
+
+- exports dir: directory with the CSV files of the harvested metadata.
+- work dir: directory where the outputs of every stage are saved.
+- params file: optional JSON file {stage: {parameter: value}} overriding the default parameters (or resources) of
+  the stages.
+- workers: optional, number of stages run at the same time (default 2).
+'''
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from timeit import default_timer as timer
+
+PYTHON = sys.executable
+
+
+class Stage:
+    '''
+    A stage of the pipeline.
+
+    - name: unique name of the stage.
+    - command: command to run, as a list of arguments that can contain placeholders for the parameters, the work
+      dir ({work}) and the exports dir ({exports}).
+    - inputs: files or directories read by the stage. The outputs of other stages make them dependencies.
+    - outputs: files written by the stage.
+    - sources: source files of the stage, so that a change in the code re-runs it.
+    - params: parameters of the stage, which can be used in the command.
+    - resources: execution resources of the stage (e.g. number of workers), which can be used in the command but do
+      not change its outputs, so they are not part of the fingerprint.
+    - after: files that must exist before the stage runs (so their stages run first), but whose changes do not make
+      the stage run again.
+    '''
+
+    def __init__(self, name, command, inputs, outputs, sources, params=None, resources=None, after=None):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.sources = sources
+        self.params = params or {}
+        self.resources = resources or {}
+        self.after = after or []
+
+
+STAGES = [
+    Stage('metadata',
+          [PYTHON, '-m', 'src.data.preprocess_metadata', '{exports}', '{work}/metadata.csv', 'stream', '{workers}'],
+          inputs=['{exports}'], outputs=['{work}/metadata.csv'],
+          sources=['src/data/preprocess_metadata.py', 'src/data/concatenate.py'],
+          resources={'workers': os.cpu_count()}),
+
+    Stage('texts',
+          [PYTHON, '-m', 'src.data.obtain_texts', '{work}/metadata.csv', '{work}/texts.csv',
+           '{download_workers}', '{parse_workers}', 'incremental'],
+          inputs=['{work}/metadata.csv'], outputs=['{work}/texts.csv'],
+          sources=['src/data/obtain_texts.py', 'src/data/fetch.py', 'src/data/parse_cache.py',
+                   'src/data/segment.py', 'src/data/incremental.py'],
+          resources={'download_workers': 8, 'parse_workers': os.cpu_count()}),
+
+    Stage('political_group',
+          [PYTHON, '-m', 'src.features.political_group', '{work}/texts.csv', '{work}/groups.csv', 'incremental'],
+          inputs=['{work}/texts.csv'], outputs=['{work}/groups.csv'],
+          sources=['src/features/political_group.py', 'src/features/parties.py', 'src/data/incremental.py']),
+
+    Stage('tokens',
+          [PYTHON, '-m', 'src.features.preprocess_texts', '{work}/groups.csv', '{lemmatise}',
+           '{work}/tokens.parquet', '{workers}', '200', 'incremental'],
+          inputs=['{work}/groups.csv', 'spanish.txt'], outputs=['{work}/tokens.parquet'],
+          sources=['src/features/preprocess_texts.py', 'src/features/lemmatise.py', 'src/data/dataset.py',
+                   'src/data/incremental.py'],
+          params={'lemmatise': 'false'}, resources={'workers': os.cpu_count()}),
+
+    # The phrase models are only trained the first time (or when their code changes), so new interventions are phrased
+    # with the same version. They are retrained or updated by hand with src/features/phrases.py.
+    Stage('phrases',
+          [PYTHON, '-m', 'src.features.phrases', 'train', '{work}/tokens.parquet', '{work}/phrases'],
+          inputs=[], outputs=['{work}/phrases/LATEST'],
+          sources=['src/features/phrases.py', 'src/data/dataset.py'],
+          after=['{work}/tokens.parquet']),
+
+    Stage('phrased',
+          [PYTHON, '-m', 'src.features.phrases', 'apply', '{work}/tokens.parquet', '{work}/phrases',
+           '{work}/phrased.parquet', '{workers}', 'incremental'],
+          inputs=['{work}/tokens.parquet', '{work}/phrases/LATEST'], outputs=['{work}/phrased.parquet'],
+          sources=['src/features/phrases.py', 'src/data/dataset.py', 'src/data/incremental.py'],
+          resources={'workers': os.cpu_count()}),
+
+    Stage('corpus',
+          [PYTHON, '-m', 'src.data.generate-corpus', '{work}/tokens.parquet', '{work}/corpus'],
+          inputs=['{work}/tokens.parquet'], outputs=['{work}/corpus'],
+          sources=['src/data/generate-corpus.py', 'src/data/corpus.py', 'src/data/dataset.py',
+                   'src/features/parties.py', 'src/features/political_group.py']),
+
+    Stage('model',
+          [PYTHON, '-m', 'src.models.train-doc2vec', '{work}/corpus', '{work}/model.mdl'],
+          inputs=['{work}/corpus'], outputs=['{work}/model.mdl'],
+          sources=['src/models/train-doc2vec.py', 'src/models/doc2vec.py', 'src/data/corpus.py',
+                   'src/data/dataset.py']),
+
+    Stage('vectors',
+          [PYTHON, '-m', 'src.models.vectors', '{work}/model.mdl', '{work}/vectors'],
+          inputs=['{work}/model.mdl'], outputs=['{work}/vectors'],
+          sources=['src/models/vectors.py', 'src/features/parties.py']),
+
+    Stage('reduce_pca',
+          [PYTHON, '-m', 'src.reduce.reduce-dimension', '{work}/vectors', '{work}/reduced-pca.csv', 'pca'],
+          inputs=['{work}/vectors'], outputs=['{work}/reduced-pca.csv', '{work}/reduced-pca.csv.space.pkl'],
+          sources=['src/reduce/reduce-dimension.py', 'src/models/vectors.py', 'src/features/parties.py']),
+
+    Stage('reduce_tsne',
+          [PYTHON, '-m', 'src.reduce.reduce-dimension', '{work}/vectors', '{work}/reduced-tsne.csv', 'tsne'],
+          inputs=['{work}/vectors'], outputs=['{work}/reduced-tsne.csv', '{work}/reduced-tsne.csv.space.pkl'],
+          sources=['src/reduce/reduce-dimension.py', 'src/models/vectors.py', 'src/features/parties.py']),
+]
+
+
+class Pipeline:
+
+    def __init__(self, stages, exports, work, params=None):
+        self.exports = exports
+        self.work = work
+        self.stages = {stage.name: stage for stage in stages}
+        self.params = {name: {**stage.params, **stage.resources, **(params or {}).get(name, {})}
+                       for name, stage in self.stages.items()}
+
+        self.state_path = Path(work) / '.pipeline' / 'state.json'
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text())
+        else:
+            self.state = {'fingerprints': {}, 'files': {}}
+
+        # A stage depends on the stages producing any of its inputs.
+        producers = {output: name for name in self.stages for output in self.paths(name, 'outputs')}
+        self.dependencies = {name: {producers[i] for i in self.paths(name, 'inputs') + self.paths(name, 'after')
+                                    if i in producers}
+                             for name in self.stages}
+
+    def paths(self, name, kind):
+        return [path.format(work=self.work, exports=self.exports) for path in getattr(self.stages[name], kind)]
+
+    def command(self, name, resources=True):
+        params = dict(self.params[name])
+        if not resources:
+            params.update({key: f'{{{key}}}' for key in self.stages[name].resources})
+
+        return [arg.format(work=self.work, exports=self.exports, **params) for arg in self.stages[name].command]
+
+    def hash_file(self, path):
+        # Files are only hashed again if their size or modification time changed.
+        stat = os.stat(path)
+        key = f'{stat.st_size}:{stat.st_mtime_ns}'
+        cached = self.state['files'].get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+        self.state['files'][path] = [key, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash_path(self, path):
+        if os.path.isdir(path):
+            files = sorted(str(p) for p in Path(path).rglob('*') if p.is_file())
+            entries = [(os.path.relpath(f, path), self.hash_file(f)) for f in files]
+            return hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()
+
+        if os.path.exists(path):
+            return self.hash_file(path)
+
+        return None
+
+    def fingerprint(self, name):
+        params = {key: value for key, value in self.params[name].items() if key not in self.stages[name].resources}
+        content = {
+            'command': self.command(name, resources=False),
+            'params': params,
+            'inputs': {path: self.hash_path(path) for path in self.paths(name, 'inputs')},
+            'sources': {path: self.hash_path(path) for path in self.stages[name].sources},
+        }
+
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def outdated(self, name):
+        if not all(os.path.exists(path) for path in self.paths(name, 'outputs')):
+            return True
+
+        return self.state['fingerprints'].get(name) != self.fingerprint(name)
+
+    def run_stage(self, name):
+        start = timer()
+        print(f'[{name}] running: {" ".join(self.command(name))}')
+        subprocess.run(self.command(name), check=True)
+        print(f'[{name}] finished in {timer() - start:.1f} seconds.')
+
+    def save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.state, indent=1))
+        tmp.replace(self.state_path)
+
+    def run(self, workers=2):
+        '''Runs the outdated stages, each one as soon as all its dependencies finished. Returns the failed stages.'''
+        Path(self.work).mkdir(parents=True, exist_ok=True)
+        done, failed, running = set(), set(), {}
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # Stages whose dependencies finished. The decision to run them is taken at this point, once the
+                # content of their inputs is known.
+                ready = [name for name in self.stages if name not in done | failed | set(running.values())
+                         and self.dependencies[name] <= done]
+
+                for name in ready:
+                    if self.outdated(name):
+                        running[pool.submit(self.run_stage, name)] = name
+                    else:
+                        print(f'[{name}] up to date.')
+                        done.add(name)
+
+                # Stages that can no longer run because a dependency failed.
+                for name in self.stages:
+                    if name not in failed and self.dependencies[name] & failed:
+                        failed.add(name)
+
+                if not running:
+                    if any(name not in done | failed for name in self.stages):
+                        continue
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        self.state['fingerprints'][name] = self.fingerprint(name)
+                        done.add(name)
+                    except subprocess.CalledProcessError as e:
+                        print(f'[{name}] failed with exit code {e.returncode}.')
+                        failed.add(name)
+
+                    self.save_state()
+
+        self.save_state()
+        return failed
+
+
+if __name__ == '__main__':
+
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python -m src.pipeline [exports dir] [work dir] ' \
+                                    '[params file (optional)] [workers (optional)]'
+
+    exports = sys.argv[1]
+    work = sys.argv[2]
+    params = json.loads(Path(sys.argv[3]).read_text()) if len(sys.argv) > 3 else None
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+
+    failed = Pipeline(STAGES, exports, work, params).run(workers)
+
+    if failed:
+        print(f'Failed stages: {", ".join(sorted(failed))}.')
+        sys.exit(1)
+
+    print('Pipeline finished.')
@@ -1,93 +1,194 @@
 '''
-This script reduces the dimension using either PCA or T-SNE by taking a model as an argument 
-and returns a .csv file containing the 2 most relevant dimensions and the unique labels for 
-each group of documents. Additionally, it creates an extra column with the colors of each 
+This script reduces the dimension using either PCA or T-SNE by taking a model as an argument
+and returns a .csv file containing the 2 most relevant dimensions and the unique labels for
+each group of documents. Additionally, it creates extra columns with the colors and markers of each
 party.
 
-Usage: $python3 reduce-dimension.py [input file] [output file] [pca/tsne]
+Methods:
 
-- input file: a gensim doc2vec model.
+- pca: exact PCA of all the vectors in memory.
+- rpca: PCA with a randomized SVD, much faster than the exact one with many labels.
+- ipca: incremental PCA, which reads the vectors in chunks from the memory map of a store (see src/models/vectors.py),
+  so they are never all in memory at once. For MP or intervention granularity.
+- tsne: T-SNE with the default parameters of scikit-learn.
+- tsne-pca: Barnes-Hut T-SNE initialised with the PCA of the vectors (so the global layout is kept and runs are
+  stable), run in several threads on the vectors first reduced to PCA_DIMENSIONS with a randomized PCA.
+
+Every reduction also saves its fitted space in {output file}.space.pkl, so new points (e.g. the vectors of a new week
+inferred with src/models/infer.py) can be placed in it without fitting it again: the PCA methods project them with
+the fitted components, and the T-SNE methods place every new point at the mean of the 2-D positions of its NEIGHBOURS
+closest fitted points, weighted by their similarity.
+
+Usage: $python3 -m src.reduce.reduce-dimension [input file] [output file] [method] [threads (optional)]
+       $python3 -m src.reduce.reduce-dimension [input file] [output file] project [space file]
+
+- input file: a gensim doc2vec model, or a store with its vectors (see src/models/vectors.py).
 - output file: the path to save the .csv file.
-- pca/tsne: method to reduce dimensionality.
+- method: method to reduce dimensionality (see above, default 'tsne'), or 'project' to place the vectors of the input
+  file in the space of a previous reduction.
+- threads: number of threads of the T-SNE methods (default 1, -1 for all the CPUs).
+- space file: the .space.pkl file of a previous reduction.
 '''
 
+import pickle
 import sys
-import gensim
 import pandas as pd
 import numpy as np
 from sklearn.manifold import TSNE
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from src.features.parties import colors, markers
+from src.models.vectors import load_vectors, open_vectors
+
+METHODS = ['pca', 'rpca', 'ipca', 'tsne', 'tsne-pca']
+
+# Rows of the vectors read at once by the incremental PCA and by the projections.
+BATCH_SIZE = 10000
+
+# Dimensions of the PCA applied before the T-SNE of tsne-pca, and closest fitted points of a projected one.
+PCA_DIMENSIONS = 50
+NEIGHBOURS = 10
+
+SPACE = '.space.pkl'
+
+
+def batches(z, batch_size=BATCH_SIZE):
+    '''Yields the rows of z in chunks as float32 arrays, reading them from the memory map if z is one.'''
+    for start in range(0, len(z), batch_size):
+        yield np.asarray(z[start:start + batch_size], dtype=np.float32)
 
-def reduce_dimension(model, method):
-    
-    labels = model.dv.index_to_key
-    L = len(labels)
-    M = model.vector_size
 
-    z = np.zeros((L, M))
+def normalise(z):
+    return z / np.maximum(np.linalg.norm(z, axis=1, keepdims=True), 1e-12)
+
+
+def fit_space(z, method, threads=1, seed=0):
+    '''Returns the 2-D coordinates of the vectors z and the fitted space, to project new points (see project).'''
+    space = {'method': method}
+
+    if method == 'ipca':
+        # The last chunk is added to the previous one if it is smaller than the components.
+        reducer = IncrementalPCA(n_components=2, batch_size=BATCH_SIZE)
+        starts = list(range(0, len(z), BATCH_SIZE))
+        if len(starts) > 1 and len(z) - starts[-1] < 2:
+            starts.pop()
+        for start, end in zip(starts, starts[1:] + [len(z)]):
+            reducer.partial_fit(np.asarray(z[start:end], dtype=np.float32))
+        space['reducer'] = reducer
+        return np.vstack([reducer.transform(batch) for batch in batches(z)]), space
+
+    z = np.asarray(z, dtype=np.float32)
+
+    if method in ('pca', 'rpca'):
+        if method == 'pca':
+            reducer = PCA(n_components=2)
+        else:
+            reducer = PCA(n_components=2, svd_solver='randomized', random_state=seed)
+        space['reducer'] = reducer
+        return reducer.fit_transform(z), space
 
-    for i in range(L):
-        z[i,:] = model.dv[i]
-    
     if method == 'tsne':
         dr = TSNE(n_components=2)
-    elif method == 'pca':
-        dr = PCA(n_components=2)
+    elif method == 'tsne-pca':
+        if z.shape[1] > PCA_DIMENSIONS and len(z) > PCA_DIMENSIONS:
+            space['reducer'] = PCA(n_components=PCA_DIMENSIONS, svd_solver='randomized', random_state=seed)
+            z = space['reducer'].fit_transform(z)
+        dr = TSNE(n_components=2, init='pca', method='barnes_hut', learning_rate='auto', n_jobs=threads,
+                  random_state=seed)
     else:
-        raise ValueError('Methods allowed: "pca" or "tsne"')
+        raise ValueError(f'Methods allowed: {", ".join(METHODS)}')
 
     Z = dr.fit_transform(z)
 
+    # T-SNE has no transform: the fitted points are kept to place new ones among their neighbours.
+    space['points'] = normalise(z).astype(np.float32)
+    space['embedding'] = Z.astype(np.float32)
+    return Z, space
+
+
+def project(space, z, neighbours=NEIGHBOURS):
+    '''Returns the 2-D coordinates of new vectors z in a fitted space, in chunks.'''
+    reducer = space.get('reducer')
+    result = []
+
+    for batch in batches(z):
+        if reducer is not None:
+            batch = reducer.transform(batch)
+
+        if 'embedding' not in space:
+            result.append(batch)
+            continue
+
+        # Cosine similarity with the fitted points, and mean position of the closest ones weighted by it.
+        similarities = normalise(batch) @ space['points'].T
+        k = min(neighbours, similarities.shape[1])
+        closest = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        weights = np.maximum(np.take_along_axis(similarities, closest, axis=1), 0) + 1e-6
+        weights /= weights.sum(axis=1, keepdims=True)
+        result.append(np.einsum('nk,nkd->nd', weights, space['embedding'][closest]))
+
+    return np.vstack(result) if result else np.zeros((0, 2), dtype=np.float32)
+
+
+def reduce_dimension(labels, z, method, threads=1):
+
+    Z, _ = fit_space(z, method, threads)
+
+    return to_frame(labels, Z)
+
+
+def to_frame(labels, Z):
+
     Z = pd.DataFrame(Z)
     Z.columns = ['dim1', 'dim2']
     Z['label'] = labels
 
     return Z
 
-def get_color(Z):
-    labels = Z['label'].tolist()
-    col = []
-
-    for i in range(len(labels)):
-        if 'GVOX' in labels[i]:
-            col.append('#82b431')
-        elif 'GS' in labels[i]:
-            col.append('#c10200')
-        elif 'GCs' in labels[i]:
-            col.append('#f87729')
-        elif 'GP' in labels[i]:
-            col.append('#1eb3e6')
-        elif 'GCUP-EC-GC' in labels[i]:
-            col.append('#a245b2')
-        elif 'GR' in labels[i]:
-            col.append('#f99f00')
-        elif 'GV (EAJ-PNV)' in labels[i]:
-            col.append('#008146')
-        elif 'GEH Bildu' in labels[i]:
-            col.append('#bbce00')
-        else:
-            col.append('#000000')
 
-    Z['col'] = col
+def get_color(Z):
+    '''Adds the colour and the marker of the party of every label, from the registry in src/features/parties.py.'''
+    Z['col'] = colors(Z['label']).to_numpy()
+    Z['marker'] = markers(Z['label']).to_numpy()
     return Z
 
+
 def main():
 
-    assert len(sys.argv) >= 3, 'Usage: python3 reduce-dimension.py [input file] [output file] [pca/tsne]'
+    assert 3 <= len(sys.argv) <= 5, 'Usage: python3 -m src.reduce.reduce-dimension [input file] [output file] ' \
+                                    '[method] [threads (optional)], or [input file] [output file] project [space file]'
 
     model_path = sys.argv[1]
     output_file = sys.argv[2]
+    method = sys.argv[3] if len(sys.argv) > 3 else 'tsne'
 
-    model = gensim.models.doc2vec.Doc2Vec.load(model_path)
+    if method == 'project':
+        assert len(sys.argv) == 5, 'The space file of a previous reduction is needed to project.'
+        with open(sys.argv[4], 'rb') as f:
+            space = pickle.load(f)
 
-    if sys.argv[3]:
-        method = sys.argv[3]
+        labels, z = open_vectors(model_path)
+        Z = to_frame(labels, project(space, z))
     else:
-        method = 'tsne'
+        assert method in METHODS, f'Methods allowed: {", ".join(METHODS)}'
+        threads = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+        # The vectors of the tags only, without loading the rest of the model. The incremental PCA reads them in
+        # chunks from the memory map.
+        if method == 'ipca':
+            labels, z = open_vectors(model_path)
+        else:
+            labels, z = load_vectors(model_path)
+
+        Z, space = fit_space(z, method, threads)
+        Z = to_frame(labels, Z)
+
+        with open(output_file + SPACE, 'wb') as f:
+            pickle.dump(space, f)
 
-    Z = reduce_dimension(model, method)
     Z = get_color(Z)
 
     Z.to_csv(output_file, index=False)
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+'''
+Small labelled corpora, whose parties use partly different words, to train Doc2Vec models in a few seconds.
+'''
+
+import random
+
+import pandas as pd
+
+from src.data.corpus import write_corpus
+
+COMMON = [f'comun{i}' for i in range(40)]
+PARTIES = ['PP', 'PSOE', 'VOX', 'UP', 'PNV']
+
+# Small models of the thesis configuration (see src/models/doc2vec.py).
+PARAMS = {'vector_size': 16, 'window': 3, 'min_count': 1, 'epochs': 5}
+
+
+def corpus_data(documents: int = 300, legislatures: list = (12, 13), seed: int = 0, empty: float = 0.0,
+                parties: list = PARTIES) -> pd.DataFrame:
+    '''Returns a corpus with the format [label, document], with labels such as 'PP L12'.'''
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(documents):
+        party, legislature = rng.choice(parties), rng.choice(legislatures)
+        own = [f'{party.lower()}{i}' for i in range(10)]
+        length = 0 if rng.random() < empty else rng.randrange(5, 30)
+        document = [rng.choice(own) if rng.random() < 0.5 else rng.choice(COMMON) for _ in range(length)]
+        rows.append({'label': f'{party} L{legislature}', 'document': document})
+
+    return pd.DataFrame(rows)
+
+
+def make_corpus(path, **kwargs) -> str:
+    write_corpus(corpus_data(**kwargs), str(path))
+    return str(path)
@@ -0,0 +1,53 @@
+'''
+Minimal PDFs with text at given positions, to test the extraction without real sessions of the Diario de Sesiones.
+'''
+
+import random
+
+WORDS = ['el', 'senor', 'presidente', 'diputados', 'gobierno', 'ley', 'congreso', 'politica', 'economia']
+
+
+def write_pdf(path, pages: list, width: int = 595, height: int = 842):
+    '''Writes a PDF whose pages are lists of (x, y, text), with y from the bottom of the page as in PDF.'''
+    objects = {1: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'}
+    kids = []
+    for i, lines in enumerate(pages):
+        page, contents = 3 + 2 * i, 4 + 2 * i
+        stream = b'\n'.join([b'BT /F1 9 Tf'] + [b'1 0 0 1 %d %d Tm (%s) Tj' % (x, y, text.encode('latin-1'))
+                                                 for x, y, text in lines] + [b'ET'])
+        objects[page] = b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 1 0 R >> >> ' \
+                        b'/Contents %d 0 R >>' % (width, height, contents)
+        objects[contents] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+        kids.append(page)
+    objects[2] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % k for k in kids), len(kids))
+    catalog = max(objects) + 1
+    objects[catalog] = b'<< /Type /Catalog /Pages 2 0 R >>'
+
+    body = b'%PDF-1.4\n'
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(body)
+        body += b'%d 0 obj\n%s\nendobj\n' % (number, objects[number])
+    xref = len(body)
+    body += b'xref\n0 %d\n0000000000 65535 f \n' % (catalog + 1)
+    body += b''.join(b'%010d 00000 n \n' % offsets[number] for number in range(1, catalog + 1))
+    body += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (catalog + 1, catalog, xref)
+
+    with open(path, 'wb') as f:
+        f.write(body)
+
+
+def session_pdf(path, pages: int, two_columns: bool, seed: int = 0):
+    '''A session with a running header and a page number on every page, and its text in one or two columns.'''
+    rng = random.Random(seed)
+    columns = [(40, 6), (310, 6)] if two_columns else [(40, 12)]
+
+    content = []
+    for number in range(pages):
+        lines = [(50, 800, f'DIARIO DE SESIONES PAGINA {number + 1}')]
+        for x, words in columns:
+            lines += [(x, y, ' '.join(rng.choice(WORDS) for _ in range(words))) for y in range(740, 80, -11)]
+        lines.append((280, 40, str(number + 1)))
+        content.append(lines)
+
+    write_pdf(path, content)
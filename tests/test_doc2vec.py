@@ -0,0 +1,85 @@
+'''
+Doc2Vec models of src/models/doc2vec.py trained from the corpus as a text file: the lines of the file are the documents
+with tokens, in order, and the vector of every label is the mean of the vectors of its documents. A model updated with
+new material keeps the tags it had and adds the new ones, and the drift computed in batches is the dense one.
+'''
+
+import numpy as np
+import pandas as pd
+
+from src.data.corpus import Corpus
+from src.models import doc2vec
+from src.models.doc2vec import drift, label_vectors, placement_accuracy, split, train, train_file, update
+from tests.corpora import PARAMS, make_corpus
+
+
+def test_lines_skip_the_empty_documents(tmp_path):
+    corpus = Corpus(make_corpus(tmp_path / 'corpus', empty=0.2))
+    documents = corpus.nonempty()
+    assert 0 < len(documents) < len(corpus)
+    assert (corpus.lengths()[documents] > 0).all()
+
+    with open(corpus.lines(), encoding='utf-8') as f:
+        lines = f.read().split('\n')[:-1]
+    assert lines == [' '.join(corpus.words(i)) for i in documents.tolist()]
+
+
+def test_label_vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 4)).astype(np.float32)
+    labels = rng.choice(['PSOE L12', 'PP L12', 'VOX L13'], size=20).tolist()
+
+    result = label_vectors(vectors, labels)
+    assert result.index_to_key == list(dict.fromkeys(labels))
+    for label in result.index_to_key:
+        mask = np.array(labels) == label
+        assert np.allclose(result[label], vectors[mask].mean(axis=0), atol=1e-6)
+
+
+def test_train_file_gives_every_label_a_vector(tmp_path):
+    corpus = Corpus(make_corpus(tmp_path / 'corpus', empty=0.2))
+    model = train_file(corpus, PARAMS)
+
+    labels = pd.Series(corpus.labels)[corpus.nonempty()]
+    assert model.dv.index_to_key == labels.unique().tolist()
+
+    _, test = split(len(corpus), 0.2)
+    result = placement_accuracy(model, corpus, test)
+    assert result['evaluated'] > 0 and 0 <= result['accuracy@1'] <= 1
+
+
+def test_update_keeps_the_previous_tags(tmp_path):
+    previous = Corpus(make_corpus(tmp_path / 'previous', legislatures=[12, 13]))
+    corpus = Corpus(make_corpus(tmp_path / 'corpus', legislatures=[14], seed=1))
+    model = train(previous.tagged(), PARAMS)
+    keys = list(model.dv.index_to_key)
+
+    model, report = update(model, corpus, previous, replay=0.2)
+    new = sorted(set(corpus.labels))
+    assert model.dv.index_to_key[:len(keys)] == keys
+    assert sorted(model.dv.index_to_key[len(keys):]) == new
+    assert report['label'].tolist() == keys
+    assert report[['cosine_distance', 'norm_change', 'placement_change']].notna().all().all()
+
+    # Every new document has the party of some tag of the updated model, so all of them are evaluated.
+    assert placement_accuracy(model, corpus, range(len(corpus)))['evaluated'] == len(corpus)
+
+
+def test_drift_in_batches_is_the_dense_drift(monkeypatch):
+    rng = np.random.default_rng(0)
+    keys = [f'PP L{i}' for i in range(50)]
+    previous = rng.normal(size=(50, 8)).astype(np.float32)
+    model = label_vectors(previous + rng.normal(scale=0.1, size=(50, 8)).astype(np.float32), keys)
+
+    dense = drift(keys, previous, model)
+    monkeypatch.setattr(doc2vec, 'DRIFT_BATCH', 7)
+    batched = drift(keys, previous, model)
+    pd.testing.assert_frame_equal(batched, dense, atol=1e-6)
+
+    # Mean change of the cosine similarity of every tag with the others.
+    def similarities(vectors):
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors @ vectors.T
+
+    changes = np.abs(similarities(previous) - similarities(model.vectors))
+    assert np.allclose(dense['placement_change'], changes.sum(axis=1) / 49, atol=1e-5)
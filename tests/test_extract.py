@@ -0,0 +1,44 @@
+'''
+Extraction backends of obtain_texts.py: the 'chars' backend finds the running headers and footers of the pages and
+leaves them out, and gives the text of the 'crop' backend where the fixed areas already leave them out.
+'''
+
+import pdfplumber
+
+from src.data.obtain_texts import SINGLE_COLUMN, TWO_COLUMNS, body_region, extract_pages
+from tests.pdfs import session_pdf
+
+WHOLE_PAGE = [(0, 0, 0.5, 1), (0.5, 0, 1, 1)]
+
+
+def test_body_region_between_header_and_footer(tmp_path):
+    session_pdf(tmp_path / 'session.pdf', 5, two_columns=True)
+
+    with pdfplumber.open(tmp_path / 'session.pdf') as pdf:
+        header, footer = body_region(pdf.pages)
+        first_line = min(char['top'] for char in pdf.pages[0].chars if char['top'] > 50)
+        page_number = max(char['top'] for char in pdf.pages[0].chars)
+
+        assert 42 < header < first_line
+        assert footer < page_number
+
+        # Too few pages to tell.
+        assert body_region(pdf.pages[:2]) == (None, None)
+
+
+def test_chars_leaves_headers_and_footers_out(tmp_path):
+    session_pdf(tmp_path / 'session.pdf', 5, two_columns=True)
+
+    text = extract_pages(tmp_path / 'session.pdf', WHOLE_PAGE, 0, 5, 'chars')
+    assert 'DIARIO' not in text
+    assert text.split() and not any(word.isdigit() for word in text.split())
+
+    # With the whole page cropped, the crop backend keeps them.
+    assert 'DIARIO' in extract_pages(tmp_path / 'session.pdf', WHOLE_PAGE, 0, 5, 'crop')
+
+
+def test_chars_matches_crop_with_the_areas_of_the_formats(tmp_path):
+    for areas, two_columns in ((TWO_COLUMNS, True), (SINGLE_COLUMN, False)):
+        session_pdf(tmp_path / 'session.pdf', 4, two_columns)
+        chars = extract_pages(tmp_path / 'session.pdf', areas, 0, 4, 'chars')
+        assert chars == extract_pages(tmp_path / 'session.pdf', areas, 0, 4, 'crop')
@@ -0,0 +1,69 @@
+'''
+Fetch stage (src/data/fetch.py) against a local HTTP server: the PDFs are downloaded once, cached by content and
+found again by a new fetcher without touching the network.
+'''
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.data.fetch import Fetcher
+
+PDFS = {'/a.pdf': b'%PDF-1.4 a', '/b.pdf': b'%PDF-1.4 b', '/same-as-a.pdf': b'%PDF-1.4 a'}
+
+
+@pytest.fixture
+def server():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            requests.append(self.path)
+            content = PDFS.get(self.path)
+            if content is None:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}', requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_all_downloads_once_and_caches_by_content(server, tmp_path):
+    url, requests = server
+    urls = [url + path for path in PDFS] + [url + '/a.pdf']
+
+    paths = Fetcher(str(tmp_path), workers=4, rate=0).fetch_all(urls)
+
+    assert sorted(requests) == sorted(PDFS)
+    for path, content in PDFS.items():
+        assert paths[url + path].read_bytes() == content
+    # Identical PDFs behind different URLs are stored once.
+    assert paths[url + '/a.pdf'] == paths[url + '/same-as-a.pdf']
+
+    # A new fetcher on the same cache does not download them again.
+    requests.clear()
+    again = Fetcher(str(tmp_path), workers=4, rate=0).fetch_all(urls)
+    assert requests == []
+    assert again == paths
+
+
+def test_missing_pdf_is_not_retried(server, tmp_path):
+    url, requests = server
+
+    paths = Fetcher(str(tmp_path), workers=1, rate=0, retries=3, backoff=0).fetch_all([url + '/missing.pdf'])
+
+    assert paths == {url + '/missing.pdf': None}
+    assert requests == ['/missing.pdf']
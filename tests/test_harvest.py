@@ -0,0 +1,56 @@
+'''
+HTTP client of the harvester (src/data/harvest.py) against the stub that replays the recording in data/harvest-stub:
+the windows are split as the counts require, the files hold every intervention of the period and are read by
+concatenate.py, and the watermark moves forward only.
+'''
+
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from src.data.concatenate import read_export
+from src.data.harvest import MAX_RESULTS, HttpHarvester, parse_count
+from src.data.harvest_stub import StubServer
+
+RECORDING = Path(__file__).parent.parent / 'data' / 'harvest-stub'
+SINCE, UNTIL = date(2023, 2, 1), date(2023, 2, 3)
+
+
+def test_parse_count():
+    assert parse_count('') == 0
+    assert parse_count('25 resultados') == 25
+    assert parse_count('Resultados 1 a 25 de 1.020') == 1020
+
+
+def test_harvest_replays_the_recording(tmp_path):
+    with StubServer(str(RECORDING)) as stub:
+        harvester = HttpHarvester(str(tmp_path), stub.url, rate=0, retries=1)
+        total = harvester.count(SINCE, UNTIL)
+        windows = list(harvester.windows(SINCE, UNTIL))
+        paths = harvester.harvest(SINCE, UNTIL)
+
+    assert not stub.missing
+    assert total > MAX_RESULTS
+    assert len(windows) > 1 and all(n <= MAX_RESULTS for _, _, n in windows)
+    assert sum(n for _, _, n in windows) == total
+
+    rows = sum(len(chunk) for path in paths for chunk in read_export(str(path)))
+    assert rows == total
+    assert harvester.load_watermark() == UNTIL
+
+
+def test_request_not_recorded_fails(tmp_path):
+    with StubServer(str(RECORDING)) as stub:
+        harvester = HttpHarvester(str(tmp_path), stub.url, rate=0, retries=1)
+        with pytest.raises(ConnectionError):
+            harvester.count(date(2020, 1, 1), date(2020, 1, 2))
+
+    assert len(stub.missing) == 1
+
+
+def test_watermark_never_moves_back(tmp_path):
+    harvester = HttpHarvester(str(tmp_path))
+    harvester.save_watermark(UNTIL)
+    harvester.save_watermark(SINCE)
+    assert harvester.load_watermark() == UNTIL
@@ -0,0 +1,67 @@
+'''
+Incremental mode (src/data/incremental.py): the fingerprints do not depend on the types the dataset was read with,
+and a rerun processes only the new or changed rows and drops the removed ones.
+'''
+
+import pandas as pd
+
+from src.data.dataset import read_dataset, write_dataset
+from src.data.incremental import fingerprint, run_incremental, seen_path
+
+
+def interventions(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(['2023-02-01'] * n),
+        'numero_expediente': [f'{210 + i}/000001' for i in range(n)],
+        'orador': [f'Diputado {i}' for i in range(n)],
+        'legislatura': [14] * n,
+        'texto': [f'Intervención número {i}.' for i in range(n)],
+    })
+
+
+def upper(data: pd.DataFrame) -> pd.DataFrame:
+    data = data.copy()
+    data['texto'] = data['texto'].str.upper()
+    return data
+
+
+def test_fingerprints_do_not_depend_on_the_format(tmp_path):
+    data = interventions(5)
+    expected = fingerprint(data)
+
+    for name in ['data.csv', 'data.parquet']:
+        write_dataset(data, str(tmp_path / name))
+        assert fingerprint(read_dataset(str(tmp_path / name))).tolist() == expected.tolist()
+
+    assert expected.is_unique
+    assert (fingerprint(data, salt='v2') != expected).all()
+
+    changed = data.copy()
+    changed.loc[2, 'texto'] = 'Otra intervención.'
+    assert (fingerprint(changed) != expected).tolist() == [False, False, True, False, False]
+
+
+def test_reruns_process_only_the_changes(tmp_path):
+    output_file = str(tmp_path / 'output.parquet')
+    data = interventions(6)
+
+    merged, processed = run_incremental(data, output_file, upper)
+    assert processed == 6
+    assert merged['texto'].tolist() == data['texto'].str.upper().tolist()
+
+    _, processed = run_incremental(data, output_file, upper)
+    assert processed == 0
+
+    # A changed row, a removed row and a new row.
+    data.loc[1, 'texto'] = 'Intervención corregida.'
+    data = pd.concat([data.drop(index=4), interventions(7).tail(1)], ignore_index=True)
+
+    merged, processed = run_incremental(data, output_file, upper)
+    assert processed == 2
+    assert merged['texto'].tolist() == data['texto'].str.upper().tolist()
+    assert read_dataset(output_file)['texto'].tolist() == merged['texto'].tolist()
+    assert sorted(open(seen_path(output_file)).read().split()) == sorted(fingerprint(data))
+
+    # A new salt (e.g. a new version of the stage) processes everything again.
+    _, processed = run_incremental(data, output_file, upper, salt='v2')
+    assert processed == len(data)
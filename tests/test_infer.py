@@ -0,0 +1,58 @@
+'''
+Inference of src/models/infer.py: a document gets the same vector whatever the process, chunk or hash salt that infers
+it, the cache gives back the inferred vectors, and gensim itself is left as it is.
+'''
+
+import gensim
+import numpy as np
+from gensim.models import keyedvectors
+
+from src.data.corpus import Corpus
+from src.models import infer
+from src.models.doc2vec import train
+from tests.corpora import PARAMS, make_corpus
+
+
+def model_and_corpus(tmp_path):
+    path = make_corpus(tmp_path / 'corpus', documents=200)
+    corpus = Corpus(path)
+    model_path = str(tmp_path / 'model.mdl')
+    train(corpus.tagged(), PARAMS).save(model_path)
+    return model_path, path, corpus
+
+
+def test_inference_is_reproducible(tmp_path):
+    model_path, path, corpus = model_and_corpus(tmp_path)
+    documents = [corpus.words(i) for i in range(len(corpus))]
+
+    serial, keys = infer.infer_vectors(model_path, documents, workers=1, cache=False)
+    parallel, _ = infer.infer_vectors(model_path, documents, workers=2, chunksize=7, cache=False)
+    assert np.array_equal(serial, parallel)
+    assert np.abs(serial).sum(axis=1).min() > 0
+
+    # Repeated documents get the vector of their first occurrence.
+    repeated, _ = infer.infer_vectors(model_path, documents[:5] * 2, workers=1, cache=False)
+    assert np.array_equal(repeated, np.vstack([serial[:5]] * 2))
+
+    # New processes with other hash salts.
+    assert infer.check(model_path, path, workers=2, documents=50) == 0
+
+
+def test_cache(tmp_path):
+    model_path, _, corpus = model_and_corpus(tmp_path)
+    documents = [corpus.words(i) for i in range(50)]
+
+    first, keys = infer.infer_vectors(model_path, documents[:30])
+    cache = infer.Cache(model_path, PARAMS['epochs'], 1)
+    assert set(cache.vectors) == set(keys)
+
+    second, _ = infer.infer_vectors(model_path, documents)
+    assert np.array_equal(second[:30], first)
+
+    # Another seed starts another cache.
+    assert not infer.Cache(model_path, PARAMS['epochs'], 2).vectors
+
+
+def test_gensim_is_not_modified():
+    assert keyedvectors.pseudorandom_weak_vector.__module__ == 'gensim.models.keyedvectors'
+    assert gensim.models.doc2vec.Doc2Vec.infer_vector.__module__ == 'gensim.models.doc2vec'
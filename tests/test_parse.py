@@ -0,0 +1,27 @@
+'''
+Parallel parsing of the PDFs (parse_pdfs in src/data/obtain_texts.py): the pool, with long PDFs split into chunks of
+pages, gives the same texts, in the same order, as parsing them one after the other.
+'''
+
+from src.data.obtain_texts import parse_pdfs
+from tests.pdfs import session_pdf
+
+
+def test_pool_gives_the_same_texts_as_serial(tmp_path):
+    jobs = []
+    sessions = [(7, 7, '2001-03-01'), (3, 14, '2021-03-01'), (5, 10, '2012-03-01')]
+    for i, (pages, legislature, date) in enumerate(sessions):
+        path = tmp_path / f'{i}.pdf'
+        session_pdf(path, pages, two_columns=legislature < 10 or date < '2012-08-01', seed=i)
+        jobs.append((f'key{i}', legislature, date, str(path)))
+    # A row without PDF and one with an unsupported legislature.
+    jobs += [('missing', 7, '2001-03-01', None), ('old', 5, '1995-03-01', str(tmp_path / '0.pdf'))]
+
+    serial = list(parse_pdfs(jobs, workers=1))
+    parallel = list(parse_pdfs(jobs, workers=2, pages_per_task=2))
+
+    assert [key for key, _ in parallel] == [key for key, _, _, _ in jobs]
+    assert parallel == serial
+    assert all(text for key, text in serial[:3])
+    assert dict(serial)['missing'] is None
+    assert dict(serial)['old'] == ''
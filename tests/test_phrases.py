@@ -0,0 +1,73 @@
+'''
+Phrase stage (src/features/phrases.py): the models trained by streaming the dataset from disk join the same phrases
+as the in-memory code of preprocess_texts.py they replace, every saved version loads back the same models, and
+applying them in several processes gives the same documents.
+'''
+
+import random
+
+import gensim
+import pandas as pd
+
+from src.data.dataset import write_dataset
+from src.features.phrases import PhraseModels, Sentences, apply_parallel, latest_version
+
+WORDS = [f'palabra{i}' for i in range(500)]
+PHRASES = [['partido', 'popular'], ['comunidad', 'autónoma'], ['tribunal', 'constitucional', 'español']]
+
+
+def documents(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    result = []
+    for _ in range(n):
+        tokens = []
+        for _ in range(rng.randrange(0, 12)):
+            tokens += rng.choice(PHRASES) if rng.random() < 0.05 else [rng.choice(WORDS)]
+        result.append(tokens)
+    return result
+
+
+def test_streamed_models_match_the_in_memory_code(tmp_path):
+    docs = documents(400)
+    write_dataset(pd.DataFrame({'clean_text': docs}), str(tmp_path / 'clean.parquet'))
+
+    models = PhraseModels.train(Sentences(str(tmp_path / 'clean.parquet')))
+
+    # The code of preprocess_texts.py before the stage.
+    bigram = gensim.models.Phrases(pd.Series(docs), min_count=3, threshold=30)
+    trigram = gensim.models.Phrases(bigram[pd.Series(docs)], min_count=3, threshold=30)
+    bigram_mod = gensim.models.phrases.Phraser(bigram)
+    trigram_mod = gensim.models.phrases.Phraser(trigram)
+    expected = [trigram_mod[bigram_mod[tokens]] for tokens in docs]
+
+    assert models.apply(docs) == expected
+    assert models.meta['documents'] == len(docs)
+    assert any('partido_popular' in tokens for tokens in expected)
+
+
+def test_versions_round_trip(tmp_path):
+    docs = documents(400)
+    models = PhraseModels.train(docs[:200])
+    assert models.save(str(tmp_path)) == 1
+
+    models.update(docs[200:])
+    assert models.save(str(tmp_path), 'update') == 2
+    assert latest_version(str(tmp_path)) == 2
+
+    loaded = PhraseModels.load(str(tmp_path))
+    frozen = PhraseModels.load(str(tmp_path), frozen=True)
+    assert loaded.apply(docs) == frozen.apply(docs) == models.apply(docs)
+    assert loaded.meta['parent'] == 1 and loaded.meta['documents'] == 400
+
+    # The bigram counts of an update are those of training on all the documents at once.
+    assert PhraseModels.train(docs).bigram.vocab == models.bigram.vocab
+
+
+def test_apply_parallel_matches_serial(tmp_path):
+    docs = documents(300)
+    PhraseModels.train(docs).save(str(tmp_path))
+
+    serial = list(apply_parallel(docs, str(tmp_path), workers=1, chunksize=40))
+    parallel = list(apply_parallel(docs, str(tmp_path), workers=2, chunksize=40))
+
+    assert parallel == serial == PhraseModels.load(str(tmp_path), frozen=True).apply(docs)
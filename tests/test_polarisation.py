@@ -0,0 +1,53 @@
+'''
+Polarisation index of src/analysis/polarisation.py: with the placements of the discussion chapter, it is the index of
+notebooks/discussion.ipynb (pol_index), and the distances are those between the placements.
+'''
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.polarisation import Placements, SEATS, polarisation, polarisation_index, totals_of
+
+# Left-right dimension of the placements in the notebook (r), by legislature from L7 to L14.
+PLACEMENTS = {
+    'CS': [np.nan, np.nan, np.nan, np.nan, -3.877763, -6.223811, -4.616407, -9.609244],
+    'PP': [-26.665987, -22.751711, -10.210354, -29.744613, -16.280230, -22.907489, -10.895554, -18.071832],
+    'PSOE': [0.917303, -7.635203, 2.555066, 3.256919, 3.419901, 5.586959, 0.081163, 4.425413],
+    'UP': [23.681686, 29.693520, np.nan, 30.739548, 15.701415, 27.272369, 21.534404, 32.943688],
+    'VOX': [np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, -9.339427, -15.635264],
+}
+POL_INDEX = [0.44641717, 0.28156401, 0.19543659, 0.53768595, 0.3733362, 0.59297458, 0.29703222, 0.48377921]
+
+
+def test_the_index_of_the_notebook(tmp_path):
+    rows = [{'label': f'{party} L{7 + i}', 'dim1': value, 'dim2': 0.0}
+            for party, values in PLACEMENTS.items() for i, value in enumerate(values) if not np.isnan(value)]
+    path = str(tmp_path / 'reduced.csv')
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+    index, distances = polarisation(Placements(path))
+    assert index['period'].tolist() == [f'L{i}' for i in range(7, 15)]
+    # The notebook normalised the positions with the extremes rounded to 3 decimals.
+    assert np.allclose(index['index'], POL_INDEX, atol=1e-4)
+
+    parties = sorted(PLACEMENTS)
+    periods = [f'L{i}' for i in range(7, 15)]
+    positions = 1 - (np.array([PLACEMENTS[party] for party in parties]).T + 29.745) / (32.944 + 29.745)
+    shares = np.array([[SEATS[period].get(party, np.nan) for party in parties] for period in periods])
+    assert np.allclose(polarisation_index(positions, shares, totals_of(SEATS, periods)), POL_INDEX, atol=1e-7)
+
+    pair = distances.set_index(['period', 'party1', 'party2']).loc[('L7', 'PP', 'PSOE'), 'distance']
+    assert np.isclose(pair, 0.917303 + 26.665987)
+
+
+def test_missing_placements_count_as_zero():
+    # Parties with seats but no placement still count in the total share of the period, as in the notebook.
+    positions = np.array([[0.2, 0.8, np.nan]])
+    shares = np.array([[0.4, 0.4, 0.2]])
+    totals = totals_of({'L1': {'A': 0.4, 'B': 0.4, 'C': 0.2}}, ['L1'])
+
+    psa = (0.4 * 0.2 + 0.4 * 0.8) / 1.0
+    expected = 10 * np.sqrt(0.4 * ((0.2 - psa) / 5) ** 2 + 0.4 * ((0.8 - psa) / 5) ** 2)
+    assert np.allclose(polarisation_index(positions, shares, totals), [expected])
+    assert np.isnan(polarisation_index(np.full((1, 3), np.nan), shares, totals)[0])
+    assert totals_of(SEATS, ['L7'])[0] == sum(SEATS['L7'].values())
@@ -0,0 +1,44 @@
+'''
+Reductions of src/reduce/reduce-dimension.py: the fitted vectors projected into the space of their reduction get back
+their fitted coordinates, and the incremental PCA read in chunks finds the plane of the exact one.
+'''
+
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from src.models.vectors import open_vectors, write_store
+
+reduce_dimension = importlib.import_module('src.reduce.reduce-dimension')
+
+
+def vectors(n: int = 300, dimensions: int = 60, seed: int = 0) -> np.ndarray:
+    # Two main directions, so the plane of the PCA is well defined.
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, 2)) * [5, 3] @ rng.normal(size=(2, dimensions))
+            + rng.normal(scale=0.1, size=(n, dimensions))).astype(np.float32)
+
+
+def test_projection_of_the_fitted_vectors():
+    z = vectors()
+    for method in ('pca', 'rpca', 'ipca'):
+        Z, space = reduce_dimension.fit_space(z, method)
+        assert np.allclose(reduce_dimension.project(space, z), Z, atol=1e-3)
+
+    # T-SNE places a point at its closest fitted points, which is itself.
+    Z, space = reduce_dimension.fit_space(z, 'tsne-pca', threads=2)
+    assert np.allclose(reduce_dimension.project(space, z, neighbours=1), Z, atol=1e-3)
+
+
+def test_incremental_pca_in_chunks(tmp_path, monkeypatch):
+    z = vectors(n=1001)
+    write_store(str(tmp_path / 'store'), z, pd.DataFrame({'label': [f'PP L{i}' for i in range(len(z))]}), sort=False)
+    _, mapped = open_vectors(str(tmp_path / 'store'))
+
+    exact, _ = reduce_dimension.fit_space(z, 'pca')
+    monkeypatch.setattr(reduce_dimension, 'BATCH_SIZE', 100)
+    incremental, _ = reduce_dimension.fit_space(mapped, 'ipca')
+
+    # The same coordinates, up to the sign of every component.
+    assert np.allclose(np.abs(incremental), np.abs(exact), atol=1e-2 * np.abs(exact).max())
@@ -0,0 +1,60 @@
+'''
+Segmentation engine (src/data/segment.py): Session.to_dict() gives the same dictionary as text2dict, the reference
+implementation in obtain_texts.py, and the speaker index finds the interventions as the substring search did.
+'''
+
+import random
+
+import pytest
+
+from src.data.obtain_texts import text2dict
+from src.data.segment import SpeakerIndex, segment
+
+SPEAKERS = ['El señor PRESIDENTE:', 'La señora VICEPRESIDENTA (Calvo Poyato):', 'El señor RAJOY BREY:',
+            'La señora GARCÍA\nLÓPEZ (Grupo Parlamentario Socialista):', 'El señor NÚÑEZ-ENCABO:']
+WORDS = ['señorías', 'gobierno', 'ley', 'presupuestos', 'España', 'política', 'muchas gracias.', '—', 'a-\nños', '  ']
+
+
+def title(number: int) -> str:
+    return f'— PREGUNTA DEL DIPUTADO DON JUAN PÉREZ GARCÍA, DEL GRUPO PARLAMENTARIO POPULAR EN EL CONGRESO, QUE ' \
+           f'FORMULA AL GOBIERNO: ¿CUÁNDO? (Número de expediente 180/{number:06d}).\n'
+
+
+def session(seed: int) -> str:
+    '''A session with a summary and topics, some of them discussed twice, with several interventions each.'''
+    rng = random.Random(seed)
+    text = 'SUMARIO\nSe abre la sesión a las cuatro de la tarde.\n'
+    topics = [rng.randrange(1, 6) for _ in range(rng.randrange(1, 8))]
+
+    for topic in topics:
+        text += title(topic)
+        for _ in range(rng.randrange(0, 5)):
+            words = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(1, 30)))
+            text += f'{rng.choice(SPEAKERS)} {words}\n'
+
+    return text
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_segment_matches_text2dict(seed):
+    text = session(seed)
+    assert segment(text).to_dict() == text2dict(text)
+
+
+def test_speaker_index_lookup():
+    found = 0
+    for seed in range(10):
+        processed = segment(session(seed)).to_dict()
+        index = SpeakerIndex(processed)
+
+        for topic, speakers in processed.items():
+            for speaker, text in speakers.items():
+                if 'RAJOY' in speaker:
+                    assert index.lookup(topic, 'Rajoy Brey') == text
+                    found += 1
+                if 'NÚÑEZ' in speaker:
+                    assert index.lookup(topic, 'Núñez-Encabo') == text
+                    found += 1
+            assert index.lookup(topic, 'Nadie') == ''
+
+    assert found > 0
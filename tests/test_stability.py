@@ -0,0 +1,60 @@
+'''
+Stability of src/analysis/stability.py: the batched Procrustes alignment is that of scipy, runs that only differ by a
+rotation and a scale are perfectly stable, and runs without enough common labels are not aligned.
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial import procrustes as scipy_procrustes
+from scipy.stats import special_ortho_group
+
+from src.analysis.stability import MIN_LABELS, load_runs, procrustes, stability
+from src.models.vectors import write_store
+
+LABELS = [f'{party} L{legislature}' for party in ['PP', 'PSOE', 'UP', 'VOX'] for legislature in (13, 14)]
+
+
+def test_procrustes_is_that_of_scipy():
+    rng = np.random.default_rng(0)
+    placements = rng.normal(size=(4, 30, 3))
+    aligned, disparity = procrustes(placements, placements[0])
+
+    reference = placements[0]
+    centre, scale = reference.mean(axis=0), np.linalg.norm(reference - reference.mean(axis=0))
+    for run, (x, d) in enumerate(zip(aligned, disparity)):
+        _, expected, expected_disparity = scipy_procrustes(reference, placements[run])
+        assert np.allclose((x - centre) / scale, expected)
+        assert np.isclose(d, expected_disparity)
+    assert np.isclose(disparity[0], 0)
+
+
+def test_rotated_runs_are_stable(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(len(LABELS), 5))
+    paths = []
+    for run in range(3):
+        rotation = special_ortho_group.rvs(5, random_state=run) if run else np.eye(5)
+        paths.append(str(tmp_path / f'run{run}'))
+        # Every run in its own order, with one label of its own.
+        order = rng.permutation(len(LABELS))
+        tags = pd.DataFrame({'label': [LABELS[i] for i in order] + [f'PNV L{run}']})
+        write_store(paths[-1], np.vstack([vectors[order] @ rotation * (run + 1), rng.normal(size=(1, 5))]), tags)
+
+    labels, placements = load_runs(paths, method='none', workers=2)
+    assert sorted(labels) == sorted(LABELS)
+
+    label_table, run_table, _ = stability(labels, placements)
+    assert np.allclose(run_table['disparity'], 0, atol=1e-10)
+    assert (label_table['rank_stability'] == 1).all() and np.allclose(run_table['spearman'], 1)
+
+
+def test_runs_without_common_labels(tmp_path):
+    paths = []
+    for run, labels in enumerate([LABELS[:MIN_LABELS - 1] + ['ZZ L1', 'ZZ L2'], LABELS]):
+        paths.append(str(tmp_path / f'run{run}'))
+        vectors = np.random.default_rng(run).normal(size=(len(labels), 4))
+        write_store(paths[-1], vectors, pd.DataFrame({'label': labels}))
+
+    with pytest.raises(ValueError, match='fewer than'):
+        load_runs(paths, method='none')
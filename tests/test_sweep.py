@@ -0,0 +1,44 @@
+'''
+Sweep of src/models/sweep.py: a job that fails is recorded in failed.csv without stopping the others, and a sweep run
+again only trains the jobs not in the results yet.
+'''
+
+import pandas as pd
+
+from src.models.sweep import FAILED, RESULTS, jobs_of, run_sweep
+from tests.corpora import PARAMS, make_corpus
+
+SWEEP = {
+    'search': 'grid',
+    # No token appears 10**6 times, so the vocabulary of those jobs is empty and their training fails.
+    'params': {**{name: [value] for name, value in PARAMS.items()}, 'min_count': [1, 10 ** 6]},
+    'seeds': [1, 2],
+    'test_size': 0.2,
+}
+
+
+def test_jobs_of():
+    jobs = jobs_of(SWEEP)
+    assert len(jobs) == 4
+    assert jobs == jobs_of(SWEEP)
+    assert len({job_id for job_id, _, _ in jobs}) == 4
+
+    random = jobs_of({'search': 'random', 'params': {'window': {'low': 2, 'high': 20}}, 'trials': 5, 'seeds': [1]})
+    assert len(random) <= 5 and all(isinstance(params['window'], int) for _, params, _ in random)
+
+
+def test_failed_jobs_do_not_stop_the_sweep(tmp_path):
+    corpus = make_corpus(tmp_path / 'corpus')
+    output_dir = tmp_path / 'sweep'
+
+    results = run_sweep(corpus, SWEEP, str(output_dir), processes=2)
+    failed = pd.read_csv(output_dir / FAILED)
+    assert sorted(results['seed']) == [1, 2] and (results['min_count'] == 1).all()
+    assert results['accuracy@1'].between(0, 1).all()
+    assert len(failed) == 2 and failed['params'].str.contains('1000000').all()
+
+    # Run again: the finished jobs are skipped and only the failed ones are tried again.
+    results = run_sweep(corpus, SWEEP, str(output_dir), processes=2)
+    assert len(results) == 2
+    assert len(pd.read_csv(output_dir / RESULTS)) == 2
+    assert len(pd.read_csv(output_dir / FAILED)) == 4
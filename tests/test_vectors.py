@@ -0,0 +1,52 @@
+'''
+Vector stores of src/models/vectors.py: an exported model loads back the same labels and vectors as the model, in its
+order, and the tags with a prefix are a slice of the sorted store.
+'''
+
+import gensim
+import numpy as np
+import pandas as pd
+
+from src.data.corpus import Corpus
+from src.models.doc2vec import train
+from src.models.vectors import VectorStore, export, is_store, load_vectors, open_vectors, write_store
+from tests.corpora import PARAMS, make_corpus
+
+
+def test_export_round_trip(tmp_path):
+    model_path = str(tmp_path / 'model.mdl')
+    train(Corpus(make_corpus(tmp_path / 'corpus')).tagged(), PARAMS).save(model_path)
+    model = gensim.models.doc2vec.Doc2Vec.load(model_path)
+
+    export(model_path, str(tmp_path / 'store'), words=True)
+    assert is_store(str(tmp_path / 'store')) and not is_store(model_path)
+
+    for path in (model_path, str(tmp_path / 'store')):
+        labels, vectors = load_vectors(path)
+        assert labels == model.dv.index_to_key
+        assert np.array_equal(vectors, model.dv.vectors)
+
+    store = VectorStore(str(tmp_path / 'store'))
+    assert store.labels == sorted(model.dv.index_to_key)
+    assert all(np.array_equal(store[label], model.dv[label]) for label in store.labels)
+    assert store.words == model.wv.index_to_key and np.array_equal(store.word_vectors, model.wv.vectors)
+
+    labels, vectors = open_vectors(str(tmp_path / 'store'))
+    assert isinstance(vectors, np.memmap) and labels == store.labels
+
+
+def test_prefix(tmp_path):
+    labels = ['PSOE L12', 'PP L13', 'VOX L14', 'PP L12', 'PNV L12', 'PP L14']
+    vectors = np.arange(len(labels) * 3, dtype=np.float32).reshape(-1, 3)
+
+    for sort in (True, False):
+        path = str(tmp_path / str(sort))
+        write_store(path, vectors, pd.DataFrame({'label': labels}), dtype='float16', sort=sort)
+        store = VectorStore(path)
+        assert isinstance(store.rows('PP '), slice) == sort
+
+        found, rows = store.prefix('PP ')
+        assert sorted(found) == ['PP L12', 'PP L13', 'PP L14']
+        assert np.array_equal(rows, np.vstack([vectors[labels.index(label)] for label in found]))
+        assert store.tags.set_index('label').loc['PP L13', 'party'] == 'PP'
+        assert load_vectors(path)[0] == labels